@@ -0,0 +1,181 @@
+"""Bounded, content-addressed store for generated export files.
+
+Files are named after a hash of the structure they were generated from, so
+exporting the same structure again is served straight from disk. The store
+evicts files that have not been used within the TTL and, after that, the
+least recently used files until it is back under its size limit.
+
+Several processes may share one directory. A file another process added is
+picked up on first use. A file's mtime is its last access time, so before a
+process evicts a file it re-checks whether another process used it since.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the generated workbook layout changes
+EXPORT_VERSION = "1"
+
+# Temporaries older than this were left by a process that died mid-export;
+# younger ones may belong to another process sharing the directory
+STALE_TEMP_AGE = 3600.0
+
+# Seconds an mtime must be ahead of the recorded access time to count as a
+# use by another process; covers coarse filesystem timestamps
+MTIME_SLACK = 2.0
+
+
+def export_key(structure: Dict[str, Any]) -> str:
+    """Return the content hash identifying a structure's export."""
+    content = {k: v for k, v in structure.items() if k != "_filename"}
+    payload = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return f"{digest}-v{EXPORT_VERSION}"
+
+
+class ArtifactStore:
+    """Directory of generated files with size and TTL eviction."""
+
+    def __init__(self, root: str, max_bytes: int, ttl: float, suffix: str = ".xlsx"):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        # key -> (size in bytes, last access time)
+        self._entries: Dict[str, Tuple[int, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        """Index files left by a previous run and drop stale temporaries."""
+        now = time.time()
+        for entry in os.scandir(self.root):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".tmp"):
+                if now - entry.stat().st_mtime > STALE_TEMP_AGE:
+                    self._remove(entry.path)
+            elif entry.name.endswith(self.suffix):
+                stat = entry.stat()
+                key = entry.name[: -len(self.suffix)]
+                self._entries[key] = (stat.st_size, stat.st_mtime)
+        with self._lock:
+            self._evict()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, key + self.suffix)
+
+    def temp_path(self, key: str) -> str:
+        """Return a unique path to generate an artifact into before add()."""
+        return os.path.join(self.root, f"{key}.{uuid.uuid4().hex}.tmp")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the path of a stored artifact, or None on a miss."""
+        with self._lock:
+            self._evict()
+            path = self.path_for(key)
+            try:
+                # Also finds files added by another process
+                size = os.stat(path).st_size
+            except FileNotFoundError:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            now = time.time()
+            self._entries[key] = (size, now)
+            os.utime(path, (now, now))
+            self.hits += 1
+            return path
+
+    def add(self, key: str, temp_path: str) -> str:
+        """Move a generated file into the store and return its final path."""
+        path = self.path_for(key)
+        with self._lock:
+            os.replace(temp_path, path)
+            self._entries[key] = (os.path.getsize(path), time.time())
+            self._evict(keep=key)
+        return path
+
+    def discard(self, temp_path: str) -> None:
+        """Remove a temporary file whose generation failed."""
+        self._remove(temp_path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(size for size, _ in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Drop expired entries, then the oldest until under max_bytes."""
+        now = time.time()
+        for key in list(self._entries):
+            if key != keep and now - self._entries[key][1] > self.ttl:
+                accessed = self._refresh(key)
+                if accessed is not None and now - accessed > self.ttl:
+                    self._drop(key)
+
+        total = sum(size for size, _ in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        for key in sorted(self._entries, key=lambda k: self._entries[k][1]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            size, before = self._entries[key]
+            accessed = self._refresh(key)
+            if accessed is None:
+                total -= size
+            elif accessed == before:
+                total -= size
+                self._drop(key)
+
+    def _refresh(self, key: str) -> Optional[float]:
+        """Take a newer access time from the file's mtime, set by another process.
+
+        Returns the access time, or None (forgetting the key) if the file is gone.
+        """
+        size, accessed = self._entries[key]
+        try:
+            mtime = os.stat(self.path_for(key)).st_mtime
+        except FileNotFoundError:
+            del self._entries[key]
+            return None
+        # Ignore differences within filesystem timestamp granularity
+        if mtime - accessed > MTIME_SLACK:
+            self._entries[key] = (size, mtime)
+            return mtime
+        return accessed
+
+    def _drop(self, key: str) -> None:
+        del self._entries[key]
+        self._remove(self.path_for(key))
+        self.evictions += 1
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove {path}: {e}")
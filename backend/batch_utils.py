@@ -0,0 +1,44 @@
+"""Helpers for unpacking batch uploads."""
+
+import tarfile
+import zipfile
+from typing import BinaryIO, List, Tuple
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+class BatchTooLarge(Exception):
+    """Raised when a batch exceeds its file-count or byte budget."""
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def read_archive(
+    fileobj: BinaryIO, filename: str, max_files: int, max_bytes: int
+) -> List[Tuple[str, bytes]]:
+    """Return (member name, content) for every .p4 file in a zip or tar archive."""
+    sources = []
+    total = 0
+
+    def add(name: str, size: int, read) -> None:
+        nonlocal total
+        if len(sources) >= max_files:
+            raise BatchTooLarge(f"{filename} holds more than {max_files} .p4 files")
+        total += size
+        if total > max_bytes:
+            raise BatchTooLarge(f"{filename} expands to more than {max_bytes} bytes")
+        sources.append((name, read()))
+
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.endswith(".p4"):
+                    add(info.filename, info.file_size, lambda: archive.read(info))
+    else:
+        with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.endswith(".p4"):
+                    add(member.name, member.size, lambda: archive.extractfile(member).read())
+    return sources
@@ -0,0 +1,115 @@
+"""Throughput of the apply-block parser on generated apply bodies.
+
+Run from the backend directory:
+
+    python benchmarks/bench_apply.py
+
+Four shapes are generated at increasing sizes: many sequential if blocks,
+long else-if chains, and deeply nested ifs with and without braces, up to
+MAX_APPLY_DEPTH. Each program is lexed once outside the timing. Throughput
+should stay roughly constant as each shape grows.
+
+    python benchmarks/bench_apply.py --check
+
+checks that nesting far past MAX_APPLY_DEPTH, braced or braceless, still
+parses and serialises, with the excess kept as one opaque statement.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model import dumps  # noqa: E402
+from parser_utils import (  # noqa: E402
+    MAX_APPLY_DEPTH,
+    BlockIndex,
+    extract_apply_block_logic,
+    parse_p4_source,
+)
+
+
+def sequential(n: int) -> str:
+    return "".join(
+        f"if (hdr.h{i}.isValid()) {{ t{i}.apply(); }} else {{ d{i}.apply(); }}\n"
+        for i in range(n)
+    )
+
+
+def else_if_chain(n: int) -> str:
+    first = "if (meta.v == 0) { t0.apply(); }\n"
+    rest = "".join(f"else if (meta.v == {i}) {{ t{i}.apply(); }}\n" for i in range(1, n))
+    return first + rest + "else { miss.apply(); }\n"
+
+
+def nested(n: int) -> str:
+    opening = "".join(f"if (meta.f{i} == 1) {{ t{i}.apply();\n" for i in range(n))
+    return opening + "}\n" * n
+
+
+def braceless(n: int) -> str:
+    opening = "".join(f"if (meta.f{i} == 1)\n" for i in range(n))
+    return opening + "t.apply();\n" + "else d.apply();\n" * (n // 2)
+
+
+def wrap(apply_body: str) -> str:
+    return f"control C(inout headers hdr) {{\n    apply {{\n{apply_body}    }}\n}}\n"
+
+
+def nesting(nodes: list) -> int:
+    """Deepest chain of if nodes in an apply tree."""
+    deepest = 0
+    for node in nodes:
+        if node["type"] == "if":
+            deepest = max(deepest, 1 + nesting(node["then"]), 1 + nesting(node["else"]))
+        elif node["type"] == "block":
+            deepest = max(deepest, nesting(node["body"]))
+    return deepest
+
+
+def check() -> None:
+    n = MAX_APPLY_DEPTH * 8
+    for label, make in (("nested", nested), ("braceless", braceless)):
+        code = wrap(make(n))
+        logic = extract_apply_block_logic(BlockIndex(code), "C")
+        depth = nesting(logic.flow)
+        assert depth <= MAX_APPLY_DEPTH + 1, f"{label}: if nesting {depth} past the limit"
+        dumps(logic)
+        dumps(parse_p4_source(code, "bench.p4"))
+        print(f"{label:>10}: n={n} if nesting={depth} ok")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--check", action="store_true", help="check the nesting limit instead of timing")
+    args = parser.parse_args()
+    if args.check:
+        check()
+        return
+
+    print(f"{'shape':>10} {'n':>6} {'KB':>8} {'ms':>9} {'MB/s':>7}")
+    for label, make, sizes in (
+        ("sequential", sequential, (500, 1000, 2000, 4000)),
+        ("else-if", else_if_chain, (500, 1000, 2000, 4000)),
+        ("nested", nested, tuple(MAX_APPLY_DEPTH * k // 4 for k in (1, 2, 3, 4))),
+        ("braceless", braceless, tuple(MAX_APPLY_DEPTH * k // 4 for k in (1, 2, 3, 4))),
+    ):
+        for n in sizes:
+            code = wrap(make(n))
+            index = BlockIndex(code)
+            best = float("inf")
+            for _ in range(3):
+                start = time.perf_counter()
+                extract_apply_block_logic(index, "C")
+                best = min(best, time.perf_counter() - start)
+            size = len(code.encode("utf-8"))
+            print(
+                f"{label:>10} {n:>6} {size / 1024:>8.1f} {best * 1000:>9.2f} "
+                f"{size / best / 2**20:>7.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
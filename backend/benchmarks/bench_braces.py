@@ -0,0 +1,85 @@
+"""Brace matching on large block bodies: the old per-character loop against
+the regex scanner.
+
+Run from the backend directory:
+
+    python benchmarks/bench_braces.py
+
+Each program is one control whose body holds a p4gen program with the
+given number of controls, so the brace matcher walks the whole file to find
+the closing brace. brace_span returns offsets only; extract_brace_block also
+copies the body out. The last column adds braces in comments and string
+literals to the body and checks that each matcher still finds the right
+closing brace.
+"""
+
+import os
+import sys
+import time
+from typing import Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_parse import make_program  # noqa: E402
+from parser_utils import BlockIndex, brace_span, extract_brace_block  # noqa: E402
+
+# Braces inside comments and strings, which only the scanner ignores
+NOISE = '    // closes early }\n    /* { */\n    @name("{ingress}") action noise() { log_msg("{}", {0}); }\n'
+
+
+def per_character(code: str, start_index: int) -> Tuple[Optional[str], Optional[int]]:
+    """extract_brace_block before the scanner: one character at a time."""
+    brace_count = 0
+    body = []
+    for i in range(start_index, len(code)):
+        c = code[i]
+        if c == '{':
+            brace_count += 1
+            if brace_count == 1:
+                continue
+        elif c == '}':
+            brace_count -= 1
+            if brace_count == 0:
+                return "".join(body), i
+        if brace_count >= 1:
+            body.append(c)
+    return None, None
+
+
+def best_of(fn, runs: int = 5) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    print(
+        f"{'controls':>8} {'KB':>8} {'per-char ms':>12} {'extract ms':>11} "
+        f"{'span ms':>9} {'speedup':>8} {'index ms':>9}  {'with comments/strings':<22}"
+    )
+    for controls in (10, 100, 1000, 4000):
+        body = make_program(controls)
+        code = "control Outer() {\n" + body + "}\n"
+        assert per_character(code, 0) == extract_brace_block(code, 0)
+
+        old = best_of(lambda: per_character(code, 0))
+        extract = best_of(lambda: extract_brace_block(code, 0))
+        span = best_of(lambda: brace_span(code))
+        index = best_of(lambda: BlockIndex(code))
+
+        noisy = "control Outer() {\n" + NOISE + body + "}\n"
+        end = noisy.rindex("}")
+        found = "per-char wrong, span ok" if per_character(noisy, 0)[1] != end else "per-char ok"
+        if brace_span(noisy)[1] != end:
+            found = "span wrong"
+        print(
+            f"{controls:>8} {len(code) / 1024:>8.1f} {old * 1000:>12.2f} {extract * 1000:>11.2f} "
+            f"{span * 1000:>9.2f} {old / span:>7.1f}x {index * 1000:>9.2f}  {found:<22}"
+        )
+
+
+if __name__ == "__main__":
+    main()
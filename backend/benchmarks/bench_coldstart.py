@@ -0,0 +1,73 @@
+"""Cold start and first-request latency, with and without warm-up.
+
+Run from the backend directory:
+
+    python benchmarks/bench_coldstart.py
+
+Each configuration runs in a fresh interpreter: import the app, run its
+startup (lifespan), then time the first and second /upload requests. The
+two uploads differ so neither is a parse cache hit. Without warm-up the
+first request also pays for spawning a worker and importing the parser.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import main
+from fastapi.testclient import TestClient
+imported = time.perf_counter()
+source = open(sys.argv[1]).read()
+with TestClient(main.app) as client:
+    started = time.perf_counter()
+    latencies = []
+    for i in range(2):
+        t = time.perf_counter()
+        r = client.post("/upload", files={"file": ("a.p4", (source + "//%d" % i).encode())})
+        assert r.status_code == 200, r.text
+        latencies.append(time.perf_counter() - t)
+print(json.dumps({
+    "import": imported - start,
+    "startup": started - imported,
+    "first": latencies[0],
+    "second": latencies[1],
+}))
+"""
+
+
+def run(warmup: bool, sample: str) -> dict:
+    with tempfile.TemporaryDirectory() as upload_dir:
+        env = {
+            **os.environ,
+            "P4LENS_WARMUP": "1" if warmup else "0",
+            "P4LENS_UPLOAD_DIR": upload_dir,
+            "P4LENS_PARSE_CACHE_DB": "",
+            "P4LENS_WORKER_PROCESSES": "2",
+        }
+        out = subprocess.run(
+            [sys.executable, "-c", _CHILD, sample],
+            cwd=BACKEND, env=env, capture_output=True, text=True, check=True,
+        )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    sample = os.path.join(BACKEND, "uploads", "Basic P4 Solution.p4")
+    print(f"{'warm-up':>8} {'import ms':>10} {'startup ms':>11} {'1st req ms':>11} {'2nd req ms':>11}")
+    for warmup in (False, True):
+        r = run(warmup, sample)
+        print(
+            f"{'on' if warmup else 'off':>8} {r['import'] * 1000:>10.1f} {r['startup'] * 1000:>11.1f}"
+            f" {r['first'] * 1000:>11.1f} {r['second'] * 1000:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Compare the write-only Excel export with the previous in-memory writer.
+
+Run from the backend directory:
+
+    python benchmarks/bench_export.py [rows]
+
+The in-memory reference below reproduces how create_excel_export used to
+work: a full Workbook, then a second pass over every appended row restyling
+each cell with freshly built Alignment objects.
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import Workbook  # noqa: E402
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side  # noqa: E402
+
+from export_utils import EXPORT_SHEETS, write_excel_export  # noqa: E402
+
+
+def make_structure(rows: int) -> dict:
+    controls = max(1, rows // 100)
+    structure = {}
+    tables = {}
+    for c in range(controls):
+        actions = []
+        for a in range(rows // controls):
+            name = f"act_{c}_{a}"
+            actions.append({
+                "name": name,
+                "parameters": [{"type": "bit<9>", "name": "port"}],
+                "operations": ["set_egress_port"],
+                "body_preview": "standard_metadata.egress_spec = port;",
+            })
+            tables[f"tbl_{c}_{a}"] = {
+                "keys": ["hdr.ipv4.dstAddr: lpm", "hdr.ipv4.srcAddr: exact"],
+                "actions": [name, "drop"],
+                "size": 1024,
+                "default_action": "drop",
+            }
+        structure[f"Ctl{c}"] = {
+            "type": "control",
+            "actions": actions,
+            "tables": [],
+            "apply_logic": {"logic": [], "conditions": [], "tables_applied": []},
+        }
+    structure["_tables"] = tables
+    return structure
+
+
+def in_memory_export(structure: dict, path: str) -> None:
+    wb = Workbook()
+    wb.remove(wb.active)
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF", size=12)
+    border = Border(left=Side(style='thin'), right=Side(style='thin'),
+                    top=Side(style='thin'), bottom=Side(style='thin'))
+    for title, heading, headers, _, rows in EXPORT_SHEETS:
+        ws = wb.create_sheet(title)
+        ws.append([heading])
+        ws.append([])
+        ws.append(headers)
+        for col in range(1, len(headers) + 1):
+            cell = ws.cell(row=3, column=col)
+            cell.fill = header_fill
+            cell.font = header_font
+            cell.alignment = Alignment(horizontal='center', vertical='center')
+            cell.border = border
+        for row in rows(structure):
+            ws.append(row)
+            for col in range(1, len(row) + 1):
+                cell = ws.cell(row=ws.max_row, column=col)
+                cell.border = border
+                cell.alignment = Alignment(wrap_text=True, vertical='top')
+    wb.save(path)
+
+
+def measure(fn, structure: dict) -> tuple:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.xlsx")
+        start = time.perf_counter()
+        fn(structure, path)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        fn(structure, path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    structure = make_structure(rows)
+    print(f"{rows} tables + {rows} actions")
+    print(f"{'writer':>12} {'seconds':>9} {'peak MB':>9}")
+    for label, fn in (("in-memory", in_memory_export), ("write-only", write_excel_export)):
+        elapsed, peak = measure(fn, structure)
+        print(f"{label:>12} {elapsed:>9.2f} {peak / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Measure how parse_p4_structure scales with program size.
+
+Run from the backend directory:
+
+    python benchmarks/bench_parse.py
+
+Each row doubles the number of controls in a p4gen program; with the
+single-pass block index the time per KB should stay roughly flat.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from p4gen import GenSpec, generate  # noqa: E402
+from parser_utils import parse_p4_source  # noqa: E402
+
+
+def make_program(controls: int) -> str:
+    """A p4gen program with the given number of small controls."""
+    return generate(GenSpec(controls=controls, tables=2, actions=2, depth=1))
+
+
+def time_parse(code: str, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse_p4_source(code, "bench.p4")
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    print(f"{'controls':>8} {'size KB':>9} {'parse ms':>10} {'us/KB':>8}")
+    controls = 25
+    while controls <= 1600:
+        code = make_program(controls)
+        size_kb = len(code.encode("utf-8")) / 1024
+        elapsed = time_parse(code)
+        print(
+            f"{controls:>8} {size_kb:>9.1f} {elapsed * 1000:>10.2f} "
+            f"{elapsed * 1e6 / size_kb:>8.1f}"
+        )
+        controls *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Parser graph construction time as parsers grow, and path-count checks.
+
+Run from the backend directory:
+
+    python benchmarks/bench_parser_graph.py
+
+Times build_parser_graph on the parser of p4gen programs with increasing
+numbers of states. Each state selects between the next two, so the number
+of start -> accept paths grows exponentially; build time should grow
+linearly.
+
+    python benchmarks/bench_parser_graph.py --check
+
+checks path counting on small graphs with known answers instead: a
+self-loop, a two-state cycle (entered from one state and from two), and a
+diamond. Each asserts accept_paths and max_extracts, that they do not
+depend on the order states are declared in, and that enumerate_paths stops
+on its path limit and step budget, reporting truncation only when it cut
+something off.
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from p4gen import GenSpec, generate  # noqa: E402
+from parser_graph import build_parser_graph, enumerate_paths  # noqa: E402
+from parser_utils import BlockIndex  # noqa: E402
+
+
+def state(extracts: List[str], cases: List[Tuple[str, str]]) -> str:
+    """Body of a state extracting headers, then selecting on cases."""
+    body = "".join(f"packet.extract(hdr.{h});\n" for h in extracts)
+    if len(cases) == 1:
+        return body + f"transition {cases[0][1]};\n"
+    arms = "".join(f"{value}: {target};\n" for value, target in cases)
+    return body + f"transition select(meta.v) {{\n{arms}}}\n"
+
+
+# name -> (states, accept_paths, max_extracts)
+CASES = {
+    # start -> s, s -> s | accept
+    "self-loop": (
+        [
+            ("start", state(["eth"], [("default", "s")])),
+            ("s", state(["mpls"], [("1", "s"), ("default", "accept")])),
+        ],
+        1, 2,
+    ),
+    # start -> a, a <-> b, both leave to accept: one entry, two exits
+    "two-state cycle": (
+        [
+            ("start", state(["eth"], [("default", "a")])),
+            ("a", state(["a"], [("1", "b"), ("default", "accept")])),
+            ("b", state(["b"], [("1", "a"), ("default", "accept")])),
+        ],
+        2, 3,
+    ),
+    # The same cycle entered from both of its states: two entries, two exits
+    "cycle entered twice": (
+        [
+            ("start", state(["eth"], [("1", "a"), ("default", "b")])),
+            ("a", state(["a"], [("1", "b"), ("default", "accept")])),
+            ("b", state(["b"], [("1", "a"), ("default", "accept")])),
+        ],
+        4, 3,
+    ),
+    # start -> l | r, both -> m -> accept; l extracts more than r
+    "diamond": (
+        [
+            ("start", state(["eth"], [("1", "l"), ("default", "r")])),
+            ("l", state(["vlan", "ipv4"], [("default", "m")])),
+            ("r", state(["ipv6"], [("default", "m")])),
+            ("m", state(["tcp"], [("default", "accept")])),
+        ],
+        2, 4,
+    ),
+}
+
+
+def check() -> None:
+    for name, (states, accept_paths, max_extracts) in CASES.items():
+        for order in (states, states[:1] + states[:0:-1]):
+            graph = build_parser_graph(order)
+            found = (graph.accept_paths, graph.max_extracts)
+            assert found == (accept_paths, max_extracts), (
+                f"{name}: accept_paths, max_extracts = {found}, expected "
+                f"{(accept_paths, max_extracts)}"
+            )
+
+        graph = build_parser_graph(states)
+        paths, truncated = enumerate_paths(graph, limit=1000, max_loop=1)
+        assert not truncated and paths, f"{name}: enumeration did not finish"
+        assert all(p["end"] == "accept" for p in paths), f"{name}: path not ending in accept"
+        # Exactly limit paths is a complete search; one fewer is not
+        found, truncated = enumerate_paths(graph, limit=len(paths), max_loop=1)
+        assert found == paths and not truncated, f"{name}: limit reached, but nothing was cut"
+        found, truncated = enumerate_paths(graph, limit=len(paths) - 1, max_loop=1)
+        assert found == paths[:-1] and truncated, f"{name}: limit ignored"
+        # The first step only enters start's first target; no path is complete
+        paths, truncated = enumerate_paths(graph, limit=1000, max_loop=64, max_steps=1)
+        assert truncated and not paths, f"{name}: enumeration ignored max_steps"
+        if graph.loops:
+            # Loops taken up to 64 times give far more paths than 50 steps can reach
+            paths, truncated = enumerate_paths(graph, limit=10**6, max_loop=64, max_steps=50)
+            assert truncated, f"{name}: enumeration ignored max_steps"
+        print(f"{name:>20}: accept_paths={accept_paths} max_extracts={max_extracts} ok")
+
+
+def parser_states(states: int) -> List[Tuple[str, str]]:
+    code = generate(GenSpec(states=states, controls=0))
+    index = BlockIndex(code)
+    parser = index.of_kind("parser")[0]
+    return [(s.name, index.body(s)) for s in index.descendants(parser, "state")]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--check", action="store_true", help="check path counts instead of timing")
+    args = parser.parse_args()
+    if args.check:
+        check()
+        return
+
+    print(f"{'states':>7} {'build ms':>9} {'us/state':>9} {'accept paths':>14}")
+    for states in (10, 100, 1000, 5000):
+        pairs = parser_states(states)
+        best = float("inf")
+        for _ in range(5):
+            start = time.perf_counter()
+            graph = build_parser_graph(pairs)
+            best = min(best, time.perf_counter() - start)
+        print(
+            f"{states:>7} {best * 1000:>9.2f} {best * 1e6 / len(pairs):>9.1f} "
+            f"{graph.accept_paths:>14}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Incremental re-parse time against full parse time as programs grow.
+
+Run from the backend directory:
+
+    python benchmarks/bench_reparse.py
+
+A one-line edit is made inside the first control block of generated programs
+of increasing size. Full parse time grows with the file; re-parse time should
+stay roughly flat. The macro columns repeat both with an include guard and a
+#define around the program, as in real v1model sources, so macro expansion is
+on for the whole file.
+
+    python benchmarks/bench_reparse.py --check [--rounds N] [--seed S]
+
+checks correctness instead of timing: it makes chains of random edits to a
+macro-bearing program, among them unbalanced braces, comment and #if
+delimiters, and edits inside #if regions, and asserts that each incremental
+re-parse matches a full parse of the new text.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_parse import make_program  # noqa: E402
+from incremental import apply_edits, build_program, reparse  # noqa: E402
+from model import dumps  # noqa: E402
+from parser_utils import parse_p4_source  # noqa: E402
+
+MACRO_HEADER = "#ifndef GEN_P4\n#define GEN_P4\n#define GEN_VERSION 20180101\n"
+MACRO_FOOTER = "\n#endif\n"
+# Conditional regions wrapped around controls in the --check program
+CONDITIONAL = "#if GEN_VERSION > 20170000\n{}#else\ncontrol Legacy{}() {{ apply {{ }} }}\n#endif\n"
+# Text inserted by random edits
+INSERTS = (
+    "", "x", " ", "\n", "{", "}", "{ }", "(", ")", ";", "apply {", "table t { key = { } }",
+    "/*", "*/", "// c\n", '"', "\n#if 0\n", "\n#else\n", "\n#endif\n",
+    "\n#define GEN_VERSION 1\n", "GEN_VERSION", "\ncontrol Added() { apply { } }\n",
+)
+
+
+def best_of(fn, runs: int = 5) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_edit(code: str) -> tuple:
+    """Best full parse and one-line re-parse times for code, in seconds."""
+    program = build_program(code, "bench.p4")
+    at = code.index("apply {") + len("apply {")
+    edit = [{"start": at, "end": at, "text": "\n        extra.apply();"}]
+
+    def incremental():
+        new_source, _, _, _ = apply_edits(program.source, edit)
+        reparse(program, new_source)
+
+    return best_of(lambda: parse_p4_source(code, "bench.p4")), best_of(incremental)
+
+
+def check_program(seed: int) -> str:
+    """A macro-bearing program with some controls inside #if/#else regions."""
+    rng = random.Random(seed)
+    parts = make_program(12).split("\ncontrol ")
+    for i in range(1, len(parts)):
+        if rng.random() < 0.4:
+            parts[i] = CONDITIONAL.format("control " + parts[i], i)
+        else:
+            parts[i] = "control " + parts[i]
+    return MACRO_HEADER + "\n".join(parts) + MACRO_FOOTER
+
+
+def random_edit(rng: random.Random, source: str) -> dict:
+    """Replace a short random range, preferring spots next to braces and directives."""
+    anchors = [i for i, c in enumerate(source) if c in "{}#"]
+    if anchors and rng.random() < 0.7:
+        start = min(max(rng.choice(anchors) + rng.randint(-2, 2), 0), len(source))
+    else:
+        start = rng.randrange(len(source) + 1)
+    end = min(len(source), start + rng.choice((0, 0, 1, 3, 20, 200)))
+    return {"start": start, "end": end, "text": rng.choice(INSERTS)}
+
+
+def check(rounds: int, seed: int) -> None:
+    """Assert incremental re-parses match full parses over chains of random edits."""
+    rng = random.Random(seed)
+    edits = 0
+    for round_ in range(rounds):
+        program = build_program(check_program(seed + round_), "bench.p4")
+        for _ in range(20):
+            edit = random_edit(rng, program.source)
+            new_source, _, _, _ = apply_edits(program.source, [edit])
+            program, _ = reparse(program, new_source)
+            expected = dumps(parse_p4_source(new_source, "bench.p4"))
+            if dumps(program.structure()) != expected:
+                raise AssertionError(
+                    f"round {round_}: re-parse after {edit!r} differs from a full parse"
+                )
+            edits += 1
+    print(f"{edits} random edits: incremental re-parses match full parses")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--check", action="store_true", help="check correctness instead of timing")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.check:
+        check(args.rounds, args.seed)
+        return
+
+    print(
+        f"{'controls':>8} {'KB':>8} {'full ms':>9} {'reparse ms':>11} "
+        f"{'full ms (macros)':>17} {'reparse ms (macros)':>20}"
+    )
+    for controls in (10, 50, 200, 800):
+        code = make_program(controls)
+        full, partial = time_edit(code)
+        macro_full, macro_partial = time_edit(MACRO_HEADER + code + MACRO_FOOTER)
+        size = len(code.encode("utf-8"))
+        print(
+            f"{controls:>8} {size / 1024:>8.1f} {full * 1000:>9.2f} {partial * 1000:>11.3f} "
+            f"{macro_full * 1000:>17.2f} {macro_partial * 1000:>20.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Response encoding of parsed structures: typed model + orjson vs dicts.
+
+Run from the backend directory:
+
+    python benchmarks/bench_serialize.py
+
+"default" is FastAPI's path for an endpoint returning a dict: the structure
+goes through jsonable_encoder and then json.dumps. "orjson" is what /upload
+now does, handing the model objects to ORJSONResponse. Pickle times cover
+the transfer of the result from a worker process.
+"""
+
+import json
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from model import dumps  # noqa: E402
+from p4gen import GenSpec, generate  # noqa: E402
+from parser_utils import parse_p4_source  # noqa: E402
+
+
+def best_ms(fn, runs: int = 5) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def default_encode(content) -> bytes:
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def main() -> None:
+    print(f"{'controls':>8} {'KB':>8} {'default ms':>11} {'orjson ms':>10} "
+          f"{'pickle ms':>10} {'unpickle ms':>12}")
+    for controls in (10, 50, 200):
+        spec = GenSpec(headers=32, states=32, controls=controls, tables=10, actions=8, depth=3)
+        structure = parse_p4_source(generate(spec), "bench.p4")
+        content = {"filename": "bench.p4", "structure": structure}
+        payload = dumps(content)
+        assert json.loads(default_encode(content)) == json.loads(payload)
+        pickled = pickle.dumps(structure)
+        print(
+            f"{controls:>8} {len(payload) / 1024:>8.1f} {best_ms(lambda: default_encode(content)):>11.2f} "
+            f"{best_ms(lambda: dumps(content)):>10.2f} {best_ms(lambda: pickle.dumps(structure)):>10.2f} "
+            f"{best_ms(lambda: pickle.loads(pickled)):>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Peak RSS of the upload path: whole-body reads against streaming to disk.
+
+Run from the backend directory:
+
+    python benchmarks/bench_upload.py [controls]
+
+The upload body is a generated program in a temporary file, standing in for
+the spooled file the multipart parser hands to /upload. Each mode runs in a
+fresh interpreter and reports its peak RSS, both for getting the source into
+the parser ("ingest") and for the full parse.
+
+    read-all  await file.read(), write it out, reopen and read() it as str
+    stream    copy in chunks while hashing, then decode from a memory map
+"""
+
+import hashlib
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def ingest_read_all(upload_path: str, dest: str) -> str:
+    with open(upload_path, "rb") as upload:
+        content = upload.read()
+    hashlib.sha256(content).hexdigest()
+    with open(dest, "wb") as f:
+        f.write(content)
+    with open(dest, encoding="utf-8") as f:
+        return f.read()
+
+
+def ingest_stream(upload_path: str, dest: str) -> str:
+    from parser_utils import read_source
+
+    digest = hashlib.sha256()
+    with open(upload_path, "rb") as upload, open(dest, "wb") as f:
+        while True:
+            chunk = upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    digest.hexdigest()
+    return read_source(dest)
+
+
+def peak_mb() -> float:
+    # ru_maxrss survives exec, so it would include this script's parent;
+    # VmHWM is the high-water mark of the current process image only
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode: str, stage: str, upload_path: str, dest: str) -> None:
+    from parser_utils import parse_p4_source
+
+    baseline = peak_mb()
+    ingest = ingest_read_all if mode == "read-all" else ingest_stream
+    code = ingest(upload_path, dest)
+    if stage == "parse":
+        parse_p4_source(code, "bench.p4")
+    print(f"{peak_mb() - baseline:.1f}")
+
+
+def main() -> None:
+    from bench_parse import make_program
+
+    controls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    workdir = tempfile.mkdtemp()
+    try:
+        upload_path = os.path.join(workdir, "upload.p4")
+        with open(upload_path, "w", encoding="utf-8") as f:
+            f.write(make_program(controls))
+        size_mb = os.path.getsize(upload_path) / 2**20
+        print(f"{controls} controls, {size_mb:.1f} MB upload; peak RSS growth in MB")
+        print(f"{'mode':>9} {'ingest':>8} {'parse':>8}")
+        for mode in ("read-all", "stream"):
+            row = []
+            for stage in ("ingest", "parse"):
+                out = subprocess.run(
+                    [sys.executable, __file__, "--child", mode, stage, upload_path,
+                     os.path.join(workdir, "saved.p4")],
+                    capture_output=True, text=True, check=True,
+                )
+                row.append(float(out.stdout.strip()))
+            print(f"{mode:>9} {row[0]:>8.1f} {row[1]:>8.1f}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(*sys.argv[2:6])
+    else:
+        main()
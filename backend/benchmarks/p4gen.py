@@ -0,0 +1,170 @@
+"""Synthetic P4_16 program generator for benchmarks.
+
+Generates a complete v1model-style program whose size and shape are set by
+GenSpec: header types and fields, a parser state machine with select
+transitions, and controls with actions, tables and nested apply logic.
+Output is deterministic for a given spec.
+
+    python benchmarks/p4gen.py --controls 20 --tables 8 --depth 3 > big.p4
+"""
+
+import argparse
+import random
+from dataclasses import dataclass, fields
+from typing import List
+
+MATCH_KINDS = ("exact", "lpm", "ternary")
+FIELD_WIDTHS = (8, 16, 32, 48)
+
+
+@dataclass
+class GenSpec:
+    headers: int = 4
+    fields: int = 6          # per header
+    states: int = 4          # parser states besides start
+    controls: int = 2
+    tables: int = 4          # per control
+    actions: int = 3         # per control, besides drop
+    keys: int = 2            # per table
+    depth: int = 2           # if-nesting depth in apply blocks
+    seed: int = 0
+
+
+def _headers(spec: GenSpec, rng: random.Random) -> List[str]:
+    out = []
+    for h in range(spec.headers):
+        out.append(f"header h{h}_t {{")
+        for f in range(spec.fields):
+            out.append(f"    bit<{rng.choice(FIELD_WIDTHS)}> f{f};")
+        out.append("}\n")
+    out.append("struct headers {")
+    out.extend(f"    h{h}_t h{h};" for h in range(spec.headers))
+    out.append("}\n")
+    out.append("struct metadata {\n    bit<16> selector;\n    bit<8> flags;\n}\n")
+    return out
+
+
+def _parser(spec: GenSpec, rng: random.Random) -> List[str]:
+    out = [
+        "parser GenParser(packet_in packet, out headers hdr, inout metadata meta,",
+        "                 inout standard_metadata_t standard_metadata) {",
+    ]
+    names = ["start"] + [f"parse_s{s}" for s in range(spec.states)]
+    for i, name in enumerate(names):
+        h = i % max(1, spec.headers)
+        out.append(f"    state {name} {{")
+        if spec.headers:
+            out.append(f"        packet.extract(hdr.h{h});")
+        later = names[i + 1:i + 3]
+        if later and spec.headers:
+            out.append(f"        transition select(hdr.h{h}.f0) {{")
+            for value, target in enumerate(later, 1):
+                out.append(f"            {value:#x}: {target};")
+            out.append("            default: accept;")
+            out.append("        }")
+        else:
+            out.append("        transition accept;")
+        out.append("    }")
+    out.append("}\n")
+    return out
+
+
+def _apply(spec: GenSpec, rng: random.Random, tables: List[str], depth: int, indent: int) -> List[str]:
+    """Apply each table once, nesting pairs of them under if/else-if chains."""
+    pad = " " * indent
+    out = []
+    i = 0
+    while i < len(tables):
+        if depth > 0 and len(tables) - i >= 2:
+            nested = tables[i + 1:i + 3]
+            h = rng.randrange(max(1, spec.headers))
+            out.append(f"{pad}if (hdr.h{h}.isValid()) {{")
+            out.extend(_apply(spec, rng, nested, depth - 1, indent + 4))
+            out.append(f"{pad}}} else if (meta.flags == {i}) {{")
+            out.append(f"{pad}    {tables[i]}.apply();")
+            out.append(f"{pad}}} else {{")
+            out.append(f"{pad}    meta.selector = {i};")
+            out.append(f"{pad}}}")
+            i += 1 + len(nested)
+        else:
+            out.append(f"{pad}{tables[i]}.apply();")
+            i += 1
+    return out
+
+
+def _control(spec: GenSpec, rng: random.Random, c: int) -> List[str]:
+    out = [
+        f"control GenControl{c}(inout headers hdr, inout metadata meta,",
+        "                    inout standard_metadata_t standard_metadata) {",
+        f"    register<bit<32>>(1024) reg_{c};",
+        f"    action drop_{c}() {{",
+        "        mark_to_drop(standard_metadata);",
+        "    }",
+    ]
+    actions = [f"drop_{c}"]
+    for a in range(spec.actions):
+        name = f"act_{c}_{a}"
+        actions.append(name)
+        h = rng.randrange(max(1, spec.headers))
+        out.append(f"    action {name}(bit<9> port, bit<32> value) {{")
+        out.append("        standard_metadata.egress_spec = port;")
+        out.append(f"        hdr.h{h}.f0 = value;")
+        out.append("    }")
+
+    tables = []
+    for t in range(spec.tables):
+        name = f"tbl_{c}_{t}"
+        tables.append(name)
+        out.append(f"    table {name} {{")
+        out.append("        key = {")
+        for _ in range(spec.keys):
+            h = rng.randrange(max(1, spec.headers))
+            f = rng.randrange(max(1, spec.fields))
+            out.append(f"            hdr.h{h}.f{f}: {rng.choice(MATCH_KINDS)};")
+        out.append("        }")
+        out.append("        actions = {")
+        for action in rng.sample(actions, min(len(actions), 3)):
+            out.append(f"            {action};")
+        out.append("        }")
+        out.append(f"        size = {rng.choice((256, 1024, 4096))};")
+        out.append(f"        default_action = drop_{c}();")
+        out.append("    }")
+
+    out.append("    apply {")
+    out.extend(_apply(spec, rng, tables[:-1], spec.depth, 8))
+    if tables:
+        out.append(f"        switch ({tables[-1]}.apply().action_run) {{")
+        out.append(f"            drop_{c}: {{ meta.flags = 1; }}")
+        out.append("            default: { meta.flags = 0; }")
+        out.append("        }")
+    out.append("    }")
+    out.append("}\n")
+    return out
+
+
+def generate(spec: GenSpec) -> str:
+    """Return the source of a synthetic P4 program described by spec."""
+    rng = random.Random(spec.seed)
+    out = ["#include <core.p4>", "#include <v1model.p4>", "", "const bit<16> TYPE_GEN = 0x800;", ""]
+    out.extend(_headers(spec, rng))
+    out.extend(_parser(spec, rng))
+    for c in range(spec.controls):
+        out.extend(_control(spec, rng, c))
+    out.append("control GenDeparser(packet_out packet, in headers hdr) {")
+    out.append("    apply {")
+    out.extend(f"        packet.emit(hdr.h{h});" for h in range(spec.headers))
+    out.append("    }")
+    out.append("}\n")
+    return "\n".join(out)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    for f in fields(GenSpec):
+        parser.add_argument(f"--{f.name}", type=int, default=f.default)
+    args = parser.parse_args()
+    print(generate(GenSpec(**vars(args))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Benchmark suite for the parse, upload and export paths.
+
+Run from the backend directory:
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --profiles large --scenarios parse,export
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<earlier>.json
+
+Programs come from p4gen at three sizes. Each scenario runs a number of
+iterations per profile and records p50/p99/mean latency, throughput (files/s
+and MB/s of P4 source) and peak traced memory in a separate run. Results are
+written as JSON under benchmarks/results/ together with the commit, Python
+version and parser version, so runs can be compared over time.
+
+Scenarios:
+    parse         parse_p4_source on the generated source
+    brace         extract_brace_block over every top-level block
+    upload        POST /upload through the full app, parse cache cleared first
+    upload-cached POST /upload of a program already in the parse cache
+    export        write_excel_export of the parsed structure to memory
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+from p4gen import GenSpec, generate  # noqa: E402
+from parser_utils import PARSER_VERSION, BlockIndex, extract_brace_block, parse_p4_source  # noqa: E402
+from export_utils import write_excel_export  # noqa: E402
+from model import dumps, loads  # noqa: E402
+
+PROFILES = {
+    "small": (GenSpec(), 50),
+    "medium": (GenSpec(headers=16, states=16, controls=20, tables=8, actions=6, depth=3), 20),
+    "large": (GenSpec(headers=32, states=32, controls=200, tables=10, actions=8, depth=3), 5),
+}
+SCENARIOS = ("parse", "brace", "upload", "upload-cached", "export")
+RESULTS_DIR = os.path.join(BACKEND, "benchmarks", "results")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples."""
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def measure(fn: Callable[[], Any], iterations: int) -> Dict[str, float]:
+    fn()  # warm-up
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    mean = sum(latencies) / len(latencies)
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": mean * 1000,
+        "files_per_s": 1 / mean,
+        "peak_mem_mb": peak / 2**20,
+        "mean_s": mean,
+    }
+
+
+def scenario_fns(code: str, client) -> Dict[str, Callable[[], Any]]:
+    """Build the zero-argument callable timed for each scenario."""
+    # /export-excel receives the structure back from the client as plain JSON
+    structure = loads(dumps(parse_p4_source(code, "bench.p4")))
+    starts = [b.start for b in BlockIndex(code).top_level()]
+    content = code.encode("utf-8")
+    fns = {
+        "parse": lambda: parse_p4_source(code, "bench.p4"),
+        "brace": lambda: [extract_brace_block(code, start) for start in starts],
+        "export": lambda: write_excel_export(structure, io.BytesIO()),
+    }
+    if client is not None:
+        import main
+
+        def upload():
+            main.parse_cache.clear()
+            response = client.post("/upload", files={"file": ("bench.p4", content)})
+            response.raise_for_status()
+
+        def upload_cached():
+            response = client.post("/upload", files={"file": ("bench.p4", content)})
+            response.raise_for_status()
+
+        fns["upload"] = upload
+        fns["upload-cached"] = upload_cached
+    return fns
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(profiles: List[str], scenarios: List[str], iterations: int) -> Dict[str, Any]:
+    client = None
+    if any(s.startswith("upload") for s in scenarios):
+        # Keep uploads, exports and the parse cache out of the working tree
+        workdir = tempfile.mkdtemp(prefix="p4lens-bench-")
+        os.environ["P4LENS_UPLOAD_DIR"] = workdir
+        os.environ["P4LENS_PARSE_CACHE_DB"] = ""
+        from fastapi.testclient import TestClient
+        import main
+        client = TestClient(main.app)
+        client.__enter__()
+
+    results = []
+    try:
+        for profile in profiles:
+            spec, default_iterations = PROFILES[profile]
+            code = generate(spec)
+            size = len(code.encode("utf-8"))
+            fns = scenario_fns(code, client)
+            for scenario in scenarios:
+                stats = measure(fns[scenario], iterations or default_iterations)
+                mean_s = stats.pop("mean_s")
+                row = {
+                    "scenario": scenario,
+                    "profile": profile,
+                    "iterations": iterations or default_iterations,
+                    "input_bytes": size,
+                    **stats,
+                    "mb_per_s": size / mean_s / 2**20,
+                }
+                results.append(row)
+                print(
+                    f"{scenario:>13} {profile:>7} {size / 1024:>9.1f} {row['p50_ms']:>9.2f} "
+                    f"{row['p99_ms']:>9.2f} {row['files_per_s']:>9.1f} {row['mb_per_s']:>8.2f} "
+                    f"{row['peak_mem_mb']:>8.2f}",
+                    flush=True,
+                )
+    finally:
+        if client is not None:
+            client.__exit__(None, None, None)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "parser_version": PARSER_VERSION,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {(r["scenario"], r["profile"]): r for r in baseline["results"]}
+    print(f"\nChange against {baseline['meta']['commit']} ({baseline['meta']['timestamp']}):")
+    print(f"{'scenario':>13} {'profile':>7} {'p50':>9} {'p99':>9} {'peak mem':>9}")
+    for row in current["results"]:
+        old = before.get((row["scenario"], row["profile"]))
+        if old is None:
+            continue
+
+        def delta(key: str) -> str:
+            return f"{(row[key] / old[key] - 1) * 100:+.1f}%" if old[key] else "n/a"
+
+        print(
+            f"{row['scenario']:>13} {row['profile']:>7} {delta('p50_ms'):>9} "
+            f"{delta('p99_ms'):>9} {delta('peak_mem_mb'):>9}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="P4Lens backend benchmark suite")
+    parser.add_argument("--profiles", default="small,medium,large")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=0,
+                        help="iterations per scenario (default depends on profile)")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    profiles = args.profiles.split(",")
+    scenarios = args.scenarios.split(",")
+    for name in profiles:
+        if name not in PROFILES:
+            parser.error(f"unknown profile {name!r}")
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r}")
+
+    print(f"{'scenario':>13} {'profile':>7} {'KB':>9} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'files/s':>9} {'MB/s':>8} {'peak MB':>8}")
+    current = run(profiles, scenarios, args.iterations)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{current['meta']['commit']}.json")
+    with open(output, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(current, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Coalescing of concurrent parses of the same source.
+
+Requests for a source that is already being parsed wait for that parse
+instead of starting their own. Within a process, later requests await the
+first one's result. Across API worker processes, the parse cache's sqlite
+file holds a lease per source key: the process holding it parses, and the
+others poll the cache until the structure appears. If the parse fails, the
+lease is released without a structure and the next waiter parses instead.
+Leases expire, so a crashed process holds up the others only until then.
+"""
+
+import asyncio
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from parse_cache import ParseCache
+
+# (parse ID, structure, stage timings); timings are None when the structure
+# was parsed by another process and read from the cache
+ParseResult = Tuple[str, Dict[str, Any], Optional[Dict[str, Any]]]
+
+
+class Coalescer:
+    """Run at most one parse per key at a time, across tasks and processes."""
+
+    def __init__(self, cache: ParseCache, lease_ttl: float, poll: float = 0.05, max_poll: float = 1.0):
+        self.cache = cache
+        self.lease_ttl = lease_ttl
+        self.poll = poll
+        self.max_poll = max_poll
+        self._inflight: Dict[str, "asyncio.Future[ParseResult]"] = {}
+
+    async def run(self, key: str, parse: Callable[[], Awaitable[ParseResult]]) -> Tuple[ParseResult, bool]:
+        """Return parse()'s result for key and whether this call ran it.
+
+        parse() must store its structure in the cache, with key as its
+        source, before returning. Calls that did not run it get the result of
+        the call or process that did.
+        """
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future), False
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The parse this call was waiting for was cancelled; take over
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting, so never leave an exception unretrieved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result, ran = await self._lead(key, parse)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._inflight[key]
+        future.set_result(result)
+        return result, ran
+
+    async def _lead(self, key: str, parse: Callable[[], Awaitable[ParseResult]]) -> Tuple[ParseResult, bool]:
+        owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        delay = self.poll
+        # The cache blocks on sqlite, so it is only called from threads
+        while not await asyncio.to_thread(self.cache.acquire, key, owner, self.lease_ttl):
+            # Another process is parsing this source
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll)
+            found = await asyncio.to_thread(self.cache.peek_source, key)
+            if found is not None:
+                return (*found, None), False
+        try:
+            # Finished by another process between the caller's miss and the lease
+            found = await asyncio.to_thread(self.cache.peek_source, key)
+            if found is not None:
+                return (*found, None), False
+            return await parse(), True
+        finally:
+            # Runs to completion in its thread even if this task is cancelled
+            await asyncio.to_thread(self.cache.release, key, owner)
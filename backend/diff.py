@@ -0,0 +1,238 @@
+"""Structural diffs between two parsed programs.
+
+Every top-level entity of a structure (block, table, type layout, enum,
+constant and extern) gets a fingerprint, a hash of its JSON encoding, and
+fingerprints are kept per parse ID. Two revisions are diffed by comparing
+fingerprints, so an unchanged entity costs a dict lookup; only entities whose
+fingerprints differ are compared field by field.
+"""
+
+import hashlib
+from typing import Any, Callable, Dict, List, Optional
+
+from lru import LRU
+from model import Action, Block, ControlBlock, Layout, ParserBlock, ParserState, Table, dumps
+
+SECTIONS = ("blocks", "tables", "types", "enums", "consts", "externs")
+
+
+def _entities(structure: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Group a structure's entities by section and name."""
+    return {
+        "blocks": {name: block for name, block in structure.items() if not name.startswith("_")},
+        "tables": dict(structure.get("_tables") or {}),
+        "types": dict(structure.get("_layouts") or {}),
+        "enums": dict(structure.get("_enums") or {}),
+        "consts": {name: value for name, value in structure.get("_consts") or []},
+        "externs": {e.name: e.type for e in structure.get("_externs") or []},
+    }
+
+
+def _digest(obj: Any) -> bytes:
+    return hashlib.blake2b(dumps(obj), digest_size=16).digest()
+
+
+class Fingerprints:
+    """Entities of one structure with a fingerprint for each."""
+
+    def __init__(self, structure: Dict[str, Any]):
+        self.entities = _entities(structure)
+        self.digests = {
+            section: {name: _digest(entity) for name, entity in entities.items()}
+            for section, entities in self.entities.items()
+        }
+
+
+def _delta(old: List[Any], new: List[Any]) -> Dict[str, List[Any]]:
+    """Items added to and removed from a list, in list order; {} if none."""
+    old_set, new_set = set(old), set(new)
+    delta = {}
+    added = [item for item in new if item not in old_set]
+    removed = [item for item in old if item not in new_set]
+    if added:
+        delta["added"] = added
+    if removed:
+        delta["removed"] = removed
+    return delta
+
+
+def _changed(old: Any, new: Any) -> Optional[Dict[str, Any]]:
+    return {"before": old, "after": new} if old != new else None
+
+
+def _compact(diff: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in diff.items() if value}
+
+
+def _match_keys(keys: List[str]) -> Dict[str, str]:
+    """Map each table key field to its match kind."""
+    fields = {}
+    for key in keys:
+        field, _, kind = key.partition(":")
+        fields[field.strip()] = kind.strip()
+    return fields
+
+
+def diff_table(old: Table, new: Table) -> Dict[str, Any]:
+    old_keys, new_keys = _match_keys(old.keys), _match_keys(new.keys)
+    return _compact({
+        "keys": _delta(list(old_keys), list(new_keys)),
+        "match_kinds": {
+            field: {"before": kind, "after": new_keys[field]}
+            for field, kind in old_keys.items()
+            if field in new_keys and new_keys[field] != kind
+        },
+        "key_order": _changed(old.keys, new.keys)
+        if list(old_keys) != list(new_keys) and set(old_keys) == set(new_keys) else None,
+        "actions": _delta(old.actions, new.actions),
+        "size": _changed(old.size, new.size),
+        "default_action": _changed(old.default_action, new.default_action),
+    })
+
+
+def diff_action(old: Action, new: Action) -> Dict[str, Any]:
+    old_params = {p.name: p.type for p in old.parameters}
+    new_params = {p.name: p.type for p in new.parameters}
+    return _compact({
+        "parameters": _compact({
+            **_delta(list(old_params), list(new_params)),
+            "retyped": {
+                name: {"before": type_, "after": new_params[name]}
+                for name, type_ in old_params.items()
+                if name in new_params and new_params[name] != type_
+            },
+        }),
+        "operations": _delta(old.operations, new.operations),
+        "writes": _delta(old.writes, new.writes),
+        "reads": _delta(old.reads, new.reads),
+        "body_changed": old.body_preview != new.body_preview,
+    })
+
+
+def diff_state(old: ParserState, new: ParserState) -> Dict[str, Any]:
+    old_cases = {c.value: c.target for c in old.cases}
+    new_cases = {c.value: c.target for c in new.cases}
+    return _compact({
+        "extracts": _changed(old.extracts, new.extracts),
+        "select": _changed(old.select, new.select),
+        "cases": _compact({
+            "added": {v: t for v, t in new_cases.items() if v not in old_cases},
+            "removed": {v: t for v, t in old_cases.items() if v not in new_cases},
+            "retargeted": {
+                value: {"before": target, "after": new_cases[value]}
+                for value, target in old_cases.items()
+                if value in new_cases and new_cases[value] != target
+            },
+        }),
+    })
+
+
+def _diff_named(
+    old: Dict[str, Any], new: Dict[str, Any], diff_one: Callable[[Any, Any], Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Diff two name -> entity maps, skipping entities that are equal."""
+    changed = {}
+    for name in old:
+        if name in new and old[name] != new[name]:
+            found = diff_one(old[name], new[name])
+            if found:
+                changed[name] = found
+    return _compact({
+        **_delta(list(old), list(new)),
+        "changed": changed,
+    })
+
+
+def diff_block(old: Block, new: Block) -> Dict[str, Any]:
+    diff = {
+        "type": _changed(old.type, new.type),
+        "tables": _delta(old.tables, new.tables),
+        "actions": _diff_named(
+            {a.name: a for a in old.actions},
+            {a.name: a for a in new.actions},
+            diff_action,
+        ),
+    }
+    if isinstance(old, ControlBlock) and isinstance(new, ControlBlock):
+        old_logic, new_logic = old.apply_logic, new.apply_logic
+        if old_logic.flow != new_logic.flow:
+            diff["apply"] = _compact({
+                "tables_applied": _delta(old_logic.tables_applied, new_logic.tables_applied),
+                "logic": _delta(old_logic.logic, new_logic.logic),
+                "flow_changed": True,
+            })
+    if isinstance(old, ParserBlock) and isinstance(new, ParserBlock) and old.graph and new.graph:
+        diff["states"] = _diff_named(old.graph.states, new.graph.states, diff_state)
+        diff["accept_paths"] = _changed(old.graph.accept_paths, new.graph.accept_paths)
+    return _compact(diff)
+
+
+def diff_layout(old: Layout, new: Layout) -> Dict[str, Any]:
+    old_fields = {f.name: f for f in old.fields}
+    new_fields = {f.name: f for f in new.fields}
+    return _compact({
+        "kind": _changed(old.kind, new.kind),
+        "fields": _diff_named(
+            old_fields,
+            new_fields,
+            lambda a, b: {
+                key: {"before": getattr(a, key), "after": getattr(b, key)}
+                for key in ("type", "offset", "width", "count")
+                if getattr(a, key) != getattr(b, key)
+            },
+        ),
+        "bits": _changed(old.bits, new.bits),
+    })
+
+
+def diff_enum(old: List[str], new: List[str]) -> Dict[str, Any]:
+    return _delta(old, new) or _compact({"order": _changed(old, new)})
+
+
+def _diff_value(old: Any, new: Any) -> Dict[str, Any]:
+    return {"before": old, "after": new}
+
+
+_DIFFERS = {
+    "blocks": diff_block,
+    "tables": diff_table,
+    "types": diff_layout,
+    "enums": diff_enum,
+    "consts": _diff_value,
+    "externs": _diff_value,
+}
+
+
+def diff_structures(base: Fingerprints, head: Fingerprints) -> Dict[str, Any]:
+    """Diff two fingerprinted structures section by section.
+
+    Each section lists the names added and removed and, for entities present
+    in both whose fingerprints differ, what changed. An entity whose
+    fingerprint changed without a reported difference (such as whitespace in
+    an apply body) counts as unchanged.
+    """
+    result: Dict[str, Any] = {}
+    summary = {"unchanged": 0, "changed": 0, "added": 0, "removed": 0}
+    for section in SECTIONS:
+        old, new = base.digests[section], head.digests[section]
+        changed = {}
+        for name, digest in old.items():
+            if name not in new:
+                continue
+            if new[name] != digest:
+                found = _DIFFERS[section](base.entities[section][name], head.entities[section][name])
+                if found:
+                    changed[name] = found
+                    continue
+            summary["unchanged"] += 1
+        added = [name for name in new if name not in old]
+        removed = [name for name in old if name not in new]
+        summary["changed"] += len(changed)
+        summary["added"] += len(added)
+        summary["removed"] += len(removed)
+        result[section] = {"added": added, "removed": removed, "changed": changed}
+    return {"summary": summary, **result}
+
+
+class FingerprintStore(LRU[Fingerprints]):
+    """LRU of structure fingerprints by parse ID."""
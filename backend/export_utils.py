@@ -0,0 +1,188 @@
+"""Excel export of parsed P4 structures.
+
+Workbooks are written with openpyxl's write-only mode: rows are streamed to
+the output as they are produced instead of being held in memory, and every
+cell refers to one of a few named styles registered once per workbook rather
+than carrying its own Font/Alignment/Border objects.
+"""
+
+from typing import BinaryIO, Iterator, List, Union
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+from openpyxl.utils import get_column_letter
+
+from metrics import count, stage
+
+TITLE_STYLE = "p4lens_title"
+HEADER_STYLE = "p4lens_header"
+CELL_STYLE = "p4lens_cell"
+
+
+def _named_styles() -> List[NamedStyle]:
+    """Build the shared styles used by every export sheet."""
+    side = Side(style='thin')
+    border = Border(left=side, right=side, top=side, bottom=side)
+    return [
+        NamedStyle(
+            name=TITLE_STYLE,
+            font=Font(bold=True, size=14),
+            alignment=Alignment(horizontal='center', vertical='center'),
+        ),
+        NamedStyle(
+            name=HEADER_STYLE,
+            font=Font(bold=True, color="FFFFFF", size=12),
+            fill=PatternFill(start_color="366092", end_color="366092", fill_type="solid"),
+            alignment=Alignment(horizontal='center', vertical='center'),
+            border=border,
+        ),
+        NamedStyle(
+            name=CELL_STYLE,
+            alignment=Alignment(wrap_text=True, vertical='top'),
+            border=border,
+        ),
+    ]
+
+
+def _table_rows(structure: dict) -> Iterator[list]:
+    """Yield one row per match-action table."""
+    tables = structure.get("_tables", {})
+    for table_name, table_info in tables.items():
+        keys = table_info.get("keys", [])
+        actions = table_info.get("actions", [])
+        size = table_info.get("size", "N/A")
+        default_action = table_info.get("default_action", "N/A")
+
+        # Parse match types from keys
+        match_types = []
+        key_names = []
+        for key in keys:
+            if ":" in key:
+                parts = key.split(":")
+                key_names.append(parts[0].strip())
+                match_types.append(parts[1].strip() if len(parts) > 1 else "exact")
+            else:
+                key_names.append(key.strip())
+                match_types.append("exact")
+
+        yield [
+            table_name,
+            "\n".join(key_names) if key_names else "None",
+            "\n".join(match_types) if match_types else "N/A",
+            "\n".join(actions) if actions else "None",
+            size,
+            default_action
+        ]
+
+
+def _apply_rows(structure: dict) -> Iterator[list]:
+    """Yield the apply logic rows for each control block."""
+    for name, info in structure.items():
+        if not name.startswith("_") and info.get("type") == "control":
+            apply_logic = info.get("apply_logic", {})
+            conditions = apply_logic.get("conditions", [])
+            tables_applied = apply_logic.get("tables_applied", [])
+            logic = apply_logic.get("logic", [])
+            tables_str = ", ".join(tables_applied) if tables_applied else "None"
+            logic_str = "\n".join(logic) if logic else "No logic"
+
+            if conditions:
+                for cond in conditions:
+                    yield [name, cond.get("condition", "N/A"), tables_str, logic_str]
+            else:
+                # Direct table applications
+                yield [name, "Always (no condition)", tables_str, logic_str]
+
+
+def _action_rows(structure: dict) -> Iterator[list]:
+    """Yield one row per action in each control block."""
+    for name, info in structure.items():
+        if not name.startswith("_") and info.get("type") == "control":
+            actions = info.get("actions", [])
+            for action in actions:
+                params = action.get("parameters", [])
+                param_str = ", ".join([f"{p.get('type', '')} {p.get('name', '')}" for p in params])
+                operations = ", ".join(action.get("operations", []))
+
+                yield [
+                    name,
+                    action.get("name", "N/A"),
+                    param_str if param_str else "None",
+                    operations if operations else "N/A",
+                    action.get("body_preview", "N/A")[:100]
+                ]
+
+
+# (sheet title, heading, column headers, column widths, row generator)
+EXPORT_SHEETS = [
+    (
+        "Tables & Rules",
+        "P4 Tables and Match-Action Rules",
+        ["Table Name", "Match Keys", "Match Type", "Actions", "Size", "Default Action"],
+        [20, 30, 15, 25, 10, 20],
+        _table_rows,
+    ),
+    (
+        "Apply Block Logic",
+        "Control Block Apply Logic - Main Function Blocks",
+        ["Control Block", "Condition", "Tables Applied", "Logic Flow"],
+        [20, 40, 30, 50],
+        _apply_rows,
+    ),
+    (
+        "Actions",
+        "Action Definitions",
+        ["Control Block", "Action Name", "Parameters", "Operations", "Description"],
+        [20, 20, 30, 25, 50],
+        _action_rows,
+    ),
+]
+
+
+def _styled_cells(ws, style: str, count: int) -> List[WriteOnlyCell]:
+    """Build a row of cells that share one named style."""
+    cells = []
+    for _ in range(count):
+        cell = WriteOnlyCell(ws)
+        cell.style = style
+        cells.append(cell)
+    return cells
+
+
+def write_excel_export(structure: dict, dest: Union[str, BinaryIO]) -> None:
+    """Stream the Excel export of a structure to a path or binary file object."""
+    wb = Workbook(write_only=True)
+    for style in _named_styles():
+        wb.add_named_style(style)
+
+    for title, heading, headers, widths, rows in EXPORT_SHEETS:
+        ws = wb.create_sheet(title)
+        # Column and merge settings must be in place before rows are written
+        for col, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(col)].width = width
+        ws.merged_cells.add(f"A1:{get_column_letter(len(headers))}1")
+
+        title_cell = WriteOnlyCell(ws, value=heading)
+        title_cell.style = TITLE_STYLE
+        ws.append([title_cell])
+        ws.append([])
+        header_cells = _styled_cells(ws, HEADER_STYLE, len(headers))
+        for cell, value in zip(header_cells, headers):
+            cell.value = value
+        ws.append(header_cells)
+
+        # append() serialises a row immediately, so one set of styled cells
+        # is reused for every data row instead of styling each cell anew
+        row_cells = _styled_cells(ws, CELL_STYLE, len(headers))
+        written = 0
+        with stage(rows.__name__.strip("_")):
+            for row in rows(structure):
+                for cell, value in zip(row_cells, row):
+                    cell.value = value
+                ws.append(row_cells)
+                written += 1
+        count("rows", written)
+
+    with stage("save"):
+        wb.save(dest)
@@ -0,0 +1,192 @@
+"""Header layout compilation.
+
+Headers, header unions and structs are compiled once per parse into Layouts:
+each field's bit offset and width, and the packed size of the whole type.
+Typedefs and "type" declarations are resolved through chains, varbit fields
+count as empty in offsets and sizes (their maximum is reported separately)
+and header stacks (T[n] members) are n packed copies of T.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from model import HeaderField, Layout, LayoutField
+
+_COMMENT_RE = re.compile(r"//[^\n]*|/\*.*?\*/", re.S)
+_ANNOTATION_RE = re.compile(r"@\w+(?:\([^)]*\))?")
+_TYPEDEF_RE = re.compile(r"\b(?:typedef|type)\s+([^;{}]+?)\s+(\w+)\s*;")
+_AGGREGATE_RE = re.compile(r"\b(struct|header_union)\s+(\w+)\s*\{([^{}]*)\}")
+_MEMBER_RE = re.compile(r"(.*\S)\s+(\w+)$", re.S)
+_SIZED_RE = re.compile(r"(bit|int|varbit)\s*<\s*(\d+)\s*>$")
+_STACK_RE = re.compile(r"(.+?)\s*\[\s*(\d+)\s*\]$")
+_INDEX_RE = re.compile(r"\s*\[[^\]]*\]")
+
+
+def parse_members(body: str) -> List[Tuple[str, str]]:
+    """Return the (type, name) pairs declared in a header or struct body."""
+    members = []
+    for decl in _COMMENT_RE.sub(" ", body).split(";"):
+        match = _MEMBER_RE.match(_ANNOTATION_RE.sub(" ", decl).strip())
+        if match:
+            members.append((" ".join(match.group(1).split()), match.group(2)))
+    return members
+
+
+def header_fields(body: str) -> List[HeaderField]:
+    """Return the fields of a header body as written."""
+    return [
+        HeaderField(field=name, bits=type_, type="bit" if type_.startswith("bit<") else "other")
+        for type_, name in parse_members(body)
+    ]
+
+
+def parse_declarations(text: str) -> Tuple[Dict[str, str], Dict[str, Tuple[str, List]]]:
+    """Return the typedefs and the struct/header_union declarations in some text."""
+    text = _COMMENT_RE.sub(" ", text)
+    typedefs = {name: " ".join(type_.split()) for type_, name in _TYPEDEF_RE.findall(text)}
+    aggregates = {
+        name: (kind, parse_members(body)) for kind, name, body in _AGGREGATE_RE.findall(text)
+    }
+    return typedefs, aggregates
+
+
+class _Compiler:
+    def __init__(
+        self,
+        headers: Dict[str, List[Tuple[str, str]]],
+        aggregates: Dict[str, Tuple[str, List[Tuple[str, str]]]],
+        typedefs: Dict[str, str],
+    ):
+        self.declared = {name: ("header", members) for name, members in headers.items()}
+        self.declared.update(aggregates)
+        self.typedefs = typedefs
+        self.layouts: Dict[str, Layout] = {}
+        self._active = set()
+
+    def width(self, type_: str) -> Tuple[Optional[int], Optional[int], bool]:
+        """Return (fixed bits, maximum bits, varbit) of a type; None when unknown."""
+        seen = set()
+        while type_ in self.typedefs and type_ not in seen:
+            seen.add(type_)
+            type_ = self.typedefs[type_]
+        sized = _SIZED_RE.match(type_)
+        if sized:
+            bits = int(sized.group(2))
+            if sized.group(1) == "varbit":
+                return 0, bits, True
+            return bits, bits, False
+        if type_ == "bool":
+            return 1, 1, False
+        stack = _STACK_RE.match(type_)
+        if stack:
+            bits, max_bits, varbit = self.width(stack.group(1))
+            n = int(stack.group(2))
+            if bits is None:
+                return None, None, False
+            return bits * n, max_bits * n, varbit
+        layout = self.compile(type_)
+        if layout is None or layout.bits is None:
+            return None, None, False
+        return layout.bits, layout.max_bits, layout.max_bits != layout.bits
+
+    def compile(self, name: str) -> Optional[Layout]:
+        if name in self.layouts:
+            return self.layouts[name]
+        if name not in self.declared or name in self._active:
+            return None
+        self._active.add(name)
+        kind, members = self.declared[name]
+        layout = Layout(kind=kind)
+        offset: Optional[int] = 0
+        max_total = 0
+        for type_, field in members:
+            bits, max_bits, varbit = self.width(type_)
+            stack = _STACK_RE.match(type_)
+            entry = LayoutField(
+                name=field,
+                type=type_,
+                offset=0 if kind == "header_union" else offset,
+                width=bits,
+                count=int(stack.group(2)) if stack else 1,
+                max_width=max_bits if varbit else None,
+            )
+            layout.fields.append(entry)
+            if bits is None:
+                layout.unresolved.append(field)
+                offset = None
+            elif kind == "header_union":
+                offset = max(offset, bits) if offset is not None else None
+                max_total = max(max_total, max_bits)
+            elif offset is not None:
+                offset += bits
+                max_total += max_bits
+        self._active.discard(name)
+        if offset is not None:
+            layout.bits = offset
+            layout.bytes = -(-offset // 8)
+            layout.max_bits = max_total
+            layout.max_bytes = -(-max_total // 8)
+        self.layouts[name] = layout
+        return layout
+
+
+def compile_layouts(
+    headers: Dict[str, List[HeaderField]],
+    aggregates: Dict[str, Tuple[str, List[Tuple[str, str]]]],
+    typedefs: Dict[str, str],
+) -> Dict[str, Layout]:
+    """Compile every header, then every struct and header union."""
+    compiler = _Compiler(
+        {name: [(f.bits, f.field) for f in fields] for name, fields in headers.items()},
+        aggregates,
+        typedefs,
+    )
+    return {name: compiler.compile(name) for name in compiler.declared}
+
+
+def instance_type(path: str, layouts: Dict[str, Any]) -> Optional[str]:
+    """Resolve an extracted instance such as "hdr.mpls.next" to its header type.
+
+    The variable's own type is not known here, so the first member is looked up
+    in every struct.
+    """
+    parts = [p for p in _INDEX_RE.sub("", path.strip()).split(".") if p not in ("next", "last")]
+    candidates = [layout for layout in layouts.values() if layout.kind == "struct"]
+    type_ = None
+    for part in parts[1:]:
+        member = next(
+            (f for layout in candidates for f in layout.fields if f.name == part), None
+        )
+        if member is None:
+            return None
+        type_ = _INDEX_RE.sub("", member.type)
+        candidates = [layouts[type_]] if type_ in layouts else []
+    return type_ if type_ in layouts and layouts[type_].kind != "struct" else None
+
+
+def packed_extracts(extracts: List[str], layouts: Dict[str, Any]) -> Dict[str, Any]:
+    """Lay out a sequence of extracted headers back to back, as on the wire.
+
+    The varbit length of a two-argument extract is added when it is a literal.
+    """
+    headers = []
+    offset: Optional[int] = 0
+    max_offset: Optional[int] = 0
+    for extract in extracts:
+        path, _, varbit_bits = extract.partition(",")
+        path = path.strip()
+        type_ = instance_type(path, layouts)
+        layout = layouts.get(type_) if type_ else None
+        bits = layout.bits if layout else None
+        max_bits = layout.max_bits if layout else None
+        if bits is not None and varbit_bits.strip().isdigit():
+            bits += int(varbit_bits)
+        headers.append({"header": path, "type": type_, "offset": offset, "bits": bits})
+        offset = offset + bits if offset is not None and bits is not None else None
+        max_offset = max_offset + max_bits if max_offset is not None and max_bits is not None else None
+    return {
+        "headers": headers,
+        "bits": offset,
+        "bytes": -(-offset // 8) if offset is not None else None,
+        "max_bytes": -(-max_offset // 8) if max_offset is not None else None,
+    }
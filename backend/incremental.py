@@ -0,0 +1,238 @@
+"""Incremental re-parsing of edited P4 programs.
+
+A program is kept as a list of units (top-level blocks and the global text
+between them, see parser_utils.split_units), each with a digest of its text
+and its extracted fragment. When a new revision arrives, only the units
+overlapping the edited range are re-lexed and re-extracted; every other
+unit's fragment is reused and just shifted to its new offset.
+
+Units are cut from the preprocessed text, so each revision is preprocessed
+in full (included files come from the include cache) and the edited range is
+found by comparing the preprocessed texts of the two revisions.
+"""
+
+import hashlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from lru import LRU
+from metrics import stage
+from parse_cache import cache_key, source_key_of
+from parser_utils import (
+    BlockIndex, assemble_structure, extract_fragment, preprocess_source, read_source, split_units
+)
+from preprocess import Preprocessed
+
+# Chunk size used when scanning for the common prefix/suffix of two revisions
+_COMPARE_CHUNK = 64 * 1024
+
+
+class InvalidEdit(ValueError):
+    """Raised when submitted edits do not fit the previous source."""
+
+
+@dataclass
+class Unit:
+    start: int
+    end: int
+    kind: Optional[str]
+    name: Optional[str]
+    digest: str
+    fragment: Dict[str, Any]
+
+
+@dataclass
+class ParsedProgram:
+    # None while the source is only on disk at path
+    source: Optional[str]
+    filename: str
+    # None until the program is first used for an incremental re-parse
+    units: Optional[List[Unit]] = field(default=None, repr=False)
+    path: Optional[str] = None
+    # Directory local includes are resolved from
+    base_dir: Optional[str] = None
+    # Preprocessing result; unit offsets are into pre.code
+    pre: Optional[Preprocessed] = field(default=None, repr=False)
+
+    def structure(self) -> Dict[str, Any]:
+        return assemble_structure([u.fragment for u in self.units], self.filename, self.pre)
+
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _extract_units(code: str, offset: int = 0, reuse: Optional[Dict] = None) -> Tuple[List[Unit], bool]:
+    """Split code into units, reusing fragments whose text is unchanged."""
+    with stage("lex"):
+        index = BlockIndex(code)
+        spans = split_units(index)
+    units = []
+    for start, end, block in spans:
+        kind = block.kind if block else None
+        name = block.name if block else None
+        digest = _digest(code[start:end])
+        previous = reuse.get((kind, name, digest)) if reuse else None
+        fragment = previous.fragment if previous else extract_fragment(index, start, end, block)
+        units.append(Unit(start + offset, end + offset, kind, name, digest, fragment))
+    return units, index.balanced
+
+
+def build_program(source: str, filename: str, base_dir: Optional[str] = None) -> ParsedProgram:
+    """Fully parse a source into units."""
+    pre = preprocess_source(source, base_dir)
+    units, _ = _extract_units(pre.code)
+    return ParsedProgram(source, filename, units, base_dir=base_dir, pre=pre)
+
+
+def load_program(path: str, filename: str, parse_id: str) -> Optional[ParsedProgram]:
+    """Build a program from a saved upload if the file still matches parse_id."""
+    try:
+        source = read_source(path)
+    except (OSError, UnicodeDecodeError):
+        return None
+    if cache_key(source.encode("utf-8")) != source_key_of(parse_id):
+        # Overwritten by a later upload with the same filename
+        return None
+    # Uploads share a directory, so it is not an include root
+    return build_program(source, filename)
+
+
+def apply_edits(source: str, edits: List[Dict[str, Any]]) -> Tuple[str, int, int, int]:
+    """Apply text edits given as {"start", "end", "text"} offsets into source.
+
+    Returns the new source and the changed range as (lo, hi) in the old
+    source and new_hi, the end of that range in the new source.
+    """
+    if not edits:
+        return source, 0, 0, 0
+    edits = sorted(edits, key=lambda e: (e["start"], e["end"]))
+    pieces = []
+    pos = 0
+    for edit in edits:
+        start, end = edit["start"], edit["end"]
+        if not 0 <= start <= end <= len(source) or start < pos:
+            raise InvalidEdit(f"Edit range {start}-{end} is out of bounds or overlaps another edit")
+        pieces.append(source[pos:start])
+        pieces.append(edit["text"])
+        pos = end
+    pieces.append(source[pos:])
+    new_source = "".join(pieces)
+    lo = edits[0]["start"]
+    hi = max(e["end"] for e in edits)
+    return new_source, lo, hi, hi + len(new_source) - len(source)
+
+
+def changed_range(old: str, new: str) -> Tuple[int, int, int]:
+    """Return (lo, hi, new_hi) bounding the difference between two sources."""
+    limit = min(len(old), len(new))
+    lo = 0
+    while lo < limit:
+        step = min(_COMPARE_CHUNK, limit - lo)
+        if old[lo:lo + step] == new[lo:lo + step]:
+            lo += step
+            continue
+        while old[lo] == new[lo]:
+            lo += 1
+        break
+
+    # Common suffix, not overlapping the common prefix
+    limit -= lo
+    suffix = 0
+    while suffix < limit:
+        step = min(_COMPARE_CHUNK, limit - suffix)
+        if old[len(old) - suffix - step:len(old) - suffix] == new[len(new) - suffix - step:len(new) - suffix]:
+            suffix += step
+            continue
+        while old[len(old) - suffix - 1] == new[len(new) - suffix - 1]:
+            suffix += 1
+        break
+    return lo, len(old) - suffix, len(new) - suffix
+
+
+def unit_changes(old_units: List[Unit], new_units: List[Unit]) -> Dict[str, Any]:
+    """Report blocks added, removed or modified between two unit lists."""
+    old_blocks = {(u.kind, u.name): u.digest for u in old_units if u.kind}
+    new_blocks = {(u.kind, u.name): u.digest for u in new_units if u.kind}
+    old_global = [u.digest for u in old_units if not u.kind]
+    new_global = [u.digest for u in new_units if not u.kind]
+
+    def entries(keys) -> List[Dict[str, str]]:
+        return [{"kind": kind, "name": name} for kind, name in keys]
+
+    return {
+        "added": entries(k for k in new_blocks if k not in old_blocks),
+        "removed": entries(k for k in old_blocks if k not in new_blocks),
+        "modified": entries(
+            k for k in new_blocks if k in old_blocks and old_blocks[k] != new_blocks[k]
+        ),
+        "globals_changed": old_global != new_global,
+    }
+
+
+def reparse(program: ParsedProgram, new_source: str) -> Tuple[ParsedProgram, Dict[str, Any]]:
+    """Re-parse only the units of program touched by the edit to new_source.
+
+    Comments, directives and macros can move the edit, so its range is taken
+    from the preprocessed texts rather than from the submitted edits.
+    """
+    units = program.units
+    if not units:
+        new_program = build_program(new_source, program.filename, program.base_dir)
+        return new_program, {**unit_changes([], new_program.units), "reparsed_bytes": len(new_source)}
+
+    pre = preprocess_source(new_source, program.base_dir)
+    new_code = pre.code
+    lo, hi, new_hi = changed_range(program.pre.code, new_code)
+    delta = new_hi - hi
+
+    # Units touching the edit, including neighbours sharing a boundary with it
+    first = next((i for i, u in enumerate(units) if u.end >= lo), len(units) - 1)
+    last = first
+    while last + 1 < len(units) and units[last + 1].start <= hi:
+        last += 1
+
+    # Widen the window until the re-lexed region has balanced braces
+    width = 1
+    while True:
+        region_start = units[first].start
+        region_end = units[last].end + delta
+        reuse = {(u.kind, u.name, u.digest): u for u in units[first:last + 1]}
+        region_units, balanced = _extract_units(
+            new_code[region_start:region_end], region_start, reuse
+        )
+        if balanced or (first == 0 and last == len(units) - 1):
+            break
+        first = max(0, first - width)
+        last = min(len(units) - 1, last + width)
+        width *= 2
+
+    tail = [
+        Unit(u.start + delta, u.end + delta, u.kind, u.name, u.digest, u.fragment)
+        for u in units[last + 1:]
+    ]
+    new_program = ParsedProgram(
+        new_source, program.filename, units[:first] + region_units + tail,
+        base_dir=program.base_dir, pre=pre,
+    )
+    changes = unit_changes(units[first:last + 1], region_units)
+    changes["reparsed_bytes"] = region_end - region_start
+    changes["reused_units"] = len(new_program.units) - len(region_units) + sum(
+        1 for u in region_units if (u.kind, u.name, u.digest) in reuse
+    )
+    return new_program, changes
+
+
+class ProgramStore(LRU[ParsedProgram]):
+    """LRU of parsed programs by parse ID, kept for incremental re-parsing."""
+
+    def remember(
+        self,
+        parse_id: str,
+        filename: str,
+        source: Optional[str] = None,
+        path: Optional[str] = None,
+        base_dir: Optional[str] = None,
+    ) -> None:
+        """Record a source, or the file holding it, without replacing a built program."""
+        self.add(parse_id, ParsedProgram(source, filename, path=path, base_dir=base_dir))
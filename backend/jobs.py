@@ -0,0 +1,181 @@
+"""In-process store of asynchronous parse and export jobs.
+
+A job records its status, an append-only list of progress events and, once
+finished, its result or error. Events come from the API process (upload,
+queued, results) and from worker processes through the pool's progress
+queue; followers of /jobs/{id}/events are woken on every new event. Finished
+jobs are evicted after a TTL, so no external broker or database is needed.
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from metrics import timed
+from worker_pool import report_progress
+
+# Job ID of the job the running task works for, read by run_timed
+current_job: ContextVar[Optional[str]] = ContextVar("p4lens_job", default=None)
+
+# Pipeline stages grouped into the phases reported to clients
+PHASES = {
+    "read": "upload",
+    "preprocess": "tokenise",
+    "lex": "tokenise",
+    "globals": "tokenise",
+    "headers": "tokenise",
+    "enums": "tokenise",
+    "tables": "tables",
+    "actions": "controls",
+    "apply_logic": "controls",
+    "parser_states": "parser",
+    "parser_graph": "parser",
+    "assemble": "assemble",
+    "table_rows": "export",
+    "apply_rows": "export",
+    "action_rows": "export",
+    "save": "export",
+}
+
+FINISHED = ("done", "failed")
+
+
+def timed_job(job_id: str, fn: Callable, *args) -> Tuple[Any, Dict[str, Any]]:
+    """timed() for a worker, reporting each stage as the job enters it."""
+    def listener(name: str) -> None:
+        report_progress(job_id, {"stage": name, "phase": PHASES.get(name, name)})
+
+    return timed(fn, *args, listener=listener)
+
+
+class Job:
+    def __init__(self, kind: str, filename: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filename = filename
+        self.status = "queued"
+        self.created = self.updated = time.time()
+        self.events: List[Dict[str, Any]] = []
+        self.result: Any = None
+        self.error: Optional[Tuple[int, Any]] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        self.events.append({"event": event, "data": data, "time": time.time()})
+        self.updated = time.time()
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def start(self) -> None:
+        self.status = "running"
+        self.publish("status", {"status": self.status})
+
+    def finish(self, result: Any, summary: Dict[str, Any]) -> None:
+        self.result = result
+        self.status = "done"
+        self.publish("done", summary)
+
+    def fail(self, status_code: int, detail: Any) -> None:
+        self.error = (status_code, detail)
+        self.status = "failed"
+        self.publish("failed", {"status_code": status_code, "detail": detail})
+
+    def info(self) -> Dict[str, Any]:
+        info = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "filename": self.filename,
+            "status": self.status,
+            "created": self.created,
+            "updated": self.updated,
+            "stage": next(
+                (e["data"]["stage"] for e in reversed(self.events) if e["event"] == "stage"), None
+            ),
+        }
+        if self.error is not None:
+            info["error"] = {"status_code": self.error[0], "detail": self.error[1]}
+        return info
+
+    async def follow(
+        self, heartbeat: float, start: int = 0
+    ) -> AsyncIterator[Optional[Tuple[int, Dict[str, Any]]]]:
+        """Yield (index, event) for events from start on until the job finishes.
+
+        Yields None after heartbeat seconds without an event.
+        """
+        sent = start
+        while True:
+            changed = self._changed
+            while sent < len(self.events):
+                yield sent, self.events[sent]
+                sent += 1
+            if self.status in FINISHED:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+
+class JobStore:
+    """Jobs by ID; finished jobs are dropped ttl seconds after their last event."""
+
+    def __init__(self, ttl: float, max_jobs: int):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.evictions = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Set the event loop that progress from worker threads is handed to."""
+        self._loop = loop
+
+    def create(self, kind: str, filename: Optional[str] = None) -> Optional[Job]:
+        """Add a new job, or return None when max_jobs are still unfinished."""
+        with self._lock:
+            self._evict(room=1)
+            if len(self._jobs) >= self.max_jobs:
+                return None
+            job = Job(kind, filename)
+            self._jobs[job.id] = job
+            return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def progress(self, job_id: str, event: Dict[str, Any]) -> None:
+        """Record a worker's progress event; safe to call from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._publish_stage, job_id, event)
+
+    def _publish_stage(self, job_id: str, event: Dict[str, Any]) -> None:
+        job = self._jobs.get(job_id)
+        if job is not None and job.status not in FINISHED:
+            job.publish("stage", event)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_status: Dict[str, int] = {}
+            for job in self._jobs.values():
+                by_status[job.status] = by_status.get(job.status, 0) + 1
+            return {"jobs": len(self._jobs), "evictions": self.evictions, **by_status}
+
+    def _evict(self, room: int = 0) -> None:
+        """Drop expired finished jobs, then the oldest finished ones to make room."""
+        cutoff = time.time() - self.ttl
+        finished = [j for j in self._jobs.values() if j.status in FINISHED]
+        overflow = len(self._jobs) + room - self.max_jobs
+        for job in finished:
+            if job.updated < cutoff or overflow > 0:
+                del self._jobs[job.id]
+                self.evictions += 1
+                overflow -= 1
@@ -0,0 +1,48 @@
+"""Thread-safe LRU map for state kept in memory per parse ID.
+
+Stores of per-parse state subclass LRU to name what they hold and add their
+own helpers.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+class LRU(Generic[V]):
+    """Map of up to max_entries values, evicting the least recently used."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, V]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: V) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def add(self, key: Hashable, value: V) -> bool:
+        """Store value unless key is present; either way key becomes most recent.
+
+        Returns whether value was stored.
+        """
+        with self._lock:
+            added = key not in self._entries
+            if added:
+                self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return added
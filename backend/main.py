@@ -1,20 +1,101 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from parser_utils import parse_p4_structure
+from fastapi.responses import (
+    FileResponse, JSONResponse, ORJSONResponse, PlainTextResponse, Response, StreamingResponse
+)
+from parser_utils import parse_file_with_deps, parse_source_with_deps
+from parse_cache import ParseCache, cache_key, digest_key, parse_key
+from coalesce import Coalescer
+from export_utils import write_excel_export
+from artifact_store import ArtifactStore, export_key
+from worker_pool import WorkerPool, PoolSaturated, JobTimeout
+from batch_utils import BatchTooLarge, is_archive, read_archive
+from incremental import (
+    InvalidEdit, ParsedProgram, ProgramStore, apply_edits, build_program, changed_range, load_program,
+    reparse, unit_changes
+)
+from metrics import (
+    EXPORTS_TOTAL, PARSE_INPUT_BYTES, PARSES_TOTAL, REGISTRY, format_timings, record_job,
+    render_gauges, timed
+)
+from model import ParserBlock, dumps
+from parser_graph import enumerate_paths
+from header_layout import packed_extracts
+from jobs import Job, JobStore, current_job, timed_job
+from xref import RELATIONS, IndexStore, XrefIndex, build_index
+from diff import FingerprintStore, Fingerprints, diff_structures
+from pipeline import build_pipelines, control_pipeline
+from sections import (
+    SECTIONS, InvalidSelection, block_actions, entities, etag, matches, page, parse_fields, select,
+    summary
+)
+from warmup import warm_up
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+import settings
 import os
+import uuid
+import time
+import hashlib
+import shutil
+import asyncio
 import logging
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
-import tempfile
-from typing import Dict, Any
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, Tuple
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="P4Lens API", version="1.0.0")
+export_store = ArtifactStore(
+    root=settings.EXPORT_DIR,
+    max_bytes=settings.EXPORT_CACHE_MAX_BYTES,
+    ttl=settings.EXPORT_CACHE_TTL,
+)
+
+job_store = JobStore(ttl=settings.JOB_TTL, max_jobs=settings.JOB_MAX)
+
+worker_pool = WorkerPool(
+    max_workers=settings.WORKER_PROCESSES,
+    max_pending=settings.WORKER_MAX_PENDING,
+    timeout=settings.JOB_TIMEOUT,
+    on_progress=job_store.progress,
+    warm=warm_up if settings.WARMUP else None,
+)
+
+# Seconds spent warming up at startup, for /metrics
+startup_timings: Dict[str, float] = {}
+
+
+async def warm_start() -> None:
+    """Warm up this process and every worker before serving requests."""
+    start = time.perf_counter()
+    await asyncio.to_thread(warm_up)
+    startup_timings["api"] = time.perf_counter() - start
+    start = time.perf_counter()
+    try:
+        workers = await worker_pool.prestart()
+    except Exception as e:
+        logger.error(f"Worker warm-up failed: {e}")
+        return
+    startup_timings["workers"] = time.perf_counter() - start
+    logger.info(
+        f"Warm start: API process {startup_timings['api']:.3f}s, "
+        f"{len(workers)} workers {startup_timings['workers']:.3f}s"
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_store.bind(asyncio.get_running_loop())
+    worker_pool.start()
+    if settings.WARMUP:
+        await warm_start()
+    yield
+    worker_pool.shutdown()
+
+
+app = FastAPI(title="P4Lens API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,9 +104,275 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-UPLOAD_DIR = "uploads"
+# Room for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject oversized single-file uploads before their body is read."""
+    if request.url.path == "/upload":
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > settings.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"File exceeds {settings.MAX_UPLOAD_BYTES} bytes."}
+            )
+    return await call_next(request)
+
+UPLOAD_DIR = settings.UPLOAD_DIR
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+parse_cache = ParseCache(
+    max_entries=settings.PARSE_CACHE_SIZE,
+    db_path=settings.PARSE_CACHE_DB,
+    db_max_entries=settings.PARSE_CACHE_DB_SIZE,
+)
+
+# Concurrent parses of one source, in this process or another API worker
+# sharing the sqlite file, run once. A lease outlives the longest parse.
+coalescer = Coalescer(parse_cache, lease_ttl=settings.JOB_TIMEOUT * 2, poll=settings.COALESCE_POLL)
+
+program_store = ProgramStore(max_entries=settings.PROGRAM_STORE_SIZE)
+
+index_store = IndexStore(max_entries=settings.XREF_STORE_SIZE)
+
+fingerprint_store = FingerprintStore(max_entries=settings.DIFF_STORE_SIZE)
+
+async def run_job(fn, *args):
+    """Run a CPU-bound job in the worker pool, mapping pool errors to HTTP."""
+    try:
+        return await worker_pool.run(fn, *args)
+    except PoolSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please retry shortly.",
+            headers={"Retry-After": str(settings.RETRY_AFTER)}
+        )
+    except JobTimeout:
+        raise HTTPException(
+            status_code=504,
+            detail=f"Processing took longer than {settings.JOB_TIMEOUT:g}s and was stopped."
+        )
+
+async def run_timed(pipeline: str, fn, *args) -> Tuple[Any, Dict[str, Any]]:
+    """Run a job with per-stage timing; record it and return (result, timings)."""
+    start = time.perf_counter()
+    job_id = current_job.get()
+    if job_id is not None:
+        result, report = await run_job(timed_job, job_id, fn, *args)
+    else:
+        result, report = await run_job(timed, fn, *args)
+    record_job(pipeline, report, time.perf_counter() - start)
+    return result, report
+
+def check_structure(structure: Dict[str, Any]) -> None:
+    """Reject parses that found no parser, control or deparser blocks."""
+    if not structure or len([k for k in structure.keys() if not k.startswith("_")]) == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="Could not parse P4 structure. File may be invalid or empty."
+        )
+
+async def parse_source(
+    filename: str, content: bytes
+) -> Tuple[str, Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Parse in-memory P4 source through the parse cache and worker pool.
+
+    Returns the parse ID (the cache key), the structure and the stage timings
+    (None on a cache hit).
+    """
+    # Basic validation - check if file is not empty
+    if not content:
+        raise HTTPException(
+            status_code=400,
+            detail="Uploaded file is empty."
+        )
+    
+    try:
+        code = content.decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=400,
+            detail="File is not valid UTF-8 text."
+        )
+    
+    # Byte-identical sources skip the parse while their includes are unchanged
+    key = cache_key(content)
+    cached = await asyncio.to_thread(parse_cache.get_source, key)
+    if cached is not None:
+        parse_id, structure = cached
+        logger.info(f"Parse cache hit for {filename}")
+        PARSES_TOTAL.inc(result="cache_hit")
+        program_store.remember(parse_id, filename, source=code)
+        return parse_id, {**structure, "_filename": filename}, None
+    
+    async def parse():
+        logger.info(f"Processing P4 file: {filename}")
+        PARSE_INPUT_BYTES.observe(len(content))
+        (structure, deps), timings = await run_timed(
+            "parse", parse_source_with_deps, code, filename
+        )
+        check_structure(structure)
+        parse_id = parse_key(key, deps)
+        await asyncio.to_thread(parse_cache.put, parse_id, structure, key, deps)
+        return parse_id, structure, timings
+    
+    (parse_id, structure, timings), ran = await coalescer.run(key, parse)
+    program_store.remember(parse_id, filename, source=code)
+    if not ran:
+        logger.info(f"Parse of {filename} shared with a concurrent request")
+        PARSES_TOTAL.inc(result="coalesced")
+        return parse_id, {**structure, "_filename": filename}, None
+    PARSES_TOTAL.inc(result="parsed")
+    logger.info(f"Successfully parsed {filename}")
+    return parse_id, structure, timings
+
+def hash_received(upload: UploadFile) -> Tuple[str, int]:
+    """Hash a received upload where it is spooled, enforcing the size limit.
+
+    Returns the SHA-256 hex digest and size. Blocks on file reads, so async
+    code runs it in a thread.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    upload.file.seek(0)
+    while True:
+        chunk = upload.file.read(settings.UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > settings.MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File exceeds {settings.MAX_UPLOAD_BYTES} bytes."
+            )
+        digest.update(chunk)
+    return digest.hexdigest(), size
+
+def copy_received(upload: UploadFile, dest: str) -> None:
+    """Copy a received upload to dest in chunks; blocks like hash_received."""
+    upload.file.seek(0)
+    with open(dest, "wb") as f:
+        shutil.copyfileobj(upload.file, f, settings.UPLOAD_CHUNK_SIZE)
+
+async def save_upload(upload: UploadFile, dest: str) -> Tuple[str, int]:
+    """Copy an upload to dest, returning its SHA-256 hex digest and size."""
+    digest, size = await asyncio.to_thread(hash_received, upload)
+    await asyncio.to_thread(copy_received, upload, dest)
+    return digest, size
+
+async def parse_upload(
+    upload: UploadFile, save_path: str
+) -> Tuple[str, Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Parse an upload from disk in the worker pool, keeping it at save_path.
+
+    The upload is hashed where it is spooled and only written to disk when
+    the file is needed. The body is never held in memory as a whole; the
+    worker maps the saved file and decodes it once. Returns the same triple
+    as parse_source.
+    """
+    # Parse a private copy so concurrent uploads with the same name cannot mix
+    temp_path = f"{save_path}.{uuid.uuid4().hex}.part"
+    try:
+        digest, size = await asyncio.to_thread(hash_received, upload)
+        return await parse_saved(temp_path, save_path, upload.filename, digest, size, upload)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+async def parse_saved(
+    temp_path: str,
+    save_path: str,
+    filename: str,
+    digest: str,
+    size: int,
+    upload: Optional[UploadFile] = None,
+) -> Tuple[str, Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Parse an upload saved to temp_path by save_upload, then move it to save_path.
+
+    With upload, temp_path has not been written yet. It is copied from the
+    upload only on a cache miss, or on a hit for a program /reparse has no
+    source for.
+    """
+    if size == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="Uploaded file is empty."
+        )
+    
+    # Byte-identical uploads skip the parse while their includes are unchanged
+    key = digest_key(digest)
+    cached = await asyncio.to_thread(parse_cache.get_source, key)
+    if cached is not None:
+        parse_id, structure = cached
+        logger.info(f"Parse cache hit for {filename}")
+        PARSES_TOTAL.inc(result="cache_hit")
+        if program_store.get(parse_id) is None:
+            if upload is not None:
+                await asyncio.to_thread(copy_received, upload, temp_path)
+            os.replace(temp_path, save_path)
+            program_store.remember(parse_id, filename, path=save_path)
+        return parse_id, {**structure, "_filename": filename}, None
+    
+    if upload is not None:
+        await asyncio.to_thread(copy_received, upload, temp_path)
+    
+    async def parse():
+        logger.info(f"Processing P4 file: {filename}")
+        PARSE_INPUT_BYTES.observe(size)
+        try:
+            (structure, deps), timings = await run_timed(
+                "parse", parse_file_with_deps, temp_path, filename
+            )
+        except UnicodeDecodeError:
+            raise HTTPException(
+                status_code=400,
+                detail="File is not valid UTF-8 text."
+            )
+        check_structure(structure)
+        parse_id = parse_key(key, deps)
+        await asyncio.to_thread(parse_cache.put, parse_id, structure, key, deps)
+        return parse_id, structure, timings
+    
+    (parse_id, structure, timings), ran = await coalescer.run(key, parse)
+    os.replace(temp_path, save_path)
+    program_store.remember(parse_id, filename, path=save_path)
+    if not ran:
+        logger.info(f"Parse of {filename} shared with a concurrent request")
+        PARSES_TOTAL.inc(result="coalesced")
+        return parse_id, {**structure, "_filename": filename}, None
+    PARSES_TOTAL.inc(result="parsed")
+    logger.info(f"Successfully parsed {filename}")
+    return parse_id, structure, timings
+
+async def export_structure(structure: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Return the stored workbook of a structure, generating it on a miss.
+
+    Returns the file path and the export timings (None when it was stored).
+    """
+    key = export_key(structure)
+    excel_path = export_store.get(key)
+    report = None
+    if excel_path is None:
+        temp_path = export_store.temp_path(key)
+        try:
+            _, report = await run_timed("export", write_excel_export, structure, temp_path)
+        except BaseException:
+            export_store.discard(temp_path)
+            raise
+        excel_path = export_store.add(key, temp_path)
+    EXPORTS_TOTAL.inc(result="generated" if report else "cache_hit")
+    return excel_path, report
+
+def export_response(excel_path: str, filename: str, headers: Dict[str, str]) -> FileResponse:
+    return FileResponse(
+        excel_path,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        filename=f"{filename.replace('.p4', '')}_rules.xlsx",
+        headers=headers
+    )
+
 @app.get("/")
 async def root():
     return {"message": "P4Lens API is running", "version": "1.0.0"}
@@ -34,8 +381,30 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    return {"parse": await asyncio.to_thread(parse_cache.stats), "exports": export_store.stats()}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for the parse and export pipelines."""
+    parse_stats = await asyncio.to_thread(parse_cache.stats)
+    body = REGISTRY.render()
+    body += render_gauges("p4lens_parse_cache", "Parse cache counters", "stat", parse_stats)
+    body += render_gauges("p4lens_export_store", "Export store counters", "stat", export_store.stats())
+    body += render_gauges("p4lens_jobs", "Asynchronous jobs by status", "stat", job_store.stats())
+    body += render_gauges(
+        "p4lens_warmup_seconds", "Seconds spent warming up at startup", "step", startup_timings
+    )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 @app.post("/upload")
-async def upload_p4(file: UploadFile = File(...)):
+async def upload_p4(
+    file: UploadFile = File(...),
+    timings: bool = False,
+    view: str = Query("summary", pattern="^(summary|full)$"),
+):
+    """Parse a P4 file; return a summary of it, or with view=full the whole structure."""
     # Validate file extension
     if not file.filename.endswith(".p4"):
         raise HTTPException(
@@ -44,33 +413,18 @@ async def upload_p4(file: UploadFile = File(...)):
         )
     
     try:
-        # Save file
         path = os.path.join(UPLOAD_DIR, file.filename)
-        content = await file.read()
-        
-        # Basic validation - check if file is not empty
-        if not content:
-            raise HTTPException(
-                status_code=400,
-                detail="Uploaded file is empty."
-            )
-        
-        with open(path, "wb") as f:
-            f.write(content)
-        
-        logger.info(f"Processing P4 file: {file.filename}")
-        
-        # Parse structure
-        structure = parse_p4_structure(path)
-        
-        if not structure or len([k for k in structure.keys() if not k.startswith("_")]) == 0:
-            raise HTTPException(
-                status_code=400,
-                detail="Could not parse P4 structure. File may be invalid or empty."
-            )
-        
-        logger.info(f"Successfully parsed {file.filename}")
-        return {"filename": file.filename, "structure": structure}
+        parse_id, structure, report = await parse_upload(file, path)
+        headers = {}
+        if timings:
+            headers["X-Parse-Timings"] = format_timings(report) if report else "cache_hit"
+        body = {"filename": file.filename, "parse_id": parse_id}
+        if view == "full":
+            body["structure"] = structure
+        else:
+            body["summary"] = summary(structure)
+        # Returned as a response so orjson encodes the model objects directly
+        return ORJSONResponse(body, headers=headers)
         
     except HTTPException:
         raise
@@ -82,210 +436,409 @@ async def upload_p4(file: UploadFile = File(...)):
         )
 
 
-def create_excel_export(structure: dict, filename: str) -> str:
-    """Create Excel file with P4 rules and installation tables."""
-    wb = Workbook()
-    
-    # Remove default sheet
-    wb.remove(wb.active)
-    
-    # Define styles
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    title_font = Font(bold=True, size=14)
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # Sheet 1: Tables Overview
-    ws_tables = wb.create_sheet("Tables & Rules")
-    ws_tables.append(["P4 Tables and Match-Action Rules"])
-    ws_tables.merge_cells('A1:F1')
-    ws_tables['A1'].font = title_font
-    ws_tables['A1'].alignment = Alignment(horizontal='center', vertical='center')
-    
-    ws_tables.append([])
-    headers = ["Table Name", "Match Keys", "Match Type", "Actions", "Size", "Default Action"]
-    ws_tables.append(headers)
-    
-    # Style header row
-    for col in range(1, len(headers) + 1):
-        cell = ws_tables.cell(row=3, column=col)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        cell.border = border
-    
-    tables = structure.get("_tables", {})
-    for table_name, table_info in tables.items():
-        keys = table_info.get("keys", [])
-        actions = table_info.get("actions", [])
-        size = table_info.get("size", "N/A")
-        default_action = table_info.get("default_action", "N/A")
-        
-        # Parse match types from keys
-        match_types = []
-        key_names = []
-        for key in keys:
-            if ":" in key:
-                parts = key.split(":")
-                key_names.append(parts[0].strip())
-                match_types.append(parts[1].strip() if len(parts) > 1 else "exact")
+@app.post("/upload-batch")
+async def upload_batch(files: List[UploadFile] = File(...)):
+    """Parse many .p4 files (or zip/tar archives of them), streaming NDJSON results."""
+    sources = []
+    total_bytes = 0
+    for upload in files:
+        max_files = settings.BATCH_MAX_FILES - len(sources)
+        max_bytes = settings.BATCH_MAX_BYTES - total_bytes
+        try:
+            if is_archive(upload.filename):
+                members = await asyncio.to_thread(
+                    read_archive, upload.file, upload.filename, max_files, max_bytes
+                )
             else:
-                key_names.append(key.strip())
-                match_types.append("exact")
-        
-        row = [
-            table_name,
-            "\n".join(key_names) if key_names else "None",
-            "\n".join(match_types) if match_types else "N/A",
-            "\n".join(actions) if actions else "None",
-            size,
-            default_action
-        ]
-        ws_tables.append(row)
-        
-        # Add borders to data rows
-        for col in range(1, len(row) + 1):
-            cell = ws_tables.cell(row=ws_tables.max_row, column=col)
-            cell.border = border
-            cell.alignment = Alignment(wrap_text=True, vertical='top')
-    
-    # Adjust column widths
-    ws_tables.column_dimensions['A'].width = 20
-    ws_tables.column_dimensions['B'].width = 30
-    ws_tables.column_dimensions['C'].width = 15
-    ws_tables.column_dimensions['D'].width = 25
-    ws_tables.column_dimensions['E'].width = 10
-    ws_tables.column_dimensions['F'].width = 20
-    
-    # Sheet 2: Apply Block Logic
-    ws_apply = wb.create_sheet("Apply Block Logic")
-    ws_apply.append(["Control Block Apply Logic - Main Function Blocks"])
-    ws_apply.merge_cells('A1:D1')
-    ws_apply['A1'].font = title_font
-    ws_apply['A1'].alignment = Alignment(horizontal='center', vertical='center')
+                content = await upload.read()
+                if max_files < 1 or len(content) > max_bytes:
+                    raise BatchTooLarge(
+                        f"Batch exceeds {settings.BATCH_MAX_FILES} files "
+                        f"or {settings.BATCH_MAX_BYTES} bytes"
+                    )
+                members = [(upload.filename, content)]
+        except BatchTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Could not read {upload.filename}: {str(e)}"
+            )
+        sources.extend(members)
+        total_bytes += sum(len(content) for _, content in members)
     
-    ws_apply.append([])
-    headers_apply = ["Control Block", "Condition", "Tables Applied", "Logic Flow"]
-    ws_apply.append(headers_apply)
+    if not sources:
+        raise HTTPException(
+            status_code=400,
+            detail="No .p4 files found in the upload."
+        )
     
-    # Style header row
-    for col in range(1, len(headers_apply) + 1):
-        cell = ws_apply.cell(row=3, column=col)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        cell.border = border
+    # Keep this batch from claiming more pool slots than there are workers
+    slots = asyncio.Semaphore(settings.WORKER_PROCESSES)
     
-    # Extract control blocks and their apply logic
-    for name, info in structure.items():
-        if not name.startswith("_") and info.get("type") == "control":
-            apply_logic = info.get("apply_logic", {})
-            conditions = apply_logic.get("conditions", [])
-            tables_applied = apply_logic.get("tables_applied", [])
-            logic = apply_logic.get("logic", [])
-            
-            if conditions:
-                for cond in conditions:
-                    row = [
-                        name,
-                        cond.get("condition", "N/A"),
-                        ", ".join(tables_applied) if tables_applied else "None",
-                        "\n".join(logic) if logic else "No logic"
-                    ]
-                    ws_apply.append(row)
-            else:
-                # Direct table applications
-                row = [
-                    name,
-                    "Always (no condition)",
-                    ", ".join(tables_applied) if tables_applied else "None",
-                    "\n".join(logic) if logic else "No logic"
-                ]
-                ws_apply.append(row)
-            
-            # Add borders
-            for col in range(1, len(headers_apply) + 1):
-                cell = ws_apply.cell(row=ws_apply.max_row, column=col)
-                cell.border = border
-                cell.alignment = Alignment(wrap_text=True, vertical='top')
+    async def parse_one(filename: str, content: bytes) -> Dict[str, Any]:
+        if not filename.endswith(".p4"):
+            return {"filename": filename, "status": "error", "status_code": 400,
+                    "detail": "Invalid file type. Please upload a .p4 file."}
+        try:
+            async with slots:
+                parse_id, structure, _ = await parse_source(filename, content)
+            return {"filename": filename, "status": "ok", "parse_id": parse_id,
+                    "structure": structure}
+        except HTTPException as e:
+            return {"filename": filename, "status": "error", "status_code": e.status_code,
+                    "detail": e.detail}
+        except Exception as e:
+            logger.error(f"Error processing {filename}: {str(e)}")
+            return {"filename": filename, "status": "error", "status_code": 500,
+                    "detail": f"Error parsing P4 file: {str(e)}"}
     
-    ws_apply.column_dimensions['A'].width = 20
-    ws_apply.column_dimensions['B'].width = 40
-    ws_apply.column_dimensions['C'].width = 30
-    ws_apply.column_dimensions['D'].width = 50
+    async def results():
+        tasks = [asyncio.create_task(parse_one(name, content)) for name, content in sources]
+        ok = 0
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                ok += result["status"] == "ok"
+                yield dumps(result) + b"\n"
+            yield dumps({"done": True, "files": len(tasks), "ok": ok,
+                         "errors": len(tasks) - ok}) + b"\n"
+        finally:
+            for task in tasks:
+                task.cancel()
     
-    # Sheet 3: Actions
-    ws_actions = wb.create_sheet("Actions")
-    ws_actions.append(["Action Definitions"])
-    ws_actions.merge_cells('A1:E1')
-    ws_actions['A1'].font = title_font
-    ws_actions['A1'].alignment = Alignment(horizontal='center', vertical='center')
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+class TextEdit(BaseModel):
+    start: int
+    end: int
+    text: str = ""
+
+
+class ReparseRequest(BaseModel):
+    parse_id: str
+    source: Optional[str] = None
+    edits: Optional[List[TextEdit]] = None
+    filename: Optional[str] = None
+    include_structure: bool = False
+
+
+def require_single_worker(feature: str) -> None:
+    """Refuse a feature whose state lives in one API worker's memory.
+
+    With several API workers, a follow-up request may reach a worker that
+    never saw the job or program, so the feature is disabled rather than
+    answering 404 at random.
+    """
+    if settings.API_WORKERS > 1:
+        raise HTTPException(
+            status_code=501,
+            detail=f"{feature} is not available with {settings.API_WORKERS} API workers. "
+                   "Run the server with P4LENS_API_WORKERS=1 to use it."
+        )
+
+
+def reparse_result(program: ParsedProgram, source: str) -> Tuple[Dict[str, Any], str]:
+    """Assemble a re-parsed program's structure and the cache key of its source.
+
+    Both take time proportional to the whole file, so async code runs this in
+    a thread.
+    """
+    return program.structure(), cache_key(source.encode("utf-8"))
+
+
+@app.post("/reparse")
+async def reparse_p4(request: ReparseRequest, timings: bool = False):
+    """Re-parse a new revision of an uploaded program, reusing unchanged blocks."""
+    require_single_worker("/reparse")
+    if (request.source is None) == (request.edits is None):
+        raise HTTPException(
+            status_code=400,
+            detail="Provide either the full new source or a list of edits."
+        )
+    program = program_store.get(request.parse_id)
+    if program is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Unknown parse ID. Upload the full program again."
+        )
     
-    ws_actions.append([])
-    headers_actions = ["Control Block", "Action Name", "Parameters", "Operations", "Description"]
-    ws_actions.append(headers_actions)
+    if program.units is None:
+        if program.source is None:
+            program = await run_job(load_program, program.path, program.filename, request.parse_id)
+        else:
+            program = await run_job(
+                build_program, program.source, program.filename, program.base_dir
+            )
+        if program is None:
+            raise HTTPException(
+                status_code=404,
+                detail="Source for this parse ID is no longer available. Upload the full program again."
+            )
+        program_store.put(request.parse_id, program)
     
-    # Style header row
-    for col in range(1, len(headers_actions) + 1):
-        cell = ws_actions.cell(row=3, column=col)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        cell.border = border
+    try:
+        if request.edits is not None:
+            new_source, lo, hi, new_hi = apply_edits(
+                program.source, [edit.model_dump() for edit in request.edits]
+            )
+        else:
+            new_source = request.source
+            lo, hi, new_hi = changed_range(program.source, new_source)
+    except InvalidEdit as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    for name, info in structure.items():
-        if not name.startswith("_") and info.get("type") == "control":
-            actions = info.get("actions", [])
-            for action in actions:
-                params = action.get("parameters", [])
-                param_str = ", ".join([f"{p.get('type', '')} {p.get('name', '')}" for p in params])
-                operations = ", ".join(action.get("operations", []))
-                
-                row = [
-                    name,
-                    action.get("name", "N/A"),
-                    param_str if param_str else "None",
-                    operations if operations else "N/A",
-                    action.get("body_preview", "N/A")[:100]
-                ]
-                ws_actions.append(row)
-                
-                # Add borders
-                for col in range(1, len(headers_actions) + 1):
-                    cell = ws_actions.cell(row=ws_actions.max_row, column=col)
-                    cell.border = border
-                    cell.alignment = Alignment(wrap_text=True, vertical='top')
+    # Large rewrites gain little from reuse, so parse them in the worker pool.
+    # Smaller edits are re-parsed incrementally in a thread: reparse() still
+    # preprocesses the whole new source, so it is not cheap enough for the
+    # event loop. The thread cannot be stopped, but the request still gives up
+    # after the job timeout.
+    if new_hi - lo > settings.INCREMENTAL_INLINE_BYTES:
+        new_program, report = await run_timed(
+            "reparse", build_program, new_source, program.filename, program.base_dir
+        )
+        changes = unit_changes(program.units, new_program.units)
+        changes["reparsed_bytes"] = len(new_source)
+        changes["reused_units"] = 0
+    else:
+        try:
+            (new_program, changes), report = await asyncio.wait_for(
+                asyncio.to_thread(timed, reparse, program, new_source),
+                settings.JOB_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=504,
+                detail=f"Processing took longer than {settings.JOB_TIMEOUT:g}s."
+            )
+        record_job("reparse", report, report["total"])
+    PARSES_TOTAL.inc(result="reparsed")
     
-    ws_actions.column_dimensions['A'].width = 20
-    ws_actions.column_dimensions['B'].width = 20
-    ws_actions.column_dimensions['C'].width = 30
-    ws_actions.column_dimensions['D'].width = 25
-    ws_actions.column_dimensions['E'].width = 50
+    structure, source_key = await asyncio.to_thread(reparse_result, new_program, new_source)
+    check_structure(structure)
     
-    # Save to temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-    wb.save(temp_file.name)
-    temp_file.close()
+    deps = new_program.pre.deps
+    parse_id = parse_key(source_key, deps)
+    # The disk tier is written after the response is sent
+    await asyncio.to_thread(parse_cache.put, parse_id, structure, source_key, deps, False)
+    program_store.put(parse_id, new_program)
+    logger.info(
+        f"Re-parsed {program.filename}: {changes['reparsed_bytes']} of "
+        f"{len(new_source)} bytes, {changes['reused_units']} units reused"
+    )
     
-    return temp_file.name
+    headers = {}
+    if timings:
+        headers["X-Parse-Timings"] = format_timings(report)
+    result = {
+        "parse_id": parse_id,
+        "previous_parse_id": request.parse_id,
+        "changes": changes,
+    }
+    if request.include_structure:
+        result["structure"] = {**structure, "_filename": request.filename or program.filename}
+    return ORJSONResponse(
+        result,
+        headers=headers,
+        background=BackgroundTask(parse_cache.persist, parse_id, structure, source_key, deps),
+    )
+
+
+async def get_structure(parse_id: str) -> Dict[str, Any]:
+    """Return the cached structure of a parse, or 404."""
+    structure = await asyncio.to_thread(parse_cache.get, parse_id)
+    if structure is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Unknown parse ID. Upload the program again."
+        )
+    return structure
+
+
+async def get_index(parse_id: str) -> XrefIndex:
+    """Return the cross-reference index of a parse, building it on first use."""
+    index = index_store.get(parse_id)
+    if index is None:
+        index = await asyncio.to_thread(build_index, await get_structure(parse_id))
+        index_store.put(parse_id, index)
+    return index
+
+
+@app.get("/xref/{parse_id}")
+async def xref_summary(parse_id: str):
+    """List the cross-reference relations of a parse and their key counts."""
+    return {"parse_id": parse_id, "relations": (await get_index(parse_id)).summary()}
+
+
+@app.get("/xref/{parse_id}/{relation}")
+async def xref_query(
+    parse_id: str,
+    relation: str,
+    key: Optional[str] = None,
+    prefix: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=10000),
+):
+    """Look up one relation by exact key, by key prefix, or list its keys."""
+    if relation not in RELATIONS:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown relation. Choose one of: {', '.join(RELATIONS)}."
+        )
+    if key is not None and prefix is not None:
+        raise HTTPException(
+            status_code=400,
+            detail="Provide either key or prefix, not both."
+        )
+    index = (await get_index(parse_id)).relations[relation]
+    result = {"parse_id": parse_id, "relation": relation}
+    if key is not None:
+        result["key"] = key
+        result["matches"] = index.get(key) or []
+    elif prefix is not None:
+        result["prefix"] = prefix
+        result["matches"] = index.prefix(prefix, limit)
+    else:
+        result["keys"] = index.keys[:limit]
+        result["total"] = len(index.keys)
+    return ORJSONResponse(result)
+
+
+@app.get("/parsers/{parse_id}/{parser}/paths")
+async def parser_paths(
+    parse_id: str,
+    parser: str,
+    limit: int = Query(100, ge=1, le=10000),
+    max_loop: int = Query(1, ge=0, le=64),
+    layout: bool = False,
+):
+    """Enumerate paths through a parser's state machine and the headers each extracts."""
+    structure = await get_structure(parse_id)
+    block = structure.get(parser)
+    graph = block.graph if isinstance(block, ParserBlock) else None
+    if graph is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No parser named {parser} in this program."
+        )
+    paths, truncated = enumerate_paths(graph, limit=limit, max_loop=max_loop)
+    if layout:
+        layouts = structure.get("_layouts", {})
+        for path in paths:
+            path["layout"] = packed_extracts(path["extracts"], layouts)
+    return ORJSONResponse({
+        "parse_id": parse_id,
+        "parser": parser,
+        "accept_paths": graph.accept_paths,
+        "max_loop": max_loop,
+        "paths": paths,
+        "truncated": truncated,
+    })
+
+
+@app.get("/layouts/{parse_id}")
+async def layouts(parse_id: str):
+    """Packed layouts of every header, header union and struct of a parse."""
+    return ORJSONResponse({
+        "parse_id": parse_id,
+        "layouts": (await get_structure(parse_id)).get("_layouts", {}),
+    })
+
+
+@app.get("/layouts/{parse_id}/{type_name}")
+async def layout(parse_id: str, type_name: str):
+    """Packed layout of one header, header union or struct."""
+    found = (await get_structure(parse_id)).get("_layouts", {}).get(type_name)
+    if found is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No header, header_union or struct named {type_name} in this program."
+        )
+    return ORJSONResponse({"parse_id": parse_id, "type": type_name, "layout": found})
+
+
+@app.get("/pipeline/{parse_id}")
+async def pipelines(parse_id: str):
+    """Table dependencies and stage estimates of every control block."""
+    controls = await asyncio.to_thread(build_pipelines, await get_structure(parse_id))
+    return ORJSONResponse({
+        "parse_id": parse_id,
+        "stages": max((p["stages"] for p in controls.values()), default=0),
+        "controls": controls,
+    })
+
+
+@app.get("/pipeline/{parse_id}/{control}")
+async def pipeline(parse_id: str, control: str):
+    """Table dependencies and stage estimate of one control block."""
+    found = await asyncio.to_thread(control_pipeline, await get_structure(parse_id), control)
+    if found is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No control named {control} in this program."
+        )
+    return ORJSONResponse({"parse_id": parse_id, "control": control, **found})
+
+
+async def get_fingerprints(parse_id: str) -> Fingerprints:
+    """Return the entity fingerprints of a parse, computing them on first use."""
+    fingerprints = fingerprint_store.get(parse_id)
+    if fingerprints is None:
+        fingerprints = await asyncio.to_thread(Fingerprints, await get_structure(parse_id))
+        fingerprint_store.put(parse_id, fingerprints)
+    return fingerprints
+
+
+async def diff_response(base_id: str, head_id: str) -> ORJSONResponse:
+    if base_id == head_id:
+        base = head = await get_fingerprints(base_id)
+    else:
+        base, head = await get_fingerprints(base_id), await get_fingerprints(head_id)
+    diff = await asyncio.to_thread(diff_structures, base, head)
+    return ORJSONResponse({"base": base_id, "head": head_id, **diff})
+
+
+@app.get("/diff/{base_id}/{head_id}")
+async def diff_parses(base_id: str, head_id: str):
+    """Structural diff between two parsed programs, by parse ID."""
+    return await diff_response(base_id, head_id)
+
+
+@app.post("/diff")
+async def diff_uploads(base: UploadFile = File(...), head: UploadFile = File(...)):
+    """Parse two revisions of a program and diff them structurally."""
+    for upload in (base, head):
+        if not upload.filename.endswith(".p4"):
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid file type. Please upload a .p4 file."
+            )
+    try:
+        # Revisions often share a filename, so neither is kept under it
+        base_id, _, _ = await parse_upload(base, os.path.join(UPLOAD_DIR, f"base.{base.filename}"))
+        head_id, _, _ = await parse_upload(head, os.path.join(UPLOAD_DIR, f"head.{head.filename}"))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing {base.filename} / {head.filename}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error parsing P4 file: {str(e)}"
+        )
+    return await diff_response(base_id, head_id)
 
 
 @app.post("/export-excel")
-async def export_excel(structure: Dict[str, Any] = Body(...)):
+async def export_excel(structure: Dict[str, Any] = Body(...), timings: bool = False):
     """Export P4 structure to Excel format."""
     try:
-        filename = structure.get("_filename", "p4_export")
-        excel_path = create_excel_export(structure, filename)
-        return FileResponse(
-            excel_path,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            filename=f"{filename.replace('.p4', '')}_rules.xlsx"
-        )
+        excel_path, report = await export_structure(structure)
+        headers = {}
+        if timings:
+            headers["X-Export-Timings"] = format_timings(report) if report else "cache_hit"
+        return export_response(excel_path, structure.get("_filename", "p4_export"), headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating Excel export: {str(e)}")
         raise HTTPException(
@@ -293,3 +846,256 @@ async def export_excel(structure: Dict[str, Any] = Body(...)):
             detail=f"Error creating Excel export: {str(e)}"
         )
 
+
+# --- Structure sections ---
+
+async def structure_response(request: Request, parse_id: str, build) -> Response:
+    """Answer a structure request, or 304 if the client's copy is current.
+
+    build turns the parse's structure into the response body. The ETag
+    depends only on the request, so a matching If-None-Match is answered
+    without building the body; the parse ID is still looked up first, so an
+    unknown or evicted one gets 404 rather than 304.
+    """
+    structure = await get_structure(parse_id)
+    tag = etag(request.url.path, request.url.query)
+    headers = {"ETag": tag, "Cache-Control": f"private, max-age={settings.STRUCTURE_MAX_AGE}"}
+    if matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    try:
+        body = build(structure)
+    except InvalidSelection as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ORJSONResponse(body, headers=headers)
+
+
+def get_block(structure: Dict[str, Any], name: str) -> Any:
+    block = entities(structure, "blocks").get(name)
+    if block is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No block named {name} in this program."
+        )
+    return block
+
+
+def split_names(names: Optional[str]) -> Optional[List[str]]:
+    return [n.strip() for n in names.split(",") if n.strip()] if names is not None else None
+
+
+@app.get("/structure/{parse_id}")
+async def structure_summary_view(parse_id: str, request: Request):
+    """The summary /upload returns: blocks with their tables, and section sizes."""
+    return await structure_response(
+        request, parse_id, lambda structure: {"parse_id": parse_id, **summary(structure)}
+    )
+
+
+@app.get("/structure/{parse_id}/blocks/{name}")
+async def structure_block(parse_id: str, name: str, request: Request, fields: Optional[str] = None):
+    """One block, optionally only some of its fields."""
+    return await structure_response(request, parse_id, lambda structure: {
+        "parse_id": parse_id,
+        "name": name,
+        "block": select(get_block(structure, name), parse_fields("blocks", fields)),
+    })
+
+
+@app.get("/structure/{parse_id}/blocks/{name}/actions")
+async def structure_block_actions(
+    parse_id: str,
+    name: str,
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(settings.STRUCTURE_PAGE_SIZE, ge=1, le=settings.STRUCTURE_MAX_PAGE),
+    fields: Optional[str] = None,
+    names: Optional[str] = None,
+):
+    """A page of a block's actions."""
+    return await structure_response(request, parse_id, lambda structure: {
+        "parse_id": parse_id,
+        "block": name,
+        **page(
+            block_actions(get_block(structure, name)), offset, limit,
+            parse_fields("actions", fields), split_names(names),
+        ),
+    })
+
+
+@app.get("/structure/{parse_id}/{section}")
+async def structure_section(
+    parse_id: str,
+    section: str,
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(settings.STRUCTURE_PAGE_SIZE, ge=1, le=settings.STRUCTURE_MAX_PAGE),
+    fields: Optional[str] = None,
+    names: Optional[str] = None,
+):
+    """A page of one section of a structure, as a name -> entity object."""
+    if section not in SECTIONS:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown section. Choose one of: {', '.join(SECTIONS)}."
+        )
+    return await structure_response(request, parse_id, lambda structure: {
+        "parse_id": parse_id,
+        "section": section,
+        **page(
+            entities(structure, section), offset, limit,
+            parse_fields(section, fields), split_names(names),
+        ),
+    })
+
+
+# --- Asynchronous jobs ---
+
+def structure_summary(structure: Dict[str, Any]) -> Dict[str, int]:
+    """Counts reported when a parse job finishes, before the result is fetched."""
+    return {
+        "blocks": sum(1 for name in structure if not name.startswith("_")),
+        "tables": len(structure.get("_tables", {})),
+        "headers": len(structure.get("_headers", {})),
+        "layouts": len(structure.get("_layouts", {})),
+    }
+
+def new_job(kind: str, filename: Optional[str]) -> Job:
+    job = job_store.create(kind, filename)
+    if job is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many unfinished jobs, please retry shortly.",
+            headers={"Retry-After": str(settings.RETRY_AFTER)}
+        )
+    return job
+
+async def run_in_job(job: Job, work) -> None:
+    """Await work() for a job and record its (result, summary) or its error."""
+    token = current_job.set(job.id)
+    job.start()
+    try:
+        result, summary = await work()
+    except HTTPException as e:
+        job.fail(e.status_code, e.detail)
+    except Exception as e:
+        logger.error(f"Job {job.id} failed: {str(e)}")
+        job.fail(500, f"Error processing job: {str(e)}")
+    else:
+        job.finish(result, summary)
+    finally:
+        current_job.reset(token)
+
+def job_accepted(job: Job) -> JSONResponse:
+    base = f"/jobs/{job.id}"
+    return JSONResponse(status_code=202, content={
+        "job_id": job.id,
+        "status": job.status,
+        "links": {"status": base, "events": f"{base}/events", "result": f"{base}/result"},
+    })
+
+@app.post("/jobs/upload")
+async def submit_upload(file: UploadFile = File(...)):
+    """Upload a P4 file and parse it in the background; returns a job ID at once."""
+    require_single_worker("/jobs")
+    if not file.filename.endswith(".p4"):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid file type. Please upload a .p4 file."
+        )
+    
+    path = os.path.join(UPLOAD_DIR, file.filename)
+    temp_path = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        digest, size = await save_upload(file, temp_path)
+        job = new_job("parse", file.filename)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    job.publish("stage", {"stage": "upload", "phase": "upload", "bytes": size})
+    
+    async def work():
+        try:
+            parse_id, structure, report = await parse_saved(
+                temp_path, path, file.filename, digest, size
+            )
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        result = {"filename": file.filename, "parse_id": parse_id, "structure": structure}
+        summary = {"parse_id": parse_id, **structure_summary(structure), "timings": report}
+        return result, summary
+    
+    job.task = asyncio.create_task(run_in_job(job, work))
+    return job_accepted(job)
+
+@app.post("/jobs/export-excel")
+async def submit_export(structure: Dict[str, Any] = Body(...)):
+    """Generate an Excel export in the background; returns a job ID at once."""
+    require_single_worker("/jobs")
+    filename = structure.get("_filename", "p4_export")
+    job = new_job("export", filename)
+    
+    async def work():
+        excel_path, report = await export_structure(structure)
+        return excel_path, {"timings": report}
+    
+    job.task = asyncio.create_task(run_in_job(job, work))
+    return job_accepted(job)
+
+def get_job(job_id: str) -> Job:
+    require_single_worker("/jobs")
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Unknown or expired job ID."
+        )
+    return job
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return get_job(job_id).info()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Stream a job's progress as Server-Sent Events until it finishes.
+
+    Past events are replayed first; a reconnecting client's Last-Event-ID
+    skips the ones it already has.
+    """
+    job = get_job(job_id)
+    last = request.headers.get("last-event-id", "")
+    start = int(last) + 1 if last.isdigit() else 0
+    
+    async def stream():
+        async for item in job.follow(settings.JOB_HEARTBEAT, start):
+            if item is None:
+                yield b": keepalive\n\n"
+                continue
+            index, event = item
+            yield f"id: {index}\nevent: {event['event']}\ndata: ".encode() + dumps(event["data"]) + b"\n\n"
+    
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    """Return a finished job's result: the /upload response or the workbook."""
+    job = get_job(job_id)
+    if job.status == "failed":
+        raise HTTPException(status_code=job.error[0], detail=job.error[1])
+    if job.status != "done":
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job is {job.status}; wait for its done event."
+        )
+    if job.kind == "export":
+        if not os.path.exists(job.result):
+            raise HTTPException(
+                status_code=410,
+                detail="The export has been evicted. Submit it again."
+            )
+        return export_response(job.result, job.filename, {})
+    return ORJSONResponse(job.result)
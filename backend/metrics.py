@@ -0,0 +1,232 @@
+"""Per-stage timings and counters for the parse and export pipelines.
+
+Jobs run in worker processes, so timings are collected per job with stage()
+and count(), returned to the API process by timed(), and folded into the
+process-wide histograms there. The registry renders the Prometheus text
+exposition format served by /metrics.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds, from sub-millisecond stages up to the job timeout
+TIME_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30
+)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+# --- Per-job collection ---
+
+class StageTimings:
+    """Stage durations and counters gathered while one job runs."""
+
+    def __init__(self, listener: Optional[Callable[[str], None]] = None):
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.total = 0.0
+        # Called with a stage's name the first time the job enters it
+        self.listener = listener
+
+    def report(self) -> Dict[str, Any]:
+        return {"stages": self.stages, "counters": self.counters, "total": self.total}
+
+
+_current: ContextVar[Optional[StageTimings]] = ContextVar("p4lens_timings", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Add the time spent in the with-block to a stage of the running job."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    if timings.listener is not None and name not in timings.stages:
+        timings.listener(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.stages[name] = timings.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Add to a counter of the running job."""
+    timings = _current.get()
+    if timings is not None:
+        timings.counters[name] = timings.counters.get(name, 0) + amount
+
+
+def timed(
+    fn: Callable, *args, listener: Optional[Callable[[str], None]] = None
+) -> Tuple[Any, Dict[str, Any]]:
+    """Call fn with stage timing enabled; return its result and timing report."""
+    timings = StageTimings(listener)
+    token = _current.set(timings)
+    start = time.perf_counter()
+    try:
+        result = fn(*args)
+    finally:
+        timings.total = time.perf_counter() - start
+        _current.reset(token)
+    return result, timings.report()
+
+
+def format_timings(report: Dict[str, Any]) -> str:
+    """Render a timing report as "stage=ms" pairs for the X-Parse-Timings header."""
+    parts = [f"{name}={seconds * 1000:.2f}" for name, seconds in report["stages"].items()]
+    parts.append(f"total={report['total'] * 1000:.2f}")
+    return ", ".join(parts)
+
+
+# --- Process-wide metrics ---
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = TIME_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, c in zip(self.buckets, counts):
+                    cumulative += c
+                    le = _labels(self.labelnames, key, f'le="{_number(bound)}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{le} {n}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+JOB_SECONDS = REGISTRY.register(Histogram(
+    "p4lens_job_seconds",
+    "Wall time of parse and export jobs, including queueing for a worker",
+    ["pipeline"],
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "p4lens_stage_seconds",
+    "Time spent in each stage of a parse or export job",
+    ["pipeline", "stage"],
+))
+PARSE_INPUT_BYTES = REGISTRY.register(Histogram(
+    "p4lens_parse_input_bytes",
+    "Size of parsed P4 sources",
+    buckets=SIZE_BUCKETS,
+))
+PARSE_ITEMS = REGISTRY.register(Histogram(
+    "p4lens_parse_items",
+    "Items found per parse",
+    ["item"],
+    buckets=COUNT_BUCKETS,
+))
+PARSES_TOTAL = REGISTRY.register(Counter(
+    "p4lens_parses_total",
+    "Parse requests by outcome",
+    ["result"],
+))
+EXPORTS_TOTAL = REGISTRY.register(Counter(
+    "p4lens_exports_total",
+    "Excel export requests by outcome",
+    ["result"],
+))
+
+
+def render_gauges(name: str, help: str, label: str, values: Dict[str, Any]) -> str:
+    """Render a dict of numbers (such as cache stats) as one labelled gauge."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for key, value in values.items():
+        if isinstance(value, (int, float)):
+            lines.append(f'{name}{{{label}="{key}"}} {_number(value)}')
+    return "\n".join(lines) + "\n"
+
+
+def record_job(pipeline: str, report: Dict[str, Any], wall: float) -> None:
+    """Fold one job's timing report into the process-wide metrics."""
+    JOB_SECONDS.observe(wall, pipeline=pipeline)
+    for name, seconds in report["stages"].items():
+        STAGE_SECONDS.observe(seconds, pipeline=pipeline, stage=name)
+    if pipeline == "parse":
+        for name, value in report["counters"].items():
+            PARSE_ITEMS.observe(value, item=name)
@@ -0,0 +1,225 @@
+"""Typed model of a parsed P4 program.
+
+parse_p4_source returns a dict keyed by block name (plus the "_tables",
+"_headers", ... globals) whose values are the slotted dataclasses below.
+Their field names are the JSON keys clients see, so orjson serialises them
+directly, without first converting everything to dicts. Endpoints return
+them in an ORJSONResponse, which skips FastAPI's jsonable_encoder pass. Structures read
+back from the parse cache's disk tier are rebuilt into the same classes by
+load_structure, so code handed a structure never sees the JSON form.
+"""
+
+from dataclasses import dataclass, field, fields, is_dataclass
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Union, get_args, get_origin, get_type_hints
+
+import orjson
+
+
+@dataclass(slots=True)
+class Param:
+    type: str
+    name: str
+
+
+@dataclass(slots=True)
+class Action:
+    name: str
+    parameters: List[Param]
+    operations: List[str]
+    body_preview: str
+    # Fields assigned anywhere in the body, e.g. "standard_metadata.egress_spec",
+    # and headers made valid or invalid
+    writes: List[str] = field(default_factory=list)
+    # Fields read anywhere in the body, e.g. "hdr.ipv4.ttl"
+    reads: List[str] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class Table:
+    keys: List[str]
+    actions: List[str]
+    size: Optional[int]
+    default_action: Optional[str]
+
+
+@dataclass(slots=True)
+class HeaderField:
+    field: str
+    bits: str
+    type: str
+
+
+@dataclass(slots=True)
+class LayoutField:
+    name: str
+    type: str
+    # Bits from the start of the type, and bits taken; None once unresolvable
+    offset: Optional[int]
+    width: Optional[int]
+    # Elements of a header stack member
+    count: int = 1
+    # Largest width of a varbit field, which counts as empty in width and offsets
+    max_width: Optional[int] = None
+
+
+@dataclass(slots=True)
+class Layout:
+    """Packed layout of a header, header_union or struct."""
+
+    kind: str
+    fields: List[LayoutField] = field(default_factory=list)
+    bits: Optional[int] = None
+    bytes: Optional[int] = None
+    # Sizes with every varbit field at its maximum
+    max_bits: Optional[int] = None
+    max_bytes: Optional[int] = None
+    # Fields whose type could not be resolved to a width
+    unresolved: List[str] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class Extern:
+    type: str
+    name: str
+
+
+@dataclass(slots=True)
+class Condition:
+    condition: str
+    type: str
+    tables: List[str]
+
+
+@dataclass(slots=True)
+class ApplyLogic:
+    logic: List[str] = field(default_factory=list)
+    conditions: List[Condition] = field(default_factory=list)
+    tables_applied: List[str] = field(default_factory=list)
+    # Control-flow tree of plain dicts, see parser_utils.ApplyBlockParser
+    flow: List[Dict[str, Any]] = field(default_factory=list)
+    raw_apply_body: str = ""
+
+
+@dataclass(slots=True)
+class SelectCase:
+    value: str
+    target: str
+
+
+@dataclass(slots=True)
+class ParserState:
+    extracts: List[str]
+    # Select key expressions; empty for a plain "transition <state>;"
+    select: List[str]
+    # Plain transitions are a single case with value "default"
+    cases: List[SelectCase]
+
+
+@dataclass(slots=True)
+class ParserGraph:
+    """A parser's state machine and what was precomputed from it."""
+
+    start: str
+    states: Dict[str, ParserState] = field(default_factory=dict)
+    reachable: List[str] = field(default_factory=list)
+    unreachable: List[str] = field(default_factory=list)
+    # Transition targets that are neither declared states nor accept/reject
+    undefined: List[str] = field(default_factory=list)
+    # States on a transition cycle, such as header stack loops
+    loops: List[str] = field(default_factory=list)
+    # start -> accept paths (saturating at 2**53 - 1) and the most extracts on
+    # one, taking no loop back edge
+    accept_paths: int = 0
+    max_extracts: int = 0
+
+
+@dataclass(slots=True)
+class Block:
+    """A parser, control or deparser block."""
+
+    type: str
+    actions: List[Action] = field(default_factory=list)
+    tables: List[str] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class ControlBlock(Block):
+    apply_logic: ApplyLogic = field(default_factory=ApplyLogic)
+
+
+@dataclass(slots=True)
+class ParserBlock(Block):
+    states: List[str] = field(default_factory=list)
+    extracts: List[str] = field(default_factory=list)
+    transitions: List[str] = field(default_factory=list)
+    graph: Optional[ParserGraph] = None
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialise a structure (model objects or plain dicts) to JSON bytes."""
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON produced by dumps back into plain dicts and lists."""
+    return orjson.loads(data)
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+@lru_cache(maxsize=None)
+def _decoder(tp: Any) -> Callable[[Any], Any]:
+    """Build a function turning the JSON form of type tp back into model objects."""
+    origin = get_origin(tp)
+    if origin is Union:
+        inner = _decoder(next(arg for arg in get_args(tp) if arg is not type(None)))
+        return _identity if inner is _identity else (lambda v: None if v is None else inner(v))
+    if origin is list:
+        item = _decoder(get_args(tp)[0])
+        return _identity if item is _identity else (lambda v: [item(x) for x in v])
+    if origin is dict:
+        item = _decoder(get_args(tp)[1])
+        return _identity if item is _identity else (lambda v: {k: item(x) for k, x in v.items()})
+    if is_dataclass(tp):
+        hints = get_type_hints(tp)
+        decoders = {f.name: _decoder(hints[f.name]) for f in fields(tp)}
+        return lambda v: tp(**{k: decoders[k](x) for k, x in v.items()})
+    return _identity
+
+
+_BLOCK_CLASSES = {"control": ControlBlock, "parser": ParserBlock}
+
+_GLOBAL_DECODERS = {
+    "_tables": _decoder(Dict[str, Table]),
+    "_headers": _decoder(Dict[str, List[HeaderField]]),
+    "_layouts": _decoder(Dict[str, Layout]),
+    "_externs": _decoder(List[Extern]),
+    "_consts": lambda v: [tuple(c) for c in v],
+}
+
+
+def load_structure(data: Any) -> Dict[str, Any]:
+    """Parse a structure encoded by dumps back into model objects."""
+    structure = loads(data)
+    for name, value in structure.items():
+        if not name.startswith("_"):
+            structure[name] = _decoder(_BLOCK_CLASSES.get(value["type"], Block))(value)
+        elif name in _GLOBAL_DECODERS:
+            structure[name] = _GLOBAL_DECODERS[name](value)
+    return structure
+
+
+def _reduce(self):
+    return type(self), self._pickle_fields(self)
+
+
+# Pickle as (class, field tuple): attrgetter collects the fields in C, which
+# is much cheaper than the generated __getstate__ of slotted dataclasses
+for _cls in (Param, Action, Table, HeaderField, LayoutField, Layout, Extern, Condition, ApplyLogic, SelectCase,
+             ParserState, ParserGraph, Block, ControlBlock, ParserBlock):
+    _cls._pickle_fields = attrgetter(*(f.name for f in fields(_cls)))
+    _cls.__reduce__ = _reduce
@@ -0,0 +1,433 @@
+"""Content-addressed cache for parsed P4 structures.
+
+Entries are keyed by a parse ID: a SHA-256 of the uploaded bytes plus
+PARSER_VERSION, so a parser change never serves stale output. When the source
+includes other files, the parse ID also carries a digest of their paths and
+contents, so one parse ID always names one structure. Each source key points
+at the parse ID last stored for it, and get_source() follows that pointer
+only while the included files are unchanged. An in-memory LRU sits in front
+of an optional sqlite file that survives restarts.
+
+The sqlite file may be shared by several API worker processes. It is opened
+in WAL mode so readers never wait for a writer, and writers wait for each
+other up to BUSY_TIMEOUT. A database error is logged and treated as a miss
+rather than failing the request. The file also holds parse leases, which let
+one process claim a key while it parses it (see coalesce.py).
+
+Methods may block on sqlite or on hashing included files, so async code calls
+them through asyncio.to_thread. Reads never write: the access times that
+order disk evictions are collected in memory and written with the next put,
+or once TOUCH_BATCH have accumulated. The number of disk entries is kept in a
+parse_meta row, updated in the same transactions as inserts and evictions.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from model import dumps, load_structure, loads
+from parser_utils import PARSER_VERSION
+from preprocess import deps_current
+
+logger = logging.getLogger(__name__)
+
+# Seconds a write waits for another process to finish its own
+BUSY_TIMEOUT = 10.0
+# Access times held in memory before they are written without waiting for a put
+TOUCH_BATCH = 256
+
+
+def cache_key(content: bytes) -> str:
+    """Return the cache key for a P4 source."""
+    return digest_key(hashlib.sha256(content).hexdigest())
+
+
+def digest_key(sha256_hex: str) -> str:
+    """Return the cache key for a source whose SHA-256 was computed elsewhere."""
+    return f"{sha256_hex}:{PARSER_VERSION}"
+
+
+def parse_key(source_key: str, deps: List[Tuple]) -> str:
+    """Return the parse ID of a source parsed with the included files in deps.
+
+    A source without includes keeps its source key.
+    """
+    if not deps:
+        return source_key
+    sha, _, version = source_key.rpartition(":")
+    included = hashlib.sha256()
+    for path, _, _, digest in deps:
+        included.update(f"{path}\0{digest}\n".encode("utf-8"))
+    return f"{sha}-{included.hexdigest()[:16]}:{version}"
+
+
+def source_key_of(parse_id: str) -> str:
+    """Return the source key a parse ID was derived from."""
+    sha, _, version = parse_id.rpartition(":")
+    return f"{sha.split('-')[0]}:{version}"
+
+
+class ParseCache:
+    """LRU cache of parsed structures with an optional sqlite tier."""
+
+    def __init__(
+        self,
+        max_entries: int = 128,
+        db_path: Optional[str] = None,
+        db_max_entries: int = 2048,
+    ):
+        self.max_entries = max_entries
+        self.db_path = db_path or None
+        self.db_max_entries = db_max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # source key -> (parse ID, deps) of the last parse of that source
+        self._sources: "OrderedDict[str, Tuple[str, List[Tuple]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        # key -> last access time not yet written to the disk tier
+        self._touched: Dict[str, float] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if self.db_path:
+            self._open_db()
+
+    def _open_db(self) -> None:
+        try:
+            self._db = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS parse_cache ("
+                "key TEXT PRIMARY KEY, structure TEXT NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS parse_sources ("
+                "source TEXT PRIMARY KEY, key TEXT NOT NULL, deps TEXT NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS parse_leases ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS parse_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            self._db.execute(
+                "INSERT OR IGNORE INTO parse_meta (name, value) "
+                "SELECT 'entries', COUNT(*) FROM parse_cache"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Parse cache disk tier disabled ({self.db_path}): {e}")
+            self._db = None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached structure for a key, or None on a miss."""
+        with self._lock:
+            structure, from_disk = self._lookup(key)
+            if structure is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if from_disk:
+                self.disk_hits += 1
+            self._touch(key)
+            return structure
+
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        """Like get, without counting a hit or miss; used while polling."""
+        with self._lock:
+            return self._lookup(key)[0]
+
+    def get_source(self, source: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Return the parse ID and structure last stored for a source key.
+
+        Misses when the source was never parsed, its structure was evicted,
+        or a file it includes has changed since.
+        """
+        parse_id = self._resolve(source)
+        structure = self.get(parse_id) if parse_id is not None else None
+        if structure is None:
+            if parse_id is None:
+                with self._lock:
+                    self.misses += 1
+            return None
+        return parse_id, structure
+
+    def peek_source(self, source: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Like get_source, without counting a hit or miss; used while polling."""
+        parse_id = self._resolve(source)
+        structure = self.peek(parse_id) if parse_id is not None else None
+        return None if structure is None else (parse_id, structure)
+
+    def put(
+        self,
+        key: str,
+        structure: Dict[str, Any],
+        source: Optional[str] = None,
+        deps: Optional[List[Tuple]] = None,
+        disk: bool = True,
+    ) -> None:
+        """Store a parsed structure under a parse ID.
+
+        With source, also record key as the latest parse of that source key,
+        valid while the included files in deps are unchanged. With disk=False
+        only the memory tier is written; persist() writes the disk tier later.
+        """
+        with self._lock:
+            self._remember(key, structure)
+            if source is not None:
+                self._remember_source(source, key, deps or [])
+            if disk:
+                self._persist(key, structure, source, deps)
+
+    def persist(
+        self,
+        key: str,
+        structure: Dict[str, Any],
+        source: Optional[str] = None,
+        deps: Optional[List[Tuple]] = None,
+    ) -> None:
+        """Write an entry stored with put(disk=False) to the disk tier."""
+        with self._lock:
+            self._persist(key, structure, source, deps)
+
+    def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        """Take the lease to parse a key; False while another owner holds it.
+
+        Leases expire after ttl seconds, so one left by a crashed process is
+        taken over. Without the disk tier there is nothing to share, and the
+        lease is always granted.
+        """
+        if self._db is None:
+            return True
+        now = time.time()
+        with self._lock:
+            try:
+                self._db.execute(
+                    "DELETE FROM parse_leases WHERE key = ? AND expires < ?", (key, now)
+                )
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO parse_leases (key, owner, expires) VALUES (?, ?, ?)",
+                    (key, owner, now + ttl),
+                )
+                self._db.commit()
+                return cursor.rowcount == 1
+            except sqlite3.Error as e:
+                self._db_error("lease", e)
+                return True
+
+    def release(self, key: str, owner: str) -> None:
+        """Give up a lease taken with acquire."""
+        if self._db is None:
+            return
+        with self._lock:
+            try:
+                self._db.execute(
+                    "DELETE FROM parse_leases WHERE key = ? AND owner = ?", (key, owner)
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._db_error("lease release", e)
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._entries.clear()
+            self._sources.clear()
+            self._touched.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM parse_cache")
+                self._db.execute("DELETE FROM parse_sources")
+                self._db.execute("UPDATE parse_meta SET value = 0 WHERE name = 'entries'")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters and current sizes."""
+        with self._lock:
+            try:
+                disk_entries = self._db_count()
+            except sqlite3.Error as e:
+                self._db_error("read", e)
+                disk_entries = 0
+            return {
+                "parser_version": PARSER_VERSION,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk_enabled": self._db is not None,
+                "disk_entries": disk_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+            }
+
+    def _remember(self, key: str, structure: Dict[str, Any]) -> None:
+        self._entries[key] = structure
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _remember_source(self, source: str, key: str, deps: List[Tuple]) -> None:
+        self._sources[source] = (key, deps)
+        self._sources.move_to_end(source)
+        while len(self._sources) > self.max_entries:
+            self._sources.popitem(last=False)
+
+    def _resolve(self, source: str) -> Optional[str]:
+        """The parse ID last stored for a source, if its included files are unchanged."""
+        with self._lock:
+            found = self._sources.get(source)
+            if found is not None:
+                self._sources.move_to_end(source)
+            else:
+                found = self._db_get_source(source)
+                if found is not None:
+                    self._remember_source(source, *found)
+        if found is None:
+            return None
+        key, deps = found
+        # Checked outside the lock: a changed include is hashed
+        return key if deps_current(deps) else None
+
+    def _lookup(self, key: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Return a key's structure and whether it came from the disk tier."""
+        structure = self._entries.get(key)
+        if structure is not None:
+            self._entries.move_to_end(key)
+            return structure, False
+        structure = self._db_get(key)
+        if structure is not None:
+            self._remember(key, structure)
+            return structure, True
+        return None, False
+
+    def _persist(
+        self, key: str, structure: Dict[str, Any], source: Optional[str], deps: Optional[List[Tuple]]
+    ) -> None:
+        self._db_put(key, structure)
+        if source is not None:
+            self._db_put_source(source, key, deps or [])
+
+    def _db_error(self, operation: str, error: sqlite3.Error) -> None:
+        logger.warning(f"Parse cache disk tier {operation} failed ({self.db_path}): {error}")
+        try:
+            self._db.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _db_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT structure FROM parse_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+        except sqlite3.Error as e:
+            self._db_error("read", e)
+            return None
+        return load_structure(row[0])
+
+    def _db_put(self, key: str, structure: Dict[str, Any]) -> None:
+        if self._db is None:
+            return
+        try:
+            data = dumps(structure).decode("utf-8")
+        except TypeError as e:
+            # orjson.JSONEncodeError, such as nesting beyond its limit; the
+            # entry stays in memory only
+            logger.warning(f"Parse cache cannot store {key} on disk: {e}")
+            return
+        now = time.time()
+        try:
+            self._db_write_touched()
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO parse_cache (key, structure, accessed) VALUES (?, ?, ?)",
+                (key, data, now),
+            ).rowcount
+            if inserted:
+                self._db.execute("UPDATE parse_meta SET value = value + 1 WHERE name = 'entries'")
+            else:
+                self._db.execute(
+                    "UPDATE parse_cache SET structure = ?, accessed = ? WHERE key = ?",
+                    (data, now, key),
+                )
+            overflow = self._db_count() - self.db_max_entries
+            if overflow > 0:
+                evicted = self._db.execute(
+                    "DELETE FROM parse_cache WHERE key IN ("
+                    "SELECT key FROM parse_cache ORDER BY accessed LIMIT ?)",
+                    (overflow,),
+                ).rowcount
+                self._db.execute(
+                    "UPDATE parse_meta SET value = value - ? WHERE name = 'entries'", (evicted,)
+                )
+                self.disk_evictions += evicted
+                self._db.execute(
+                    "DELETE FROM parse_sources WHERE key NOT IN (SELECT key FROM parse_cache)"
+                )
+            self._db.commit()
+        except sqlite3.Error as e:
+            self._db_error("write", e)
+
+    def _db_get_source(self, source: str) -> Optional[Tuple[str, List[Tuple]]]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT key, deps FROM parse_sources WHERE source = ?", (source,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._db_error("read", e)
+            return None
+        if row is None:
+            return None
+        return row[0], [tuple(dep) for dep in loads(row[1])]
+
+    def _db_put_source(self, source: str, key: str, deps: List[Tuple]) -> None:
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO parse_sources (source, key, deps) VALUES (?, ?, ?)",
+                (source, key, dumps(deps).decode("utf-8")),
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            self._db_error("write", e)
+
+    def _touch(self, key: str) -> None:
+        if self._db is None:
+            return
+        self._touched[key] = time.time()
+        if len(self._touched) >= TOUCH_BATCH:
+            try:
+                self._db_write_touched()
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._db_error("write", e)
+
+    def _db_write_touched(self) -> None:
+        """Write pending access times; the caller commits."""
+        if not self._touched:
+            return
+        touched = [(accessed, key, accessed) for key, accessed in self._touched.items()]
+        self._touched.clear()
+        self._db.executemany(
+            "UPDATE parse_cache SET accessed = ? WHERE key = ? AND accessed < ?", touched
+        )
+
+    def _db_count(self) -> int:
+        if self._db is None:
+            return 0
+        row = self._db.execute("SELECT value FROM parse_meta WHERE name = 'entries'").fetchone()
+        return row[0] if row else 0
@@ -0,0 +1,268 @@
+"""Parser state-machine graphs.
+
+build_parser_graph turns a parser's states into a ParserGraph: per-state
+extracts and select cases, plus reachability, undefined targets, states on
+loops and the number of start -> accept paths. Path counts are memoized per
+strongly connected component, sinks first, so a parser with hundreds of
+states and an exponential number of paths is summarised in linear time.
+
+enumerate_paths walks concrete paths on request, bounded by a path limit,
+the number of times a loop may be taken and a step budget.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from model import ParserGraph, ParserState, SelectCase
+
+TERMINALS = ("accept", "reject")
+# Path counts saturate at the largest integer JSON clients hold exactly
+MAX_PATH_COUNT = 2 ** 53 - 1
+
+EXTRACT_RE = re.compile(r"packet\.extract\(([^)]+)\)")
+_TRANSITION_RE = re.compile(r"\btransition\s+(?:(select)\s*\(|(\w+)\s*;)")
+# Brackets and separators; everything between them is skipped by the regex
+_PUNCT_RE = re.compile(r"[()\[\]{};,]")
+
+
+def _closing(text: str, pos: int) -> int:
+    """Return the index of the bracket closing the one at pos, or len(text)."""
+    depth = 0
+    for match in _PUNCT_RE.finditer(text, pos):
+        ch = match.group()
+        if ch in "([{":
+            depth += 1
+        elif ch in ")]}":
+            depth -= 1
+            if depth == 0:
+                return match.start()
+    return len(text)
+
+
+def _split_top(text: str, sep: str) -> List[str]:
+    """Split on sep where it is not nested in brackets; drop empty parts."""
+    parts = []
+    depth = 0
+    last = 0
+    for match in _PUNCT_RE.finditer(text):
+        ch = match.group()
+        if ch in "([{":
+            depth += 1
+        elif ch in ")]}":
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append(text[last:match.start()])
+            last = match.end()
+    parts.append(text[last:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def parse_transition(body: str) -> Tuple[List[str], List[SelectCase]]:
+    """Return the select keys and cases of a state body's transition."""
+    match = _TRANSITION_RE.search(body)
+    if match is None:
+        # A state without a transition statement goes to reject
+        return [], [SelectCase(value="default", target="reject")]
+    if match.group(2):
+        return [], [SelectCase(value="default", target=match.group(2))]
+
+    open_paren = match.end() - 1
+    close_paren = _closing(body, open_paren)
+    keys = _split_top(body[open_paren + 1:close_paren], ",")
+    open_brace = body.find("{", close_paren)
+    if open_brace < 0:
+        return keys, []
+    cases = []
+    for case in _split_top(body[open_brace + 1:_closing(body, open_brace)], ";"):
+        value, _, target = case.rpartition(":")
+        cases.append(SelectCase(value=" ".join(value.split()), target=target.strip()))
+    return keys, cases
+
+
+def _targets(state: ParserState) -> List[str]:
+    return list(dict.fromkeys(c.target for c in state.cases))
+
+
+def _components(edges: Dict[str, List[str]]) -> List[List[str]]:
+    """Strongly connected components (Tarjan's, iterative).
+
+    Components come out in reverse topological order: every component a
+    component leads to is listed before it.
+    """
+    order: Dict[str, int] = {}
+    low: Dict[str, int] = {}
+    on_stack = set()
+    stack: List[str] = []
+    components = []
+    for root in edges:
+        if root in order:
+            continue
+        work = [(root, iter(edges[root]))]
+        order[root] = low[root] = len(order)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in edges:
+                    continue
+                if child not in order:
+                    order[child] = low[child] = len(order)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(edges[child])))
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], order[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == order[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def _loop_states(edges: Dict[str, List[str]], components: List[List[str]]) -> List[str]:
+    """Return states on a cycle, in declaration order."""
+    looping = set()
+    for component in components:
+        if len(component) > 1 or component[0] in edges[component[0]]:
+            looping.update(component)
+    return [name for name in edges if name in looping]
+
+
+def _count_paths(
+    graph: ParserGraph, edges: Dict[str, List[str]], components: List[List[str]]
+) -> Tuple[int, Optional[int]]:
+    """Count start -> accept paths and their most extracts over the condensed graph.
+
+    Each loop, a component of states that reach each other, is collapsed
+    into one node, so the counts do not depend on the order states are
+    visited in. A path through a loop is counted once for each transition
+    into it and each transition out of it, and includes the extracts of
+    every state of the loop once. Components are finished sinks first, so
+    the pass is linear.
+    """
+    paths: Dict[Any, int] = {"accept": 1, "reject": 0}
+    most: Dict[Any, Optional[int]] = {"accept": 0, "reject": None}
+    component_of = {}
+    for i, component in enumerate(components):
+        for state in component:
+            component_of[state] = i
+
+    def node(target: str) -> Any:
+        return component_of.get(target, target)
+
+    for i, component in enumerate(components):
+        total = 0
+        best = None
+        for state in component:
+            for target in edges[state]:
+                target = node(target)
+                if target == i or not paths.get(target):
+                    continue
+                total += paths[target]
+                if best is None or most[target] > best:
+                    best = most[target]
+        paths[i] = min(total, MAX_PATH_COUNT)
+        extracts = sum(len(graph.states[state].extracts) for state in component)
+        most[i] = None if best is None else best + extracts
+    start = node(graph.start)
+    return paths[start], most[start]
+
+
+def build_parser_graph(states: List[Tuple[str, str]]) -> ParserGraph:
+    """Build the graph of a parser from its (state name, body) pairs."""
+    graph = ParserGraph(start="start")
+    for name, body in states:
+        select, cases = parse_transition(body)
+        graph.states[name] = ParserState(
+            extracts=EXTRACT_RE.findall(body), select=select, cases=cases
+        )
+    edges = {name: _targets(state) for name, state in graph.states.items()}
+
+    undefined = {}
+    for targets in edges.values():
+        for target in targets:
+            if target not in edges and target not in TERMINALS:
+                undefined[target] = None
+    graph.undefined = list(undefined)
+    components = _components(edges)
+    graph.loops = _loop_states(edges, components)
+
+    if graph.start not in edges:
+        graph.unreachable = list(edges)
+        return graph
+
+    seen = {graph.start: None}
+    frontier = [graph.start]
+    while frontier:
+        following = []
+        for name in frontier:
+            for target in edges[name]:
+                if target in edges and target not in seen:
+                    seen[target] = None
+                    following.append(target)
+        frontier = following
+    graph.reachable = list(seen)
+    graph.unreachable = [name for name in edges if name not in seen]
+
+    accept_paths, max_extracts = _count_paths(graph, edges, components)
+    graph.accept_paths = accept_paths
+    graph.max_extracts = max_extracts or 0
+    return graph
+
+
+def enumerate_paths(
+    graph: ParserGraph, limit: int = 100, max_loop: int = 1, max_steps: int = 100000
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """List concrete paths from start to a terminal, depth first.
+
+    A state may repeat on one path max_loop times beyond its first visit.
+    Returns the paths, each with its states, the headers extracted in order
+    and where it ends, and whether the search stopped early: on finding a
+    path beyond the limit, or on the step budget.
+    """
+    states = graph.states
+    start = graph.start
+    if start not in states:
+        return [], False
+
+    paths: List[Dict[str, Any]] = []
+    path = [start]
+    visits = {start: 1}
+    work = [iter(_targets(states[start]))]
+    steps = 0
+    while work:
+        steps += 1
+        if steps > max_steps:
+            return paths, True
+        target = next(work[-1], None)
+        if target is None:
+            work.pop()
+            visits[path.pop()] -= 1
+            continue
+        if target not in states:
+            if len(paths) >= limit:
+                return paths, True
+            paths.append({
+                "states": list(path),
+                "extracts": [h for name in path for h in states[name].extracts],
+                "end": target,
+            })
+            continue
+        if visits.get(target, 0) > max_loop:
+            continue
+        path.append(target)
+        visits[target] = visits.get(target, 0) + 1
+        work.append(iter(_targets(states[target])))
+    return paths, False
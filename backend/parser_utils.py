@@ -1,138 +1,634 @@
 import re
-import json
+import mmap
+import os
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Tuple
 
+from metrics import count, stage
+from model import (
+    Action, ApplyLogic, Block as BlockInfo, Condition, ControlBlock, Extern, Param,
+    ParserBlock, Table, dumps
+)
+from header_layout import compile_layouts, header_fields, parse_declarations
+from parser_graph import EXTRACT_RE, build_parser_graph
+from preprocess import Preprocessed, preprocess
+
+# Bump whenever the shape or content of parse_p4_structure output changes, so
+# cached parses from an older parser are never served.
+PARSER_VERSION = "10"
+
+# String literals and comments, whose braces do not nest. An unterminated
+# block comment runs to the end of the text.
+_SKIP_PATTERN = r'"(?:\\.|[^"\\\n])*"|//[^\n]*|/\*.*?(?:\*/|\Z)'
+
+# Single lexer pattern used to index every block in one pass over the source.
+# Declarations are matched up to and including their opening brace; any other
+# brace is matched on its own so nesting can be tracked with a stack. String
+# literals and comments are matched whole and skipped. The leading lookahead
+# lists the first character of every alternative, so the regex engine rejects
+# most positions with one set test instead of trying each alternative.
+_BLOCK_TOKEN_RE = re.compile(
+    r'(?=[{}"/acdehpst])(?:'
+    r"(?P<skip>" + _SKIP_PATTERN + r")"
+    r"|\b(?P<decl>parser|control|deparser)\s+(?P<decl_name>\w+)\s*"
+    r"(?:<[^>{;]*>\s*)?\((?P<decl_params>[^)]*)\)\s*\{"
+    r"|\baction\s+(?P<action_name>\w+)\s*\((?P<action_params>[^)]*)\)\s*\{"
+    r"|\b(?P<named>table|state|header|enum)\s+(?P<named_name>\w+)\s*\{"
+    r"|\b(?P<apply>apply)\s*\{"
+    r"|(?P<brace>[{}]))",
+    re.S,
+)
+
+# Braces, plus the literals and comments to jump over; the regex engine skips
+# everything else without returning to Python
+_BRACE_SCAN_RE = re.compile(_SKIP_PATTERN + r"|[{}]", re.S)
+
+
+@dataclass
+class Block:
+    """A brace-delimited block found by the lexer."""
+
+    kind: str
+    name: Optional[str]
+    start: int
+    body_start: int
+    body_end: int = -1
+    depth: int = 0
+    parent: Optional[int] = None
+    params: Optional[str] = None
+    children: List[int] = field(default_factory=list)
+
+
+class BlockIndex:
+    """Index of parser/control/table/action/state/header blocks in a P4 source."""
+
+    def __init__(self, code: str):
+        self.code = code
+        self.blocks: List[Block] = []
+        self._by_kind: Dict[str, List[int]] = {}
+        self._by_name: Dict[Tuple[str, str], int] = {}
+        # False when braces do not pair up (stray '}' or blocks left open)
+        self.balanced = True
+        self._build()
+
+    def _build(self) -> None:
+        code = self.code
+        stack: List[Optional[int]] = []
+        for m in _BLOCK_TOKEN_RE.finditer(code):
+            if m.start("skip") >= 0:
+                continue
+            brace = m.group("brace")
+            if brace == "}":
+                if not stack:
+                    self.balanced = False
+                    continue
+                idx = stack.pop()
+                if idx is not None:
+                    self.blocks[idx].body_end = m.start()
+                continue
+            if brace == "{":
+                stack.append(None)
+                continue
+
+            if m.group("decl"):
+                kind, name, params = m.group("decl"), m.group("decl_name"), m.group("decl_params")
+            elif m.group("action_name"):
+                kind, name, params = "action", m.group("action_name"), m.group("action_params")
+            elif m.group("named"):
+                kind, name, params = m.group("named"), m.group("named_name"), None
+            else:
+                kind, name, params = "apply", None, None
+
+            parent = next((i for i in reversed(stack) if i is not None), None)
+            block = Block(
+                kind=kind,
+                name=name,
+                start=m.start(),
+                body_start=m.end(),
+                depth=len(stack),
+                parent=parent,
+                params=params,
+            )
+            idx = len(self.blocks)
+            self.blocks.append(block)
+            if parent is not None:
+                self.blocks[parent].children.append(idx)
+            stack.append(idx)
+
+        if stack:
+            self.balanced = False
+
+        # Unterminated blocks are dropped, mirroring extract_brace_block; their
+        # children are re-attached to the nearest complete ancestor
+        adopted = set()
+        for idx, block in enumerate(self.blocks):
+            if block.body_end < 0:
+                continue
+            parent = block.parent
+            while parent is not None and self.blocks[parent].body_end < 0:
+                parent = self.blocks[parent].parent
+            if parent != block.parent:
+                block.parent = parent
+                if parent is not None:
+                    self.blocks[parent].children.append(idx)
+                    adopted.add(parent)
+            self._by_kind.setdefault(block.kind, []).append(idx)
+            if block.name is not None:
+                self._by_name.setdefault((block.kind, block.name), idx)
+        for parent in adopted:
+            self.blocks[parent].children.sort()
+
+    def top_level(self) -> List[Block]:
+        """Return complete blocks that are not nested in another block."""
+        return [b for b in self.blocks if b.body_end >= 0 and b.parent is None]
+
+    @property
+    def kind_counts(self) -> Dict[str, int]:
+        """Number of complete blocks of each kind."""
+        return {kind: len(found) for kind, found in self._by_kind.items()}
+
+    def of_kind(self, kind: str) -> List[Block]:
+        """Return all complete blocks of a kind, in source order."""
+        return [self.blocks[i] for i in self._by_kind.get(kind, [])]
+
+    def find(self, kind: str, name: str) -> Optional[Block]:
+        """Return the first block declared with the given kind and name."""
+        idx = self._by_name.get((kind, name))
+        return self.blocks[idx] if idx is not None else None
+
+    def body(self, block: Block) -> str:
+        """Return the text between a block's braces."""
+        return self.code[block.body_start:block.body_end]
+
+    def children(self, block: Block, kind: Optional[str] = None) -> List[Block]:
+        """Return the complete direct children of a block, optionally by kind."""
+        result = []
+        for i in block.children:
+            child = self.blocks[i]
+            if child.body_end >= 0 and (kind is None or child.kind == kind):
+                result.append(child)
+        return result
+
+    def descendants(self, block: Block, kind: Optional[str] = None) -> List[Block]:
+        """Return all complete blocks nested inside a block, in source order."""
+        result = []
+        pending = list(reversed(block.children))
+        while pending:
+            child = self.blocks[pending.pop()]
+            if child.body_end >= 0 and (kind is None or child.kind == kind):
+                result.append(child)
+            pending.extend(reversed(child.children))
+        return result
+
+
+def brace_span(code: str, start_index: int = 0) -> Optional[Tuple[int, int]]:
+    """Span of the body of the first brace block at or after start_index.
+
+    Returns (body_start, body_end): the offsets just after the opening brace
+    and of the matching closing brace. Braces in string literals and comments
+    are ignored. None if no block starts there or it is never closed.
+    """
+    depth = 0
+    body_start = -1
+    for m in _BRACE_SCAN_RE.finditer(code, start_index):
+        pos = m.start()
+        ch = code[pos]
+        if ch == "{":
+            depth += 1
+            if depth == 1:
+                body_start = pos + 1
+        elif ch == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                return body_start, pos
+    return None
+
 
 def extract_brace_block(code: str, start_index: int) -> Tuple[Optional[str], Optional[int]]:
     """Extract content between matching braces starting at start_index."""
-    brace_count = 0
-    body = []
-    for i in range(start_index, len(code)):
-        c = code[i]
-        if c == '{':
-            brace_count += 1
-            if brace_count == 1:
+    span = brace_span(code, start_index)
+    if span is None:
+        return None, None
+    return code[span[0]:span[1]], span[1]
+
+
+# Tokens for apply-block parsing: whitespace and comments are skipped, words
+# and single punctuation characters are kept with their source offsets.
+_APPLY_TOKEN_RE = re.compile(
+    r'\s+|//[^\n]*|/\*.*?\*/|(?P<tok>"(?:\\.|[^"\\])*"|\w+|.)', re.S
+)
+
+# Nesting beyond this depth is kept as an opaque statement rather than parsed.
+# Each level adds up to four JSON containers (a switch's node, cases, case and
+# body), and orjson refuses documents nested more than 255 deep.
+MAX_APPLY_DEPTH = 48
+
+
+class ApplyBlockParser:
+    """Recursive-descent parser turning an apply body into a control-flow tree.
+
+    Each node is a dict with a "type" of "apply", "if", "switch", "block" or
+    "statement". An else-if chain is one "if" node whose "elif" list holds
+    the later branches, so a long chain stays flat. The token list is walked
+    once, so parsing is linear in the size of the apply body.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = [
+            (m.group("tok"), m.start(), m.end())
+            for m in _APPLY_TOKEN_RE.finditer(text)
+            if m.group("tok")
+        ]
+        self.pos = 0
+
+    def parse(self) -> List[Dict[str, Any]]:
+        nodes = []
+        while self.pos < len(self.tokens):
+            if self._peek() == "}":
+                # Stray closing brace; skip it rather than stop early
+                self.pos += 1
                 continue
-        elif c == '}':
-            brace_count -= 1
-            if brace_count == 0:
-                return "".join(body), i
-        if brace_count >= 1:
-            body.append(c)
-    return None, None
-
-
-def extract_apply_block_logic(code: str, control_name: str) -> Dict[str, Any]:
-    """Extract detailed apply block logic from a control block."""
-    # Find the control block
-    control_pattern = rf"control\s+{control_name}\s*\([^)]*\)\s*\{{"
-    match = re.search(control_pattern, code, re.MULTILINE)
-    if not match:
-        return {"logic": [], "conditions": [], "tables_applied": []}
-    
-    # Extract the entire control block
-    block_start = match.end()
-    block_body, _ = extract_brace_block(code, block_start - 1)
-    if not block_body:
-        return {"logic": [], "conditions": [], "tables_applied": []}
-    
-    # Find apply block
-    apply_match = re.search(r"apply\s*\{", block_body)
-    if not apply_match:
-        return {"logic": [], "conditions": [], "tables_applied": []}
-    
-    apply_start = apply_match.end()
-    apply_body, _ = extract_brace_block(block_body, apply_start - 1)
-    if not apply_body:
-        return {"logic": [], "conditions": [], "tables_applied": []}
-    
-    # Parse apply block content
-    logic = []
-    conditions = []
-    tables_applied = []
-    
-    # Extract if conditions (handle nested braces properly)
-    # First, find all if statements with proper brace matching
-    i = 0
-    while i < len(apply_body):
-        if apply_body[i:i+2] == "if":
-            # Find the condition
-            paren_start = apply_body.find("(", i)
-            if paren_start == -1:
-                i += 1
+            nodes.extend(self._statement(0))
+        return nodes
+
+    def _peek(self, offset: int = 0) -> Optional[str]:
+        i = self.pos + offset
+        return self.tokens[i][0] if i < len(self.tokens) else None
+
+    def _source(self, start_tok: int, end_tok: int) -> str:
+        """Source text covered by tokens[start_tok:end_tok], whitespace collapsed."""
+        if start_tok >= end_tok:
+            return ""
+        text = self.text[self.tokens[start_tok][1]:self.tokens[end_tok - 1][2]]
+        return " ".join(text.split())
+
+    def _applies(self, start_tok: int, end_tok: int) -> List[str]:
+        """Tables invoked as <name>.apply() within a token range."""
+        tables = []
+        toks = self.tokens
+        for i in range(start_tok, end_tok - 3):
+            if toks[i + 1][0] == "." and toks[i + 2][0] == "apply" and toks[i + 3][0] == "(":
+                tables.append(toks[i][0])
+        return tables
+
+    def _skip_balanced(self) -> Tuple[int, int]:
+        """Consume a bracketed group at pos; return the token range inside it."""
+        opening = self._peek()
+        closing = {"(": ")", "{": "}"}[opening]
+        depth = 0
+        start = self.pos + 1
+        while self.pos < len(self.tokens):
+            tok = self.tokens[self.pos][0]
+            if tok == opening:
+                depth += 1
+            elif tok == closing:
+                depth -= 1
+                if depth == 0:
+                    self.pos += 1
+                    return start, self.pos - 1
+            self.pos += 1
+        return start, self.pos
+
+    def _block(self, depth: int) -> List[Dict[str, Any]]:
+        """Parse a braced block, or a single statement when no brace follows."""
+        if self._peek() != "{":
+            return self._statement(depth)
+        if depth > MAX_APPLY_DEPTH:
+            start, end = self._skip_balanced()
+            return [self._opaque(start, end)]
+        self.pos += 1
+        nodes = []
+        while self.pos < len(self.tokens) and self._peek() != "}":
+            nodes.extend(self._statement(depth))
+        self.pos += 1
+        return nodes
+
+    def _opaque(self, start: int, end: int) -> Dict[str, Any]:
+        node = {"type": "statement", "text": self._source(start, end)}
+        applies = self._applies(start, end)
+        if applies:
+            node["applies"] = applies
+        return node
+
+    def _scan_plain(self) -> int:
+        """Consume a plain statement up to ';' outside any brackets.
+
+        Returns where the statement ends, before its ';'.
+        """
+        nesting = 0
+        while self.pos < len(self.tokens):
+            tok = self._peek()
+            if tok in ("(", "{"):
+                nesting += 1
+            elif tok in (")", "}"):
+                if nesting == 0:
+                    break
+                nesting -= 1
+            elif tok == ";" and nesting == 0:
+                break
+            self.pos += 1
+        end = self.pos
+        if self._peek() == ";":
+            self.pos += 1
+        return end
+
+    def _skip_statement(self) -> Tuple[int, int]:
+        """Consume one statement without building nodes; return its token range.
+
+        Nested ifs are followed by counting those still free to take an else,
+        so a braceless chain of any length is skipped without recursion.
+        """
+        start = self.pos
+        open_ifs = 0
+        while self.pos < len(self.tokens):
+            tok = self._peek()
+            if tok in ("if", "switch") and self._peek(1) == "(":
+                self.pos += 1
+                self._skip_balanced()
+                open_ifs += tok == "if"
                 continue
-            paren_end = apply_body.find(")", paren_start)
-            if paren_end == -1:
-                i += 1
+            if tok == "{":
+                self._skip_balanced()
+            elif tok in (";", ")"):
+                self.pos += 1
+            else:
+                self._scan_plain()
+            if open_ifs and self._peek() == "else":
+                self.pos += 1
+                open_ifs -= 1
                 continue
-            
-            condition = apply_body[paren_start+1:paren_end].strip()
-            
-            # Find the opening brace
-            brace_start = apply_body.find("{", paren_end)
-            if brace_start == -1:
-                i += 1
+            break
+        return start, self.pos
+
+    def _statement(self, depth: int) -> List[Dict[str, Any]]:
+        if depth > MAX_APPLY_DEPTH:
+            # Braceless bodies (if (a) if (b) ...) nest without a '{', so the
+            # limit is applied here as well as in _block
+            start, end = self._skip_statement()
+            return [self._opaque(start, end)] if end > start else []
+        tok = self._peek()
+        if tok == "{":
+            return [{"type": "block", "body": self._block(depth + 1)}]
+        if tok == "if" and self._peek(1) == "(":
+            return [self._if(depth)]
+        if tok == "switch" and self._peek(1) == "(":
+            return [self._switch(depth)]
+        if tok in (";", ")"):
+            # Empty statement or stray closing parenthesis
+            self.pos += 1
+            return []
+
+        start = self.pos
+        end = self._scan_plain()
+
+        toks = self.tokens
+        if (
+            end - start == 5
+            and toks[start + 1][0] == "."
+            and toks[start + 2][0] == "apply"
+            and toks[start + 3][0] == "("
+            and toks[start + 4][0] == ")"
+        ):
+            return [{"type": "apply", "table": toks[start][0]}]
+        return [self._opaque(start, end)]
+
+    def _if(self, depth: int) -> Dict[str, Any]:
+        # else-if chains are built in a loop rather than by recursion, so a
+        # long chain neither deepens the call stack nor counts toward the
+        # nesting limit
+        node = {"type": "if"}
+        branch = node
+        while True:
+            self.pos += 1
+            start, end = self._skip_balanced()
+            branch["condition"] = self._source(start, end)
+            applies = self._applies(start, end)
+            if applies:
+                branch["applies"] = applies
+            branch["then"] = self._block(depth + 1)
+            if branch is node:
+                node["elif"] = []
+                node["else"] = []
+
+            if self._peek() != "else":
+                return node
+            self.pos += 1
+            if self._peek() == "if" and self._peek(1) == "(":
+                branch = {}
+                node["elif"].append(branch)
                 continue
-            
-            # Extract the body with proper brace matching
-            if_body, brace_end = extract_brace_block(apply_body, brace_start)
-            if if_body is not None:
-                conditions.append({
-                    "condition": condition,
-                    "body": if_body,
-                    "type": "if"
-                })
-                # Extract tables from if body
-                tables_in_if = re.findall(r"(\w+)\.apply\(\)", if_body)
-                tables_applied.extend(tables_in_if)
-                logic.append(f"if ({condition}) then apply: {', '.join(tables_in_if) if tables_in_if else 'no tables'}")
-                i = brace_end + 1
+            node["else"] = self._block(depth + 1)
+            return node
+
+    def _switch(self, depth: int) -> Dict[str, Any]:
+        self.pos += 1
+        start, end = self._skip_balanced()
+        node = {"type": "switch", "expression": self._source(start, end), "cases": []}
+        applies = self._applies(start, end)
+        if applies:
+            node["table"] = applies[0]
+            node["applies"] = applies
+        if self._peek() != "{":
+            return node
+        self.pos += 1
+
+        labels = []
+        while self.pos < len(self.tokens) and self._peek() != "}":
+            if self._peek(1) == ":":
+                labels.append(self._peek())
+                self.pos += 2
+                if self._peek() != "{":
+                    continue  # fall-through label
+                node["cases"].append({"labels": labels, "body": self._block(depth + 1)})
+                labels = []
             else:
-                i += 1
-        else:
-            i += 1
-    
-    # Extract direct table applications (not in if blocks)
-    # Build a cleaned version without if blocks
-    cleaned_body = apply_body
-    for cond in conditions:
-        # Remove this condition's body from cleaned_body
-        cond_pattern = f"if\\s*\\(\\s*{re.escape(cond['condition'])}\\s*\\)\\s*\\{{"
-        cleaned_body = re.sub(cond_pattern + r"[^}]*\}", "", cleaned_body, flags=re.DOTALL)
-    
-    direct_tables = re.findall(r"(\w+)\.apply\(\)", cleaned_body)
-    tables_applied.extend(direct_tables)
-    for table in direct_tables:
-        logic.append(f"apply {table}()")
-    
-    return {
-        "logic": logic,
-        "conditions": conditions,
-        "tables_applied": list(set(tables_applied)),  # Remove duplicates
-        "raw_apply_body": apply_body.strip()
-    }
-
-
-def extract_actions_from_control(code: str, control_name: str) -> List[Dict[str, Any]]:
-    """Extract action definitions from a control block."""
-    control_pattern = rf"control\s+{control_name}\s*\([^)]*\)\s*\{{"
-    match = re.search(control_pattern, code, re.MULTILINE)
-    if not match:
-        return []
-    
-    block_start = match.end()
-    block_body, _ = extract_brace_block(code, block_start - 1)
-    if not block_body:
+                self._statement(depth + 1)
+        if labels:
+            node["cases"].append({"labels": labels, "body": []})
+        self.pos += 1
+        return node
+
+
+def _flow_tables(nodes: List[Dict[str, Any]]) -> List[str]:
+    """Tables applied anywhere within a list of flow nodes, in order."""
+    tables = []
+    pending = list(reversed(nodes))
+    while pending:
+        node = pending.pop()
+        kind = node["type"]
+        tables.extend(node.get("applies", []))
+        if kind == "apply":
+            tables.append(node["table"])
+        elif kind == "if":
+            # An else-if condition is evaluated after the branches before it
+            later = [
+                {"type": "block", "applies": b.get("applies", []), "body": b["then"]}
+                for b in node["elif"]
+            ]
+            pending.extend(reversed(node["then"] + later + node["else"]))
+        elif kind == "switch":
+            for case in reversed(node["cases"]):
+                pending.extend(reversed(case["body"]))
+        elif kind == "block":
+            pending.extend(reversed(node["body"]))
+    return list(dict.fromkeys(tables))
+
+
+def _branch_tables(nodes: List[Dict[str, Any]]) -> List[str]:
+    """Tables a branch applies itself, excluding those under nested if/switch.
+
+    Nested conditionals get their own logic line, so summarising only the
+    direct applies keeps the description linear in the size of the flow.
+    """
+    tables = []
+    pending = list(reversed(nodes))
+    while pending:
+        node = pending.pop()
+        tables.extend(node.get("applies", []))
+        if node["type"] == "apply":
+            tables.append(node["table"])
+        elif node["type"] == "block":
+            pending.extend(reversed(node["body"]))
+    return list(dict.fromkeys(tables))
+
+
+def _describe_flow(
+    nodes: List[Dict[str, Any]], logic: List[str], conditions: List[Condition]
+) -> None:
+    """Append human-readable logic lines and condition summaries for a flow."""
+
+    def summary(tables: List[str]) -> str:
+        return ", ".join(tables) if tables else "no tables"
+
+    # Work stack of ("node", node, indent, if-keyword) and ("line", text, condition)
+    pending = [("node", node, "", "if") for node in reversed(nodes)]
+    while pending:
+        item = pending.pop()
+        if item[0] == "line":
+            logic.append(item[1])
+            conditions.append(item[2])
+            continue
+
+        _, node, pad, keyword = item
+        inner = pad + "  "
+        kind = node["type"]
+        if kind == "apply":
+            logic.append(f"{pad}apply {node['table']}()")
+        elif kind == "block":
+            pending.extend(("node", n, pad, "if") for n in reversed(node["body"]))
+        elif kind == "if":
+            else_branch = node["else"]
+            if else_branch:
+                tables = _branch_tables(else_branch)
+                pending.extend(("node", n, inner, "if") for n in reversed(else_branch))
+                pending.append((
+                    "line",
+                    f"{pad}else apply: {summary(tables)}",
+                    Condition("else", "else", tables),
+                ))
+            branches = [(node, keyword)] + [(b, "else if") for b in node["elif"]]
+            for branch, branch_keyword in reversed(branches):
+                tables = _branch_tables(branch["then"])
+                pending.extend(("node", n, inner, "if") for n in reversed(branch["then"]))
+                pending.append((
+                    "line",
+                    f"{pad}{branch_keyword} ({branch['condition']}) then apply: {summary(tables)}",
+                    Condition(branch["condition"], branch_keyword, tables),
+                ))
+        elif kind == "switch":
+            logic.append(f"{pad}switch ({node['expression']})")
+            for case in reversed(node["cases"]):
+                tables = _branch_tables(case["body"])
+                label = ", ".join(case["labels"])
+                pending.extend(("node", n, inner + "  ", "if") for n in reversed(case["body"]))
+                pending.append((
+                    "line",
+                    f"{inner}case {label}: apply: {summary(tables)}",
+                    Condition(f"{node['expression']}: {label}", "case", tables),
+                ))
+
+
+def extract_apply_block_logic(index: BlockIndex, control_name: str) -> ApplyLogic:
+    """Extract detailed apply block logic from a control block of a lexed source."""
+    return _apply_logic(index, index.find("control", control_name))
+
+
+def _apply_logic(index: BlockIndex, control: Optional[Block]) -> ApplyLogic:
+    # Find the control's apply block
+    if control is None:
+        return ApplyLogic()
+
+    apply_blocks = index.children(control, "apply")
+    if not apply_blocks:
+        return ApplyLogic()
+    apply_body = index.body(apply_blocks[0])
+
+    flow = ApplyBlockParser(apply_body).parse()
+    logic = []
+    conditions = []
+    _describe_flow(flow, logic, conditions)
+
+    return ApplyLogic(
+        logic=logic,
+        conditions=conditions,
+        tables_applied=_flow_tables(flow),
+        flow=flow,
+        raw_apply_body=apply_body.strip(),
+    )
+
+
+def extract_actions_from_control(index: BlockIndex, control_name: str) -> List[Action]:
+    """Extract action definitions from a control block of a lexed source."""
+    return _control_actions(index, index.find("control", control_name))
+
+
+# Left-hand side of an assignment statement (not ==, <=, >=, !=)
+_ASSIGNMENT_RE = re.compile(r"(?:^|[;{}])\s*([A-Za-z_][\w.\[\]]*)\s*=(?!=)")
+# Headers made valid or invalid, which counts as writing them
+_VALIDITY_RE = re.compile(r"\b([A-Za-z_][\w.\[\]]*)\.set(?:Valid|Invalid)\s*\(")
+# Dotted field references such as hdr.ipv4.ttl or hdr.mpls[0].label, and
+# whether a method call follows
+_FIELD_REF_RE = re.compile(
+    r"(?<![\w.])[A-Za-z_]\w*(?:\[[^\]]*\])?(?:\.[A-Za-z_]\w*(?:\[[^\]]*\])?)+(\s*\()?"
+)
+
+
+def field_refs(text: str) -> List[str]:
+    """Fields referenced in an expression, in order and without duplicates.
+
+    For a method call the object is the reference: "hdr.ipv4.isValid()"
+    refers to hdr.ipv4.
+    """
+    refs = []
+    for match in _FIELD_REF_RE.finditer(text):
+        ref = match.group()
+        if match.group(1):
+            ref = ref[:match.start(1) - match.start()].rpartition(".")[0]
+        refs.append(ref)
+    return list(dict.fromkeys(refs))
+
+
+def _action_writes(body: str) -> List[str]:
+    return list(dict.fromkeys(_ASSIGNMENT_RE.findall(body) + _VALIDITY_RE.findall(body)))
+
+
+def _action_reads(body: str) -> List[str]:
+    """Fields an action body reads: references other than assignment targets and setValid()."""
+    body = _ASSIGNMENT_RE.sub(lambda m: m.group()[:m.start(1) - m.start()] + "=", body)
+    return field_refs(_VALIDITY_RE.sub("(", body))
+
+
+def _control_actions(index: BlockIndex, control: Optional[Block]) -> List[Action]:
+    if control is None:
         return []
-    
+
     actions = []
-    # Find all action definitions
-    action_pattern = r"action\s+(\w+)\s*\(([^)]*)\)\s*\{([^}]+)\}"
-    for action_match in re.finditer(action_pattern, block_body, re.DOTALL):
-        action_name = action_match.group(1)
-        params = action_match.group(2).strip()
-        body = action_match.group(3).strip()
+    for action_block in index.descendants(control, "action"):
+        action_name = action_block.name
+        params = action_block.params.strip()
+        body = index.body(action_block).strip()
         
         # Parse parameters
         param_list = []
@@ -142,10 +638,7 @@ def extract_actions_from_control(code: str, control_name: str) -> List[Dict[str,
                 if p:
                     parts = p.split()
                     if len(parts) >= 2:
-                        param_list.append({
-                            "type": parts[0],
-                            "name": parts[-1]
-                        })
+                        param_list.append(Param(type=parts[0], name=parts[-1]))
         
         # Extract action body operations
         operations = []
@@ -156,131 +649,186 @@ def extract_actions_from_control(code: str, control_name: str) -> List[Dict[str,
         if "hdr." in body:
             operations.append("modify_headers")
         
-        actions.append({
-            "name": action_name,
-            "parameters": param_list,
-            "operations": operations,
-            "body_preview": body[:200] + "..." if len(body) > 200 else body
-        })
+        actions.append(Action(
+            name=action_name,
+            parameters=param_list,
+            operations=operations,
+            body_preview=body[:200] + "..." if len(body) > 200 else body,
+            writes=_action_writes(body),
+            reads=_action_reads(body),
+        ))
     
     return actions
 
 
-def parse_p4_structure(path: str) -> Dict[str, Any]:
-    """Parse P4 file and extract comprehensive structure."""
-    with open(path, encoding='utf-8') as f:
-        code = f.read()
+# Table properties
+_TABLE_KEYS_RE = re.compile(r"key\s*=\s*\{([^}]*)\}")
+_TABLE_ACTIONS_RE = re.compile(r"actions\s*=\s*\{([^}]*)\}")
+_TABLE_SIZE_RE = re.compile(r"size\s*=\s*(\d+)")
+_DEFAULT_ACTION_RE = re.compile(r"default_action\s*=\s*(\w+)\s*\([^)]*\)")
+
+
+def _table_info(index: BlockIndex, table_block: Block) -> Optional[Table]:
+    """Extract keys, actions, size and default action from a table block."""
+    full_table = index.body(table_block)
+    keys_match = _TABLE_KEYS_RE.search(full_table)
+    acts_match = _TABLE_ACTIONS_RE.search(full_table)
+    if not keys_match or not acts_match:
+        return None
+    keys_raw = keys_match.group(1)
+    acts_raw = acts_match.group(1)
+    
+    keys = [k.strip().replace("\n", " ").replace("\t", " ") 
+            for k in keys_raw.split(";") if k.strip()]
+    acts = [a.strip().split("(")[0].strip() 
+            for a in acts_raw.split(";") if a.strip()]
+    
+    # Extract table properties
+    size_match = _TABLE_SIZE_RE.search(full_table)
+    size = int(size_match.group(1)) if size_match else None
+    
+    default_action_match = _DEFAULT_ACTION_RE.search(full_table)
+    default_action = default_action_match.group(1) if default_action_match else None
+    
+    return Table(keys=keys, actions=acts, size=size, default_action=default_action)
+
+
+_TRANSITION_TARGET_RE = re.compile(r"transition\s+(\w+)")
+
+
+def _base_block_info(index: BlockIndex, block: Block) -> BlockInfo:
+    """Build the structure entry for a parser, control or deparser block."""
+    if block.kind == "control":
+        with stage("actions"):
+            actions = _control_actions(index, block)
+        with stage("apply_logic"):
+            apply_logic = _apply_logic(index, block)
+        # Tables list comes from the apply logic
+        return ControlBlock(
+            type=block.kind,
+            actions=actions,
+            tables=apply_logic.tables_applied,
+            apply_logic=apply_logic,
+        )
+
+    if block.kind == "parser":
+        info = ParserBlock(type=block.kind)
+        block_body = index.body(block)
+        if block_body:
+            # Extract states and transitions
+            with stage("parser_states"):
+                states = index.descendants(block, "state")
+                info.states = [s.name for s in states]
+                info.extracts = EXTRACT_RE.findall(block_body)
+                info.transitions = _TRANSITION_TARGET_RE.findall(block_body)
+            with stage("parser_graph"):
+                info.graph = build_parser_graph([(s.name, index.body(s)) for s in states])
+        return info
+
+    return BlockInfo(type=block.kind)
+
+
+def split_units(index: BlockIndex) -> List[Tuple[int, int, Optional[Block]]]:
+    """Split a source into top-level blocks and the global text between them.
 
+    Returns contiguous (start, end, block) spans covering the whole source;
+    block is None for text outside any top-level block.
+    """
+    units = []
+    pos = 0
+    for block in index.top_level():
+        if block.start > pos:
+            units.append((pos, block.start, None))
+        units.append((block.start, block.body_end + 1, block))
+        pos = block.body_end + 1
+    if pos < len(index.code):
+        units.append((pos, len(index.code), None))
+    return units
+
+
+_CONST_RE = re.compile(r"const\s+(\w+)\s+([0-9xa-fA-F]+)")
+_EXTERN_RE = re.compile(r"(Counter|Meter|Register|Digest)\s*<[^>]*>\s+(\w+)")
+
+
+def extract_fragment(
+    index: BlockIndex, start: int, end: int, block: Optional[Block]
+) -> Dict[str, Any]:
+    """Extract everything declared in one unit from split_units."""
+    text = index.code[start:end]
+    with stage("globals"):
+        # Blocks never hold typedefs, structs or unions, so only global text is scanned
+        typedefs, aggregates = parse_declarations(text) if block is None else ({}, {})
+        fragment = {
+            "blocks": [],
+            "tables": [],
+            "headers": [],
+            "enums": [],
+            # --- Constants / externs ---
+            "consts": _CONST_RE.findall(text),
+            "externs": [
+                Extern(type=e[0], name=e[1])
+                for e in _EXTERN_RE.findall(text)
+            ],
+            "typedefs": typedefs,
+            "aggregates": aggregates,
+        }
+    if block is None:
+        return fragment
+
+    for member in [block] + index.descendants(block):
+        if member.kind in ("parser", "control", "deparser"):
+            fragment["blocks"].append((member.name, _base_block_info(index, member)))
+        elif member.kind == "table":
+            with stage("tables"):
+                info = _table_info(index, member)
+            if info is not None:
+                fragment["tables"].append((member.name, info))
+        elif member.kind == "header":
+            with stage("headers"):
+                fragment["headers"].append((member.name, header_fields(index.body(member))))
+        elif member.kind == "enum":
+            body = index.body(member)
+            with stage("enums"):
+                fragment["enums"].append(
+                    (member.name, [v.split("=")[0].strip() for v in body.split(",") if v.strip()])
+                )
+    return fragment
+
+
+def assemble_structure(
+    fragments: List[Dict[str, Any]], filename: str, pre: Optional[Preprocessed] = None
+) -> Dict[str, Any]:
+    """Merge unit fragments, in source order, into the parse_p4_structure shape.
+
+    With the preprocessing result of the source, fragments of included files
+    come first and the includes and macros are reported.
+    """
+    if pre is not None:
+        fragments = pre.fragments + fragments
     structure = {}
 
     # --- Base blocks (parser, controls, deparser) ---
     for block_type in ["parser", "control", "deparser"]:
-        for name in re.findall(rf"{block_type}\s+(\w+)", code):
-            structure[name] = {
-                "type": block_type,
-                "actions": [],
-                "tables": [],
-                "externs": [],
-                "consts": [],
-                "headers": [],
-                "apply_logic": {}
-            }
-
-    # --- Tables: match fields + keys + actions ---
-    # Improved regex to handle multi-line table definitions
-    table_pattern = re.compile(
-        r"table\s+(\w+)\s*\{([^}]*?key\s*=\s*\{([^}]*)\}[^}]*?actions\s*=\s*\{([^}]*)\}[^}]*?)\}",
-        re.S,
-    )
+        for fragment in fragments:
+            for name, info in fragment["blocks"]:
+                if info.type == block_type:
+                    structure[name] = info
+
     tables = {}
-    for match in table_pattern.finditer(code):
-        name = match.group(1)
-        full_table = match.group(2)
-        keys_raw = match.group(3)
-        acts_raw = match.group(4)
-        
-        keys = [k.strip().replace("\n", " ").replace("\t", " ") 
-                for k in keys_raw.split(";") if k.strip()]
-        acts = [a.strip().split("(")[0].strip() 
-                for a in acts_raw.split(";") if a.strip()]
-        
-        # Extract table properties
-        size_match = re.search(r"size\s*=\s*(\d+)", full_table)
-        size = int(size_match.group(1)) if size_match else None
-        
-        default_action_match = re.search(r"default_action\s*=\s*(\w+)\s*\([^)]*\)", full_table)
-        default_action = default_action_match.group(1) if default_action_match else None
-        
-        tables[name] = {
-            "keys": keys,
-            "actions": acts,
-            "size": size,
-            "default_action": default_action
-        }
-    
-    # --- Extract actions from control blocks ---
-    control_actions = {}
-    for name in structure.keys():
-        if structure[name]["type"] == "control":
-            control_actions[name] = extract_actions_from_control(code, name)
-            structure[name]["actions"] = control_actions[name]
-    
-    # --- Extract apply block logic ---
-    for name in structure.keys():
-        if structure[name]["type"] == "control":
-            apply_logic = extract_apply_block_logic(code, name)
-            structure[name]["apply_logic"] = apply_logic
-            # Update tables list from apply logic
-            structure[name]["tables"] = apply_logic.get("tables_applied", [])
-
-    # --- Parser states and transitions ---
-    for name in structure.keys():
-        if structure[name]["type"] == "parser":
-            parser_pattern = rf"parser\s+{name}\s*\([^)]*\)\s*\{{"
-            match = re.search(parser_pattern, code, re.MULTILINE)
-            if match:
-                block_start = match.end()
-                block_body, _ = extract_brace_block(code, block_start - 1)
-                if block_body:
-                    # Extract states
-                    states = re.findall(r"state\s+(\w+)\s*\{", block_body)
-                    extracts = re.findall(r"packet\.extract\(([^)]+)\)", block_body)
-                    transitions = re.findall(r"transition\s+(\w+)", block_body)
-                    
-                    structure[name]["states"] = states
-                    structure[name]["extracts"] = extracts
-                    structure[name]["transitions"] = transitions
-
-    # --- Constants / enums ---
-    consts = re.findall(r"const\s+(\w+)\s+([0-9xa-fA-F]+)", code)
-    enums = re.findall(r"enum\s+(\w+)\s*\{([^}]*)\}", code, re.S)
-    enum_map = {
-        name: [v.split("=")[0].strip() for v in body.split(",") if v.strip()]
-        for name, body in enums
-    }
-
-    # --- Externs ---
-    externs = re.findall(r"(Counter|Meter|Register|Digest)\s*<[^>]*>\s+(\w+)", code)
-    extern_objs = [{"type": e[0], "name": e[1]} for e in externs]
-
-    # --- Headers ---
-    headers = re.findall(r"header\s+(\w+)\s*\{([^}]*)\}", code, re.S)
     header_defs = {}
-    for name, body in headers:
-        fields = []
-        for f in body.split(";"):
-            f = f.strip()
-            if ":" in f:
-                parts = f.split(":")
-                if len(parts) == 2:
-                    field_name = parts[0].strip()
-                    field_type = parts[1].strip()
-                    fields.append({
-                        "field": field_name,
-                        "bits": field_type,
-                        "type": "bit" if "bit<" in field_type else "other"
-                    })
-        header_defs[name] = fields
+    enum_map = {}
+    consts = []
+    extern_objs = []
+    typedefs = {}
+    aggregates = {}
+    for fragment in fragments:
+        tables.update(fragment["tables"])
+        header_defs.update(fragment["headers"])
+        enum_map.update(fragment["enums"])
+        consts.extend(fragment["consts"])
+        extern_objs.extend(fragment["externs"])
+        typedefs.update(fragment["typedefs"])
+        aggregates.update(fragment["aggregates"])
 
     # --- Assemble global info ---
     structure["_tables"] = tables
@@ -288,11 +836,82 @@ def parse_p4_structure(path: str) -> Dict[str, Any]:
     structure["_enums"] = enum_map
     structure["_externs"] = extern_objs
     structure["_headers"] = header_defs
-    structure["_filename"] = Path(path).name
+    structure["_layouts"] = compile_layouts(header_defs, aggregates, typedefs)
+    structure["_includes"] = pre.includes if pre is not None else []
+    structure["_defines"] = pre.defines if pre is not None else {}
+    structure["_filename"] = filename
 
     return structure
 
 
+def read_source(path: str) -> str:
+    """Read a UTF-8 source file, decoding straight from a memory map.
+
+    Decoding the mapped pages avoids the intermediate bytes copy that
+    open().read() makes before decoding.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with stage("read"), mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return str(mapped, "utf-8")
+
+
+def parse_p4_structure(path: str) -> Dict[str, Any]:
+    """Parse P4 file and extract comprehensive structure."""
+    return parse_p4_source(read_source(path), Path(path).name, os.path.dirname(path))
+
+
+def parse_p4_file(path: str, filename: str) -> Dict[str, Any]:
+    """Parse a P4 file saved under another name, such as a streamed upload.
+
+    The file's directory is not searched for quoted includes: uploads share
+    it, so only the configured include path is.
+    """
+    return parse_p4_source(read_source(path), filename)
+
+
+def parse_file_with_deps(path: str, filename: str) -> Tuple[Dict[str, Any], List[Tuple]]:
+    """parse_p4_file, plus the included files the structure depends on."""
+    return parse_source_with_deps(read_source(path), filename)
+
+
+def parse_fragments(code: str) -> List[Dict[str, Any]]:
+    """Lex preprocessed source and extract the fragment of every unit."""
+    index = BlockIndex(code)
+    return [extract_fragment(index, start, end, block) for start, end, block in split_units(index)]
+
+
+def preprocess_source(code: str, base_dir: Optional[str] = None) -> Preprocessed:
+    """Preprocess source text; local includes are resolved from base_dir."""
+    with stage("preprocess"):
+        return preprocess(code, base_dir, parse_fragments)
+
+
+def parse_p4_source(code: str, filename: str, base_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Parse P4 source text and extract comprehensive structure."""
+    return parse_source_with_deps(code, filename, base_dir)[0]
+
+
+def parse_source_with_deps(
+    code: str, filename: str, base_dir: Optional[str] = None
+) -> Tuple[Dict[str, Any], List[Tuple]]:
+    """parse_p4_source, plus the deps of every included file (see Preprocessed.deps)."""
+    pre = preprocess_source(code, base_dir)
+    with stage("lex"):
+        index = BlockIndex(pre.code)
+        units = split_units(index)
+    fragments = [extract_fragment(index, start, end, block) for start, end, block in units]
+    with stage("assemble"):
+        structure = assemble_structure(fragments, filename, pre)
+
+    count("blocks", sum(index.kind_counts.values()))
+    count("tables", len(structure["_tables"]))
+    count("states", len(index.of_kind("state")))
+    count("actions", len(index.of_kind("action")))
+    return structure, pre.deps
+
+
 if __name__ == "__main__":
     import sys
-    print(json.dumps(parse_p4_structure(sys.argv[1]), indent=2))
\ No newline at end of file
+    print(dumps(parse_p4_structure(sys.argv[1]), indent=True).decode())
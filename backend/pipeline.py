@@ -0,0 +1,230 @@
+"""Match-action pipeline model of each control block.
+
+Tables are related by the fields they touch: the fields a table matches on
+(its keys, plus conditions gating it) and the fields its actions read and
+write. For tables A and B, with A applied before B:
+
+    match       B matches on, or is gated by, a field A's actions write
+    action      B's actions read or write a field A's actions write
+    reverse     B's actions write a field A matches on or A's actions read
+    successor   whether B runs depends on A's result (hit or action_run)
+
+Match and action dependencies put B at least one stage after A. Reverse and
+successor dependencies let B share A's stage. Tables with no path of
+dependencies between them can be placed in the same stage and run in
+parallel.
+
+Tables are visited once, in apply order. Each field reference is checked
+against per-field maps of the tables that wrote or read it, so the pass is
+linear in the number of field references rather than quadratic in tables.
+The maps also roll each path up into its prefixes, so hdr.ipv4 and
+hdr.ipv4.ttl overlap. Per field, only the latest table and the table in the
+highest stage are kept. Those two are enough to place B, and bound the
+graph at a few edges per field reference.
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from model import ControlBlock
+from parser_utils import field_refs
+
+# Dependency kinds that require a later stage
+FULL_STAGE = ("match", "action")
+
+_INDEX_RE = re.compile(r"\[[^\]]*\]")
+
+
+@lru_cache(maxsize=65536)
+def _prefixes(path: str) -> Tuple[str, ...]:
+    """"hdr.ipv4.ttl" -> ["hdr", "hdr.ipv4", "hdr.ipv4.ttl"]; stack indexes are dropped."""
+    parts = _INDEX_RE.sub("", path).split(".")
+    return tuple(".".join(parts[:i]) for i in range(1, len(parts) + 1))
+
+
+class _FieldMap:
+    """Per field path: the latest table to touch it and the one in the highest stage."""
+
+    def __init__(self):
+        # path -> ((stage, table) latest, (stage, table) highest)
+        self.exact: Dict[str, Tuple[Tuple[int, str], Tuple[int, str]]] = {}
+        # Same, over every path a path is a prefix of
+        self.subtree: Dict[str, Tuple[Tuple[int, str], Tuple[int, str]]] = {}
+
+    @staticmethod
+    def _merge(entries: Dict[str, Any], path: str, entry: Tuple[int, str]) -> None:
+        previous = entries.get(path)
+        if previous is None or entry[0] >= previous[1][0]:
+            entries[path] = (entry, entry)
+        else:
+            entries[path] = (entry, previous[1])
+
+    def add(self, path: str, stage: int, table: str) -> None:
+        prefixes = _prefixes(path)
+        self._merge(self.exact, prefixes[-1], (stage, table))
+        for prefix in prefixes:
+            self._merge(self.subtree, prefix, (stage, table))
+
+    def overlapping(self, path: str) -> List[Tuple[int, str]]:
+        """(stage, table) of tables touching path, a prefix of it, or a path under it."""
+        prefixes = _prefixes(path)
+        found = []
+        for prefix in prefixes[:-1]:
+            found.extend(self.exact.get(prefix, ()))
+        found.extend(self.subtree.get(prefixes[-1], ()))
+        return found
+
+
+class _ControlPipeline:
+    def __init__(self, tables: Dict[str, Any], actions: Dict[str, Any]):
+        self.tables = tables
+        self.actions = actions
+        self.writers = _FieldMap()
+        self.match_readers = _FieldMap()
+        self.action_readers = _FieldMap()
+        self.stage: Dict[str, int] = {}
+        # Table a table's stage was set by, for the critical path
+        self.binding: Dict[str, Optional[str]] = {}
+        self.info: Dict[str, Dict[str, Any]] = {}
+        self.edges: Dict[Tuple[str, str], Dict[str, Dict[str, None]]] = {}
+
+    def _fields(self, table: str) -> Tuple[List[str], List[str], List[str]]:
+        """Fields a table matches on, and fields its actions read and write."""
+        info = self.tables.get(table)
+        if info is None:
+            return [], [], []
+        keys = []
+        for key in info.keys:
+            keys.extend(field_refs(key.partition(":")[0]))
+        reads: Dict[str, None] = {}
+        writes: Dict[str, None] = {}
+        for name in info.actions:
+            action = self.actions.get(name)
+            if action is not None:
+                reads.update(dict.fromkeys(action.reads))
+                writes.update(dict.fromkeys(action.writes))
+        return list(dict.fromkeys(keys)), list(reads), list(writes)
+
+    def visit(self, table: str, gates: List[str], controllers: List[str]) -> None:
+        keys, reads, writes = self._fields(table)
+        stage = 0
+        binding = None
+
+        def require(found: List[Tuple[int, str]], kind: str, field: str) -> None:
+            nonlocal stage, binding
+            offset = 1 if kind in FULL_STAGE else 0
+            for other_stage, other in found:
+                if other == table:
+                    continue
+                edge = self.edges.setdefault((other, table), {"kinds": {}, "fields": {}})
+                edge["kinds"][kind] = None
+                if field:
+                    edge["fields"][field] = None
+                if other_stage + offset > stage:
+                    stage = other_stage + offset
+                    binding = other
+
+        for field in keys + gates:
+            require(self.writers.overlapping(field), "match", field)
+        for field in reads + writes:
+            require(self.writers.overlapping(field), "action", field)
+        for field in writes:
+            require(self.match_readers.overlapping(field), "reverse", field)
+            require(self.action_readers.overlapping(field), "reverse", field)
+        require([(self.stage[c], c) for c in controllers if c in self.stage], "successor", "")
+
+        if stage >= self.stage.get(table, -1):
+            self.stage[table] = stage
+            self.binding[table] = binding
+        stage = self.stage[table]
+        for field in writes:
+            self.writers.add(field, stage, table)
+        for field in keys + gates:
+            self.match_readers.add(field, stage, table)
+        for field in reads:
+            self.action_readers.add(field, stage, table)
+        self.info.setdefault(table, {
+            "table": table,
+            "match_fields": keys,
+            "gated_by": list(dict.fromkeys(gates)),
+            "action_reads": reads,
+            "action_writes": writes,
+        })
+
+    def walk(self, nodes: List[Dict[str, Any]], gates: List[str], controllers: List[str]) -> None:
+        for node in nodes:
+            kind = node["type"]
+            applies = node.get("applies", [])
+            for table in applies:
+                self.visit(table, gates, controllers)
+            if kind == "apply":
+                self.visit(node["table"], gates, controllers)
+            elif kind == "block":
+                self.walk(node["body"], gates, controllers)
+            elif kind == "if":
+                # Each branch is gated by its own condition and every one before it
+                branch_gates, branch_controllers = gates, controllers
+                for branch in [node] + node["elif"]:
+                    branch_applies = branch.get("applies", [])
+                    if branch is not node:
+                        for table in branch_applies:
+                            self.visit(table, branch_gates, branch_controllers)
+                    condition = [f for f in field_refs(branch["condition"]) if f not in branch_applies]
+                    branch_gates = branch_gates + condition
+                    branch_controllers = branch_controllers + branch_applies
+                    self.walk(branch["then"], branch_gates, branch_controllers)
+                self.walk(node["else"], branch_gates, branch_controllers)
+            elif kind == "switch":
+                for case in node["cases"]:
+                    self.walk(case["body"], gates, controllers + applies)
+
+    def result(self) -> Dict[str, Any]:
+        stages: List[List[str]] = []
+        for table in self.info:
+            stage = self.stage[table]
+            while len(stages) <= stage:
+                stages.append([])
+            stages[stage].append(table)
+
+        critical: List[str] = []
+        if self.stage:
+            table = max(self.info, key=lambda t: self.stage[t])
+            while table is not None:
+                critical.append(table)
+                table = self.binding.get(table)
+            critical.reverse()
+
+        return {
+            "stages": len(stages),
+            "parallel": stages,
+            "tables": [{**info, "stage": self.stage[name]} for name, info in self.info.items()],
+            "dependencies": [
+                {"from": a, "to": b, "kinds": list(edge["kinds"]), "fields": list(edge["fields"])}
+                for (a, b), edge in self.edges.items()
+            ],
+            "critical_path": critical,
+        }
+
+
+def control_pipeline(structure: Dict[str, Any], name: str) -> Optional[Dict[str, Any]]:
+    """Dependency graph and stage assignment of one control block, or None."""
+    block = structure.get(name)
+    if not isinstance(block, ControlBlock):
+        return None
+    actions = {a.name: a for a in block.actions}
+    pipeline = _ControlPipeline(structure.get("_tables") or {}, actions)
+    pipeline.walk(block.apply_logic.flow, [], [])
+    return pipeline.result()
+
+
+def build_pipelines(structure: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Pipeline models of every control block that applies tables."""
+    pipelines = {}
+    for name in structure:
+        if name.startswith("_"):
+            continue
+        pipeline = control_pipeline(structure, name)
+        if pipeline is not None and pipeline["tables"]:
+            pipelines[name] = pipeline
+    return pipelines
@@ -0,0 +1,524 @@
+"""C-style preprocessing of P4 sources.
+
+preprocess() strips comments, applies #define/#undef and the #if family,
+expands object-like macros and resolves #include directives. Comments,
+directives and inactive regions are blanked rather than removed, so offsets
+and line numbers only shift where a macro is expanded.
+
+Included files are not pasted into the source. Each is preprocessed and
+parsed into fragments on its own, and the result is memoized per process by
+path (plus the macros defined when it was included) and revalidated with
+deps_current(). Shared architecture headers such as core.p4 and v1model.p4 are
+therefore processed once per worker, not once per upload.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import settings
+
+MAX_INCLUDE_DEPTH = 32
+# Macro expansion stops once substituted macro bodies exceed the size of the
+# input by this many characters (each substitution also costs
+# EXPANSION_OVERHEAD), or once this many macros are nested
+MAX_EXPANSION = 1 << 20
+EXPANSION_OVERHEAD = 32
+MAX_EXPANSION_DEPTH = 64
+# #if expressions use 64-bit signed arithmetic like the C preprocessor's intmax_t
+INT_BITS = 64
+MAX_CONDITION_TOKENS = 4096
+MAX_CONDITION_DEPTH = 256
+
+_COMMENT_RE = re.compile(r'"(?:\\.|[^"\\\n])*"|//[^\n]*|/\*.*?(?:\*/|\Z)', re.S)
+_DIRECTIVE_RE = re.compile(r"^[ \t]*#[ \t]*(\w+)((?:[^\n\\]|\\.)*)", re.M | re.S)
+_DEFINE_RE = re.compile(r"(\w+)(\()?\s*(.*)", re.S)
+_INCLUDE_RE = re.compile(r'\s*(?:<([^>]+)>|"([^"]+)")')
+_DEFINED_RE = re.compile(r"\bdefined\s*(?:\(\s*(\w+)\s*\)|(\w+))")
+_IDENT_RE = re.compile(r"\b[A-Za-z_]\w*\b")
+_CONDITION_TOKEN_RE = re.compile(
+    r"\s*(?:(?P<num>0[xX][0-9a-fA-F]+|\d+)[uUlL]*\b"
+    r"|(?P<op>&&|\|\||<<|>>|<=|>=|==|!=|[-+*/%<>&|^!~()?:]))"
+)
+_NON_NEWLINE_RE = re.compile(r"[^\n]")
+
+
+@dataclass
+class Preprocessed:
+    """Preprocessed text of one file plus what its includes contributed."""
+
+    code: str
+    # Fragments parsed from included files, in inclusion order
+    fragments: List[Dict[str, Any]] = field(default_factory=list)
+    includes: List[Dict[str, Any]] = field(default_factory=list)
+    # Object-like macros defined at the end of the file
+    defines: Dict[str, str] = field(default_factory=dict)
+    # (path, mtime_ns, size, sha256) of every included file, to validate
+    # memoized includes and cached parses
+    deps: List[Tuple[str, int, int, str]] = field(default_factory=list)
+
+
+def _blank(text: str) -> str:
+    """Replace text with spaces of the same length, keeping line breaks."""
+    return _NON_NEWLINE_RE.sub(" ", text)
+
+
+def strip_comments(code: str) -> str:
+    """Blank // and /* */ comments, leaving string literals alone."""
+    if "/" not in code:
+        return code
+    return _COMMENT_RE.sub(lambda m: m.group() if m.group()[0] == '"' else _blank(m.group()), code)
+
+
+def macro_pattern(macros: Dict[str, str]) -> "Optional[re.Pattern]":
+    """One alternation matching the names of the macros in macros.
+
+    There is no leading \\b, which would stop re from skipping ahead to
+    candidate first characters; expand() rejects matches that start inside
+    an identifier.
+    """
+    names = sorted(name for name in macros if _IDENT_RE.fullmatch(name))
+    if not names:
+        return None
+    return re.compile(r"(?:" + "|".join(map(re.escape, names)) + r")(?!\w)")
+
+
+def expand(
+    text: str,
+    macros: Dict[str, str],
+    budget: Optional[List[int]] = None,
+    pattern: "Optional[re.Pattern]" = None,
+) -> str:
+    """Expand object-like macros, recursively, never re-expanding a macro in itself.
+
+    budget is a one-element list of characters expansion may still add, shared
+    by the calls for one source; it defaults to MAX_EXPANSION for this text.
+    Macros past the budget or MAX_EXPANSION_DEPTH are left unexpanded.
+    pattern is macro_pattern(macros), when the caller keeps one; text is then
+    only scanned for macro names rather than passing every identifier to the
+    substitution callback.
+    """
+    if not macros:
+        return text
+    if budget is None:
+        budget = [MAX_EXPANSION]
+
+    def replace(match: "re.Match", active: frozenset = frozenset()) -> str:
+        name = match.group()
+        if name not in macros or name in active or len(active) >= MAX_EXPANSION_DEPTH:
+            return name
+        start = match.start()
+        if start and (match.string[start - 1].isalnum() or match.string[start - 1] == "_"):
+            return name
+        body = macros[name]
+        if budget[0] < len(body) + EXPANSION_OVERHEAD:
+            return name
+        budget[0] -= len(body) + EXPANSION_OVERHEAD
+        inner = active | {name}
+        return _IDENT_RE.sub(lambda m: replace(m, inner), body)
+
+    return (pattern or _IDENT_RE).sub(replace, text)
+
+
+class _ConditionError(ValueError):
+    """Raised for #if expressions outside the supported integer subset."""
+
+
+# Binary operators by precedence, loosest first
+_BINARY_PRECEDENCE = {
+    "||": 1, "&&": 2, "|": 3, "^": 4, "&": 5,
+    "==": 6, "!=": 6, "<": 7, ">": 7, "<=": 7, ">=": 7,
+    "<<": 8, ">>": 8, "+": 9, "-": 9, "*": 10, "/": 10, "%": 10,
+}
+
+
+def _wrap(value: int) -> int:
+    """Truncate to a signed INT_BITS-bit integer."""
+    half = 1 << (INT_BITS - 1)
+    return ((value + half) & ((1 << INT_BITS) - 1)) - half
+
+
+def _binary(op: str, a: int, b: int) -> int:
+    if op in ("/", "%"):
+        if b == 0:
+            raise _ConditionError("division by zero")
+        # C division truncates toward zero
+        q = abs(a) // abs(b)
+        if (a < 0) != (b < 0):
+            q = -q
+        return _wrap(q) if op == "/" else _wrap(a - b * q)
+    if op in ("<<", ">>"):
+        if not 0 <= b < INT_BITS:
+            raise _ConditionError("shift count out of range")
+        return _wrap(a << b) if op == "<<" else a >> b
+    if op == "*":
+        return _wrap(a * b)
+    if op == "+":
+        return _wrap(a + b)
+    if op == "-":
+        return _wrap(a - b)
+    if op == "&":
+        return a & b
+    if op == "^":
+        return a ^ b
+    if op == "|":
+        return a | b
+    return int({
+        "==": a == b, "!=": a != b, "<": a < b, ">": a > b, "<=": a <= b, ">=": a >= b,
+        "&&": bool(a) and bool(b), "||": bool(a) or bool(b),
+    }[op])
+
+
+class _ConditionParser:
+    """Precedence-climbing evaluator for the integer expressions of #if.
+
+    Supports the C preprocessor's operators except the comma operator. There
+    is no exponentiation, shift counts must be below INT_BITS and every result
+    is truncated to INT_BITS bits, so evaluation takes time linear in the
+    number of tokens.
+    """
+
+    def __init__(self, text: str):
+        self.tokens: List[Tuple[str, str]] = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            m = _CONDITION_TOKEN_RE.match(text, pos)
+            if m is None or m.end() == pos:
+                raise _ConditionError(f"unexpected {text[pos:pos + 10]!r}")
+            num = m.group("num")
+            if num is not None:
+                try:
+                    value = int(num, 16) if num[:2] in ("0x", "0X") else int(num, 8 if num[0] == "0" else 10)
+                except ValueError:
+                    raise _ConditionError(f"invalid number {num!r}") from None
+                self.tokens.append(("num", _wrap(value)))
+            else:
+                self.tokens.append(("op", m.group("op")))
+            if len(self.tokens) > MAX_CONDITION_TOKENS:
+                raise _ConditionError("expression too long")
+            pos = m.end()
+        self.pos = 0
+        # Nonzero inside the unevaluated operand of &&, || or ?:, where
+        # errors such as division by zero do not count, as in C
+        self.skipping = 0
+
+    def _next(self) -> Tuple[str, Any]:
+        if self.pos >= len(self.tokens):
+            raise _ConditionError("unexpected end of expression")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _peek_op(self) -> Optional[str]:
+        if self.pos < len(self.tokens) and self.tokens[self.pos][0] == "op":
+            return self.tokens[self.pos][1]
+        return None
+
+    def evaluate(self) -> int:
+        value = self._expression(0)
+        if self.pos != len(self.tokens):
+            raise _ConditionError("trailing tokens")
+        return value
+
+    def _expression(self, depth: int) -> int:
+        """Conditional expression: binary ['?' expression ':' expression]."""
+        if depth > MAX_CONDITION_DEPTH:
+            raise _ConditionError("expression nested too deeply")
+        value = self._binary(1, depth)
+        if self._peek_op() != "?":
+            return value
+        self.pos += 1
+        then = self._operand(depth + 1, skip=not value)
+        if self._next() != ("op", ":"):
+            raise _ConditionError("expected ':'")
+        otherwise = self._operand(depth + 1, skip=bool(value))
+        return then if value else otherwise
+
+    def _operand(self, depth: int, skip: bool, min_precedence: Optional[int] = None) -> int:
+        """Parse an operand, evaluating it only for syntax when skip is set."""
+        self.skipping += skip
+        try:
+            if min_precedence is None:
+                return self._expression(depth)
+            return self._binary(min_precedence, depth)
+        finally:
+            self.skipping -= skip
+
+    def _binary(self, min_precedence: int, depth: int) -> int:
+        left = self._unary(depth)
+        while True:
+            op = self._peek_op()
+            precedence = _BINARY_PRECEDENCE.get(op)
+            if precedence is None or precedence < min_precedence:
+                return left
+            self.pos += 1
+            skip = (op == "&&" and not left) or (op == "||" and bool(left))
+            right = self._operand(depth, skip, precedence + 1)
+            try:
+                left = _binary(op, left, right)
+            except _ConditionError:
+                if not self.skipping:
+                    raise
+                left = 0
+
+    def _unary(self, depth: int) -> int:
+        # Prefix operators are applied iteratively so a long run of them
+        # cannot exhaust the stack
+        prefixes = []
+        while self._peek_op() in ("!", "~", "-", "+"):
+            prefixes.append(self._next()[1])
+        kind, token = self._next()
+        if kind == "num":
+            value = token
+        elif token == "(":
+            value = self._expression(depth + 1)
+            if self._next() != ("op", ")"):
+                raise _ConditionError("expected ')'")
+        else:
+            raise _ConditionError(f"unexpected {token!r}")
+        for op in reversed(prefixes):
+            if op == "!":
+                value = int(not value)
+            elif op == "~":
+                value = ~value
+            elif op == "-":
+                value = _wrap(-value)
+        return value
+
+
+def evaluate(condition: str, macros: Dict[str, str], budget: Optional[List[int]] = None) -> bool:
+    """Evaluate an #if/#elif expression; anything unsupported is false."""
+    condition = _DEFINED_RE.sub(
+        lambda m: "1" if (m.group(1) or m.group(2)) in macros else "0", condition
+    )
+    condition = _IDENT_RE.sub("0", expand(condition, macros, budget))
+    try:
+        return bool(_ConditionParser(condition).evaluate())
+    except _ConditionError:
+        return False
+
+
+def include_dirs() -> List[str]:
+    """Existing directories of the configured include search path."""
+    return [d for d in settings.INCLUDE_PATH.split(os.pathsep) if d and os.path.isdir(d)]
+
+
+def resolve_include(name: str, system: bool, base_dir: Optional[str]) -> Optional[str]:
+    """Find an included file, confined to the including file's directory and the search path."""
+    if os.path.isabs(name):
+        return None
+    roots = include_dirs()
+    if not system and base_dir:
+        roots.insert(0, base_dir)
+    for root in roots:
+        root = os.path.realpath(root)
+        path = os.path.realpath(os.path.join(root, name))
+        if path.startswith(root + os.sep) and os.path.isfile(path):
+            return path
+    return None
+
+
+class IncludeCache:
+    """Process-wide LRU of preprocessed and parsed include files."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # realpath -> list of (incoming macros, result)
+        self._entries: "OrderedDict[str, List[Tuple]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, path: str, macros: Dict[str, str]) -> Optional[Preprocessed]:
+        with self._lock:
+            variants = self._entries.get(path)
+            if variants is None:
+                return None
+            self._entries.move_to_end(path)
+        incoming = sorted(macros.items())
+        for env, result in variants:
+            # deps[0] is the file itself
+            if env == incoming and deps_current(result.deps):
+                self.hits += 1
+                return result
+        return None
+
+    def store(self, path: str, macros: Dict[str, str], result: Preprocessed) -> None:
+        entry = (sorted(macros.items()), result)
+        with self._lock:
+            self.misses += 1
+            variants = self._entries.setdefault(path, [])
+            # One variant per set of incoming macros; a changed file replaces its own
+            variants[:] = [v for v in variants if v[0] != entry[0]] + [entry]
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def deps_current(deps: List[Tuple[str, int, int, str]]) -> bool:
+    """Whether every included file still has the contents recorded in deps.
+
+    A file whose mtime and size are unchanged is assumed unchanged; otherwise
+    its contents are hashed, and if they match, its entry is updated so the
+    next check is a stat again.
+    """
+    try:
+        for i, (path, mtime, size, digest) in enumerate(deps):
+            stat = os.stat(path)
+            if (stat.st_mtime_ns, stat.st_size) == (mtime, size):
+                continue
+            # Touched but possibly unchanged: compare contents
+            with open(path, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() != digest:
+                    return False
+            deps[i] = (path, stat.st_mtime_ns, stat.st_size, digest)
+    except OSError:
+        return False
+    return True
+
+
+include_cache = IncludeCache(settings.INCLUDE_CACHE_SIZE)
+
+
+class _Preprocessor:
+    def __init__(self, parse_fragments: Callable[[str], List[Dict[str, Any]]]):
+        self.parse_fragments = parse_fragments
+        # Expansion budget for one file; included files get their own, so
+        # their memoized results do not depend on the includer
+        self.budget = [MAX_EXPANSION]
+
+    def run(
+        self, code: str, base_dir: Optional[str], macros: Dict[str, str], stack: Tuple[str, ...]
+    ) -> Preprocessed:
+        code = strip_comments(code)
+        result = Preprocessed(code="")
+        self.budget[0] += len(code)
+        # Rebuilt whenever the set of macro names changes
+        pattern = macro_pattern(macros)
+        if "#" not in code:
+            result.code = expand(code, macros, self.budget, pattern)
+            result.defines = dict(macros)
+            return result
+
+        out = []
+        pos = 0
+        # Each entry: (enclosing region active, a branch was taken, this branch active)
+        conditions: List[List[bool]] = []
+        active = True
+        for match in _DIRECTIVE_RE.finditer(code):
+            segment = code[pos:match.start()]
+            out.append(expand(segment, macros, self.budget, pattern) if active else _blank(segment))
+            out.append(_blank(match.group()))
+            pos = match.end()
+
+            directive = match.group(1)
+            rest = match.group(2).replace("\\\n", " ").strip()
+            if directive in ("if", "ifdef", "ifndef"):
+                if directive == "if":
+                    taken = active and evaluate(rest, macros, self.budget)
+                else:
+                    taken = active and ((rest.split() or [""])[0] in macros) == (directive == "ifdef")
+                conditions.append([active, taken, taken])
+                active = taken
+            elif directive == "elif" and conditions:
+                parent, taken_any, _ = conditions[-1]
+                taken = parent and not taken_any and evaluate(rest, macros, self.budget)
+                conditions[-1] = [parent, taken_any or taken, taken]
+                active = taken
+            elif directive == "else" and conditions:
+                parent, taken_any, _ = conditions[-1]
+                conditions[-1] = [parent, True, parent and not taken_any]
+                active = parent and not taken_any
+            elif directive == "endif" and conditions:
+                active = conditions.pop()[0]
+            elif not active:
+                continue
+            elif directive == "define":
+                define = _DEFINE_RE.match(rest)
+                # Function-like macros are recognised but not expanded
+                if define and not define.group(2):
+                    redefined = define.group(1) in macros
+                    macros[define.group(1)] = define.group(3).strip()
+                    if not redefined:
+                        pattern = macro_pattern(macros)
+            elif directive == "undef":
+                if macros.pop(rest.split()[0] if rest else "", None) is not None:
+                    pattern = macro_pattern(macros)
+            elif directive == "include":
+                self._include(rest, base_dir, macros, stack, result)
+                pattern = macro_pattern(macros)
+
+        tail = code[pos:]
+        out.append(expand(tail, macros, self.budget, pattern) if active else _blank(tail))
+        result.code = "".join(out)
+        result.defines = dict(macros)
+        return result
+
+    def _include(
+        self,
+        spec: str,
+        base_dir: Optional[str],
+        macros: Dict[str, str],
+        stack: Tuple[str, ...],
+        result: Preprocessed,
+    ) -> None:
+        match = _INCLUDE_RE.match(spec)
+        if match is None:
+            return
+        system = match.group(1) is not None
+        name = match.group(1) or match.group(2)
+        path = resolve_include(name, system, base_dir)
+        entry = {"name": name, "system": system, "found": path is not None}
+        result.includes.append(entry)
+        if path is None:
+            return
+        if path in stack or len(stack) >= MAX_INCLUDE_DEPTH:
+            entry["skipped"] = "recursive include"
+            return
+
+        if os.path.getsize(path) > settings.MAX_UPLOAD_BYTES:
+            entry["skipped"] = "too large"
+            return
+
+        included = include_cache.lookup(path, macros)
+        if included is None:
+            # Stat before reading, so a change made meanwhile shows as a new mtime
+            stat = os.stat(path)
+            with open(path, "rb") as f:
+                content = f.read()
+            incoming = dict(macros)
+            included = _Preprocessor(self.parse_fragments).run(
+                content.decode("utf-8", errors="replace"),
+                os.path.dirname(path),
+                dict(macros),
+                stack + (path,),
+            )
+            included.fragments = included.fragments + self.parse_fragments(included.code)
+            dep = (path, stat.st_mtime_ns, stat.st_size, hashlib.sha256(content).hexdigest())
+            included.deps = [dep] + included.deps
+            include_cache.store(path, incoming, included)
+
+        macros.clear()
+        macros.update(included.defines)
+        result.fragments.extend(included.fragments)
+        result.includes.extend(dict(i, nested=True) for i in included.includes)
+        result.deps.extend(included.deps)
+
+
+def preprocess(
+    code: str,
+    base_dir: Optional[str],
+    parse_fragments: Callable[[str], List[Dict[str, Any]]],
+) -> Preprocessed:
+    """Preprocess a main source file.
+
+    Local ("...") includes are looked up in base_dir, then the search path;
+    system (<...>) includes only in the search path. parse_fragments turns
+    the preprocessed text of an included file into parse fragments.
+    """
+    return _Preprocessor(parse_fragments).run(code, base_dir, {}, ())
@@ -0,0 +1,148 @@
+"""Compact summaries and paginated sections of a parsed structure.
+
+The full structure of a large program carries every action body, apply body
+and header field. /upload returns summary() instead, and clients fetch the
+sections they display through page(), optionally keeping only some fields of
+each entity with select(). Structures hold model objects, including those
+read back from sqlite by model.load_structure.
+
+A parse ID names one source under one parser version, so a section request
+always produces the same body. Its ETag is a hash of the request path and
+query and is computed without loading the structure.
+"""
+
+import hashlib
+from dataclasses import fields as dataclass_fields
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from model import Action, ControlBlock, Layout, ParserBlock, Table
+
+# Section name -> structure key; blocks are the keys without a leading "_"
+SECTIONS = {
+    "blocks": None,
+    "tables": "_tables",
+    "headers": "_headers",
+    "layouts": "_layouts",
+    "enums": "_enums",
+    "consts": "_consts",
+    "externs": "_externs",
+}
+
+
+def _names(*classes) -> Tuple[str, ...]:
+    found: Dict[str, None] = {}
+    for cls in classes:
+        found.update(dict.fromkeys(f.name for f in dataclass_fields(cls)))
+    return tuple(found)
+
+
+# Fields that fields= may select, for sections whose entities are objects
+SELECTABLE = {
+    "blocks": _names(ControlBlock, ParserBlock),
+    "tables": _names(Table),
+    "layouts": _names(Layout),
+    "actions": _names(Action),
+}
+
+
+class InvalidSelection(ValueError):
+    """Raised when fields= names a field the section does not have."""
+
+
+def entities(structure: Dict[str, Any], section: str) -> Dict[str, Any]:
+    """The entities of one section by name, in declaration order."""
+    if section == "blocks":
+        return {name: block for name, block in structure.items() if not name.startswith("_")}
+    found = structure.get(SECTIONS[section]) or {}
+    if section == "consts":
+        return {name: value for name, value in found}
+    if section == "externs":
+        return {e.name: e for e in found}
+    return found
+
+
+def block_actions(block: Any) -> Dict[str, Any]:
+    return {a.name: a for a in block.actions}
+
+
+def summary(structure: Dict[str, Any]) -> Dict[str, Any]:
+    """Block names, types and table lists, plus the size of every section."""
+    blocks = []
+    for name, block in entities(structure, "blocks").items():
+        blocks.append({
+            "name": name,
+            "type": block.type,
+            "tables": block.tables,
+            "actions": len(block.actions),
+            "states": len(block.states) if isinstance(block, ParserBlock) else 0,
+        })
+    counts = {section: len(entities(structure, section)) for section in SECTIONS}
+    counts["includes"] = len(structure.get("_includes") or [])
+    return {"blocks": blocks, "counts": counts}
+
+
+def parse_fields(section: str, fields: Optional[str]) -> Optional[List[str]]:
+    """Split a fields= value and check it against the section; None keeps every field."""
+    if fields is None:
+        return None
+    allowed = SELECTABLE.get(section)
+    if allowed is None:
+        raise InvalidSelection(f"fields= is not supported for {section}.")
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in allowed]
+    if unknown:
+        raise InvalidSelection(
+            f"Unknown {section} fields: {', '.join(unknown)}. Choose from: {', '.join(allowed)}."
+        )
+    return names
+
+
+def select(entity: Any, fields: Optional[List[str]]) -> Any:
+    """Keep only fields of an entity; fields it lacks (such as states on a control) are left out."""
+    if fields is None:
+        return entity
+    missing = object()
+    selected = {}
+    for name in fields:
+        value = getattr(entity, name, missing)
+        if value is not missing:
+            selected[name] = value
+    return selected
+
+
+def page(
+    items: Dict[str, Any],
+    offset: int,
+    limit: int,
+    fields: Optional[List[str]] = None,
+    names: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """One page of a name -> entity map, optionally restricted to some names."""
+    keys = list(items) if names is None else [n for n in names if n in items]
+    window = keys[offset:offset + limit]
+    end = offset + len(window)
+    return {
+        "total": len(keys),
+        "offset": offset,
+        "limit": limit,
+        "next_offset": end if end < len(keys) else None,
+        "items": {name: select(items[name], fields) for name in window},
+    }
+
+
+def etag(path: str, query: str) -> str:
+    """Strong ETag of a structure request; query parameters are order-insensitive."""
+    canonical = f"{path}?{urlencode(sorted(parse_qsl(query, keep_blank_values=True)))}"
+    return '"' + hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest() + '"'
+
+
+def matches(if_none_match: Optional[str], tag: str) -> bool:
+    """Whether an If-None-Match header matches tag, using weak comparison."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == tag:
+            return True
+    return False
@@ -0,0 +1,35 @@
+"""Run the API under uvicorn with settings.API_WORKERS worker processes.
+
+    python serve.py
+
+Each API worker is a separate process with its own parse/export worker pool.
+They share parsed structures through the sqlite parse cache and generated
+workbooks through the export directory, so both must be on storage every
+worker can reach (the default paths under UPLOAD_DIR are).
+"""
+
+import logging
+
+import uvicorn
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    if settings.API_WORKERS > 1 and not settings.PARSE_CACHE_DB:
+        logger.warning(
+            "P4LENS_PARSE_CACHE_DB is disabled: each of the "
+            f"{settings.API_WORKERS} API workers will keep and parse its own structures"
+        )
+    if settings.API_WORKERS > 1:
+        logger.warning(
+            f"/jobs and /reparse are disabled with {settings.API_WORKERS} API workers; "
+            "set P4LENS_API_WORKERS=1 to use them"
+        )
+    uvicorn.run("main:app", host=settings.HOST, port=settings.PORT, workers=settings.API_WORKERS)
+
+
+if __name__ == "__main__":
+    main()
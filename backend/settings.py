@@ -0,0 +1,82 @@
+"""Backend configuration, read once from environment variables."""
+
+import os
+
+UPLOAD_DIR = os.environ.get("P4LENS_UPLOAD_DIR", "uploads")
+
+# Parse cache: in-memory LRU bound and optional sqlite tier ("" disables it)
+PARSE_CACHE_SIZE = int(os.environ.get("P4LENS_PARSE_CACHE_SIZE", "128"))
+PARSE_CACHE_DB = os.environ.get(
+    "P4LENS_PARSE_CACHE_DB", os.path.join(UPLOAD_DIR, "parse_cache.sqlite3")
+)
+PARSE_CACHE_DB_SIZE = int(os.environ.get("P4LENS_PARSE_CACHE_DB_SIZE", "2048"))
+
+# API server (serve.py): address and number of uvicorn worker processes. With
+# several, parsed structures are shared through PARSE_CACHE_DB and exports
+# through EXPORT_DIR, and concurrent parses of one source run once, polling
+# the cache every COALESCE_POLL seconds (doubling up to 1s) while another
+# process parses
+HOST = os.environ.get("P4LENS_HOST", "0.0.0.0")
+PORT = int(os.environ.get("P4LENS_PORT", "8000"))
+API_WORKERS = int(os.environ.get("P4LENS_API_WORKERS", "1"))
+COALESCE_POLL = float(os.environ.get("P4LENS_COALESCE_POLL", "0.05"))
+
+# Worker pool for parse and export jobs, per API worker; by default the CPUs
+# are split between API workers. With WARMUP on, startup spawns every worker
+# and runs a sample parse and export in each and in the API process
+WORKER_PROCESSES = int(os.environ.get(
+    "P4LENS_WORKER_PROCESSES", str(max(1, (os.cpu_count() or 2) // API_WORKERS))
+))
+WORKER_MAX_PENDING = int(
+    os.environ.get("P4LENS_WORKER_MAX_PENDING", str(WORKER_PROCESSES * 4))
+)
+JOB_TIMEOUT = float(os.environ.get("P4LENS_JOB_TIMEOUT", "30"))
+RETRY_AFTER = int(os.environ.get("P4LENS_RETRY_AFTER", "5"))
+WARMUP = os.environ.get("P4LENS_WARMUP", "1") not in ("0", "false", "no")
+
+# Generated Excel exports, content-addressed by structure hash
+EXPORT_DIR = os.environ.get("P4LENS_EXPORT_DIR", os.path.join(UPLOAD_DIR, "exports"))
+EXPORT_CACHE_MAX_BYTES = int(
+    os.environ.get("P4LENS_EXPORT_CACHE_MAX_BYTES", str(256 * 1024 * 1024))
+)
+EXPORT_CACHE_TTL = float(os.environ.get("P4LENS_EXPORT_CACHE_TTL", "3600"))
+
+# Batch uploads: limits across all files and archive members in one request
+BATCH_MAX_FILES = int(os.environ.get("P4LENS_BATCH_MAX_FILES", "500"))
+BATCH_MAX_BYTES = int(os.environ.get("P4LENS_BATCH_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# Incremental re-parse: programs kept by parse ID, and the largest edited
+# region re-parsed inline before falling back to a full parse in the pool
+PROGRAM_STORE_SIZE = int(os.environ.get("P4LENS_PROGRAM_STORE_SIZE", "32"))
+INCREMENTAL_INLINE_BYTES = int(os.environ.get("P4LENS_INCREMENTAL_INLINE_BYTES", str(64 * 1024)))
+
+# Single-file uploads are streamed to disk in chunks and capped at this size
+MAX_UPLOAD_BYTES = int(os.environ.get("P4LENS_MAX_UPLOAD_BYTES", str(64 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("P4LENS_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Cross-reference indexes kept by parse ID for the /xref query endpoints
+XREF_STORE_SIZE = int(os.environ.get("P4LENS_XREF_STORE_SIZE", "64"))
+
+# Entity fingerprints kept by parse ID for /diff
+DIFF_STORE_SIZE = int(os.environ.get("P4LENS_DIFF_STORE_SIZE", "64"))
+
+# Asynchronous jobs (/jobs/...): finished jobs and their results are kept for
+# JOB_TTL seconds; at most JOB_MAX jobs are held, running or finished
+JOB_TTL = float(os.environ.get("P4LENS_JOB_TTL", "900"))
+JOB_MAX = int(os.environ.get("P4LENS_JOB_MAX", "256"))
+JOB_HEARTBEAT = float(os.environ.get("P4LENS_JOB_HEARTBEAT", "15"))
+
+# Preprocessor: directories searched for #include files (os.pathsep-separated;
+# quoted includes look next to the including file first) and the number of
+# included files kept preprocessed and parsed per process
+INCLUDE_PATH = os.environ.get(
+    "P4LENS_INCLUDE_PATH",
+    os.pathsep.join(["/usr/local/share/p4c/p4include", "/usr/share/p4c/p4include"]),
+)
+INCLUDE_CACHE_SIZE = int(os.environ.get("P4LENS_INCLUDE_CACHE_SIZE", "64"))
+
+# Structure sections (/structure/...): default and largest page size, and the
+# max-age sent with their ETags
+STRUCTURE_PAGE_SIZE = int(os.environ.get("P4LENS_STRUCTURE_PAGE_SIZE", "100"))
+STRUCTURE_MAX_PAGE = int(os.environ.get("P4LENS_STRUCTURE_MAX_PAGE", "1000"))
+STRUCTURE_MAX_AGE = int(os.environ.get("P4LENS_STRUCTURE_MAX_AGE", "3600"))
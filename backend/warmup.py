@@ -0,0 +1,94 @@
+"""Per-process warm start.
+
+warm_up() imports the parse and export modules and runs a small program
+through both pipelines, so the first real request in a new process pays for
+neither module imports nor first-use setup. It runs once per process: in
+each pool worker as it starts, and in the API process during startup.
+"""
+
+import io
+import time
+from typing import Dict, Optional
+
+# Touches every part of the pipeline: the preprocessor, globals, headers and
+# layouts, parser graphs, actions, tables and the apply-flow parser
+SAMPLE_PROGRAM = """
+#define TABLE_SIZE 64
+typedef bit<48> mac_t;
+const bit<16> TYPE_IPV4 = 0x800;
+enum Colour { RED, GREEN }
+header ethernet_t { mac_t dst; mac_t src; bit<16> etherType; }
+header ipv4_t { bit<8> ttl; bit<8> protocol; bit<32> dstAddr; }
+struct headers { ethernet_t ethernet; ipv4_t ipv4; }
+Counter<bit<32>>(TABLE_SIZE) hits;
+
+parser WarmParser(packet_in packet, out headers hdr) {
+    state start {
+        packet.extract(hdr.ethernet);
+        transition select(hdr.ethernet.etherType) {
+            TYPE_IPV4: parse_ipv4;
+            default: accept;
+        }
+    }
+    state parse_ipv4 {
+        packet.extract(hdr.ipv4);
+        transition accept;
+    }
+}
+
+control WarmIngress(inout headers hdr) {
+    action drop() { mark_to_drop(); }
+    action forward(mac_t dst, bit<9> port) {
+        hdr.ethernet.dst = dst;
+        hdr.ipv4.ttl = hdr.ipv4.ttl - 1;
+    }
+    table route {
+        key = { hdr.ipv4.dstAddr: lpm; }
+        actions = { forward; drop; }
+        size = TABLE_SIZE;
+        default_action = drop();
+    }
+    apply {
+        if (hdr.ipv4.isValid()) {
+            switch (route.apply().action_run) {
+                forward: { }
+                default: { drop(); }
+            }
+        } else {
+            drop();
+        }
+    }
+}
+
+control WarmDeparser(packet_out packet, in headers hdr) {
+    apply { packet.emit(hdr.ethernet); }
+}
+"""
+
+_report: Optional[Dict[str, float]] = None
+
+
+def warm_up() -> Dict[str, float]:
+    """Warm this process up once; return the seconds each step took."""
+    global _report
+    if _report is not None:
+        return _report
+
+    start = time.perf_counter()
+    import export_utils
+    import parser_utils
+    from model import dumps, loads
+    imported = time.perf_counter()
+
+    structure = parser_utils.parse_p4_source(SAMPLE_PROGRAM, "warmup.p4")
+    parsed = time.perf_counter()
+
+    export_utils.write_excel_export(loads(dumps(structure)), io.BytesIO())
+    exported = time.perf_counter()
+
+    _report = {
+        "import": imported - start,
+        "parse": parsed - imported,
+        "export": exported - parsed,
+    }
+    return _report
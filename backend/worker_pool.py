@@ -0,0 +1,184 @@
+"""Process pool for CPU-bound parse and export jobs.
+
+Jobs run outside the asyncio event loop so a large parse or workbook never
+blocks other requests. The number of queued plus running jobs is bounded;
+callers get PoolSaturated instead of an ever-growing backlog. Each job has a
+deadline enforced inside the worker (SIGALRM, which also interrupts long
+regex matches) and again by the parent, which recycles the pool if a worker
+stops responding altogether.
+
+Workers can also report progress while a job runs: report_progress() puts
+events on a queue shared with every worker, and a thread in the parent
+hands them to the pool's on_progress callback.
+
+A warm-up function given to the pool runs in every worker as it starts, and
+prestart() spawns all workers up front, so no request waits for a worker
+process to start and import the parser.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturated(Exception):
+    """Raised when the pool already holds its maximum number of jobs."""
+
+
+class JobTimeout(Exception):
+    """Raised when a job runs past its deadline."""
+
+
+# Progress queue of this worker process, set by the pool's initializer
+_progress_queue = None
+# What the pool's warm-up function returned in this worker
+_warm_result = None
+
+
+def _init_worker(progress_queue, warm: Optional[Callable[[], Any]]) -> None:
+    global _progress_queue, _warm_result
+    _progress_queue = progress_queue
+    if warm is not None:
+        try:
+            _warm_result = warm()
+        except Exception as e:
+            logger.error(f"Worker warm-up failed: {e}")
+
+
+def _worker_warm_result() -> Any:
+    return _warm_result
+
+
+def report_progress(job_id: str, event: Dict[str, Any]) -> None:
+    """Send a progress event for a job; a no-op outside a pool worker."""
+    if _progress_queue is not None:
+        _progress_queue.put((job_id, event))
+
+
+def _raise_timeout(signum, frame):
+    raise JobTimeout("Job exceeded its time limit")
+
+
+def _call_with_deadline(timeout: Optional[float], fn: Callable, args: tuple) -> Any:
+    """Run fn(*args) in a worker, aborting it after timeout seconds."""
+    if not timeout or not hasattr(signal, "setitimer"):
+        return fn(*args)
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class WorkerPool:
+    """Bounded process pool with per-job timeouts."""
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_pending: int,
+        timeout: Optional[float] = None,
+        grace: float = 2.0,
+        on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+        warm: Optional[Callable[[], Any]] = None,
+    ):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.grace = grace
+        self.on_progress = on_progress
+        self.warm = warm
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._progress = None
+        self._relay: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._executor is None:
+            context = multiprocessing.get_context("spawn")
+            if self.on_progress is not None and self._progress is None:
+                self._progress = context.Queue()
+                self._relay = threading.Thread(
+                    target=self._relay_progress, name="progress-relay", daemon=True
+                )
+                self._relay.start()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._progress, self.warm),
+            )
+
+    async def prestart(self) -> List[Any]:
+        """Spawn every worker now and return each one's warm-up result.
+
+        Each submitted task finds no idle worker, so the executor starts a
+        new process for it; a task runs only after its worker's initializer.
+        """
+        count = min(self.max_workers, self.max_pending)
+        return await asyncio.gather(*(self.run(_worker_warm_result) for _ in range(count)))
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._progress is not None:
+            self._progress.put(None)
+            self._relay.join()
+            self._progress.close()
+            self._progress = self._relay = None
+
+    def _relay_progress(self) -> None:
+        """Hand events from the workers' progress queue to on_progress."""
+        while True:
+            item = self._progress.get()
+            if item is None:
+                return
+            try:
+                self.on_progress(*item)
+            except Exception as e:
+                logger.error(f"Progress callback failed: {e}")
+
+    def _recycle(self) -> None:
+        """Replace the executor, terminating any stuck worker processes."""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            processes = list(getattr(executor, "_processes", {}).values())
+            executor.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+        self.start()
+
+    async def run(self, fn: Callable, *args: Any, timeout: Optional[float] = None) -> Any:
+        """Run fn(*args) in a worker process and return its result."""
+        if self.pending >= self.max_pending:
+            raise PoolSaturated(f"{self.pending} jobs already queued or running")
+        self.start()
+        timeout = timeout if timeout is not None else self.timeout
+
+        self.pending += 1
+        try:
+            future = self._executor.submit(_call_with_deadline, timeout, fn, args)
+            wait = timeout + self.grace if timeout else None
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), wait)
+            except asyncio.TimeoutError:
+                logger.error(f"{fn.__name__} did not respond within {wait}s, recycling pool")
+                self._recycle()
+                raise JobTimeout("Job exceeded its time limit")
+            except BrokenProcessPool:
+                logger.error(f"Worker died while running {fn.__name__}, recycling pool")
+                self._recycle()
+                raise
+        finally:
+            self.pending -= 1
@@ -0,0 +1,106 @@
+"""Cross-reference indexes over a parsed P4 structure.
+
+Each relation maps a name to the entities that refer to it:
+
+    field-tables    match field  -> tables keyed on it (with match kind)
+    field-actions   field        -> actions that assign it
+    action-tables   action       -> tables listing it
+    table-controls  table        -> controls applying it
+    header-states   header       -> parser states extracting it
+
+Lookups of a single key are dict hits. Keys are also kept sorted so prefix
+queries ("hdr.ipv4" for every IPv4 field) bisect to the first match instead
+of scanning.
+"""
+
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+from lru import LRU
+from model import ParserBlock
+
+RELATIONS = ("field-tables", "field-actions", "action-tables", "table-controls", "header-states")
+
+
+class Relation:
+    """One inverted index: key -> list of referring entries."""
+
+    def __init__(self, entries: Dict[str, List[Any]]):
+        self.entries = entries
+        self.keys = sorted(entries)
+
+    def get(self, key: str) -> Optional[List[Any]]:
+        return self.entries.get(key)
+
+    def prefix(self, prefix: str, limit: int) -> Dict[str, List[Any]]:
+        """Return up to limit entries whose key starts with prefix, in key order."""
+        matches = {}
+        for i in range(bisect_left(self.keys, prefix), len(self.keys)):
+            key = self.keys[i]
+            if not key.startswith(prefix) or len(matches) >= limit:
+                break
+            matches[key] = self.entries[key]
+        return matches
+
+
+class XrefIndex:
+    """All cross-reference relations of one parsed program."""
+
+    def __init__(self, relations: Dict[str, Relation]):
+        self.relations = relations
+
+    def summary(self) -> Dict[str, int]:
+        return {name: len(relation.keys) for name, relation in self.relations.items()}
+
+
+def _match_field(key: str) -> Tuple[str, str]:
+    """Split a table key such as "hdr.ipv4.dstAddr: lpm" into field and match kind."""
+    field, _, kind = key.partition(":")
+    return field.strip(), kind.strip()
+
+
+def build_index(structure: Dict[str, Any]) -> XrefIndex:
+    """Build every relation in one pass over a parsed structure."""
+    field_tables: Dict[str, List[Any]] = {}
+    field_actions: Dict[str, List[Any]] = {}
+    action_tables: Dict[str, List[Any]] = {}
+    table_controls: Dict[str, List[Any]] = {}
+    header_states: Dict[str, List[Any]] = {}
+
+    for table, info in (structure.get("_tables") or {}).items():
+        for key in info.keys:
+            field, kind = _match_field(key)
+            field_tables.setdefault(field, []).append({"table": table, "match_kind": kind})
+        for action in info.actions:
+            action_tables.setdefault(action, []).append(table)
+
+    for name, block in structure.items():
+        if name.startswith("_"):
+            continue
+        for table in block.tables:
+            controls = table_controls.setdefault(table, [])
+            if name not in controls:
+                controls.append(name)
+        for action in block.actions:
+            for field in action.writes:
+                field_actions.setdefault(field, []).append({"control": name, "action": action.name})
+        if not isinstance(block, ParserBlock) or block.graph is None:
+            continue
+        for state, info in block.graph.states.items():
+            for header in info.extracts:
+                # Two-argument extracts also pass a varbit length
+                header_states.setdefault(header.partition(",")[0].strip(), []).append(
+                    {"parser": name, "state": state}
+                )
+
+    return XrefIndex({
+        "field-tables": Relation(field_tables),
+        "field-actions": Relation(field_actions),
+        "action-tables": Relation(action_tables),
+        "table-controls": Relation(table_controls),
+        "header-states": Relation(header_states),
+    })
+
+
+class IndexStore(LRU[XrefIndex]):
+    """LRU of cross-reference indexes by parse ID."""
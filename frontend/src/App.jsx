@@ -6,7 +6,7 @@ import { Button } from "@/components/ui/button";
 
 export default function App() {
   const [file, setFile] = useState(null);
-  const [structure, setStructure] = useState(null);
+  const [program, setProgram] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
 
@@ -22,8 +22,8 @@ export default function App() {
       const form = new FormData();
       form.append("file", file);
       const res = await axios.post("/api/upload", form);
-      console.log("Parsed structure:", res.data.structure);
-      setStructure(res.data.structure);
+      console.log("Parsed program:", res.data.summary);
+      setProgram(res.data);
     } catch (err) {
       console.error("Upload error:", err);
       const errorMsg = err.response?.data?.detail || err.message || "Failed to parse P4 file. Please check the file format.";
@@ -35,13 +35,13 @@ export default function App() {
 
   // Reset
   const reset = () => {
-    setStructure(null);
+    setProgram(null);
     setFile(null);
     setError(null);
   };
 
   // Loading / Upload View
-  if (!structure || Object.keys(structure).length === 0) {
+  if (!program || program.summary.blocks.length === 0) {
     return (
       <div className="min-h-screen flex flex-col items-center justify-center bg-gradient-to-br from-slate-50 via-blue-50 to-indigo-100 text-center p-6">
         <div className="mb-10">
@@ -143,7 +143,7 @@ export default function App() {
   // Visualization View
   return (
     <div className="w-full h-screen relative overflow-hidden">
-      <PipelineFlow structure={structure} />
+      <PipelineFlow parseId={program.parse_id} summary={program.summary} filename={program.filename} />
       <div className="absolute top-24 left-6 z-10">
         <Button
           onClick={reset}
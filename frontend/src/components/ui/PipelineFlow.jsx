@@ -13,6 +13,7 @@ import {
   FiLayers
 } from "react-icons/fi";
 import { Card, CardHeader, CardTitle, CardContent } from "@/components/ui/card";
+import { fetchBlock, fetchSection } from "@/lib/structure";
 
 // Pipeline Stage Card Component
 function PipelineStageCard({ stage, index, isActive, onClick, totalStages }) {
@@ -127,48 +128,52 @@ function PipelineStageCard({ stage, index, isActive, onClick, totalStages }) {
   );
 }
 
-export default function PipelineFlow({ structure }) {
+export default function PipelineFlow({ parseId, summary, filename }) {
   const [selected, setSelected] = useState(null);
   const [viewMode, setViewMode] = useState("pipeline");
-
-  const globalTables = structure?._tables || {};
-  const globalHeaders = structure?._headers || {};
-  const globalExterns = structure?._externs || {};
+  // Filled in as stages are opened; the upload response only has the summary
+  const [globalTables, setGlobalTables] = useState({});
+  const [globalHeaders, setGlobalHeaders] = useState({});
 
   // Organize pipeline stages
   const pipelineStages = useMemo(() => {
-    if (!structure) return [];
-
-    const nodeKeys = Object.keys(structure).filter((k) => !k.startsWith("_"));
-    const sortedKeys = nodeKeys.sort((a, b) => {
-      const order = { parser: 0, control: 1, deparser: 2 };
-      const typeA = structure[a].type;
-      const typeB = structure[b].type;
-      return (order[typeA] || 99) - (order[typeB] || 99);
-    });
-
-    return sortedKeys.map((name, index) => {
-      const info = structure[name];
-      const tables = info.tables || [];
-      const actions = info.actions || [];
-      const states = info.states || [];
-
-      return {
-        id: name,
-        name,
-        info,
-          type: info.type,
-        index,
-        stats: {
-          tables: tables.length,
-          actions: Array.isArray(actions) ? actions.length : 0,
-          states: Array.isArray(states) ? states.length : 0,
-        },
-      };
-    });
-  }, [structure]);
-
-  if (!structure || pipelineStages.length === 0) {
+    if (!summary) return [];
+
+    const order = { parser: 0, control: 1, deparser: 2 };
+    const sortedBlocks = [...summary.blocks].sort(
+      (a, b) => (order[a.type] || 99) - (order[b.type] || 99)
+    );
+
+    return sortedBlocks.map((block, index) => ({
+      id: block.name,
+      name: block.name,
+      type: block.type,
+      tables: block.tables,
+      index,
+      stats: {
+        tables: block.tables.length,
+        actions: block.actions,
+        states: block.states,
+      },
+    }));
+  }, [summary]);
+
+  // Headers are shared by every stage, so they are fetched once
+  useEffect(() => {
+    if (!selected || !summary.counts.headers || Object.keys(globalHeaders).length > 0) return;
+    fetchSection(parseId, "headers").then(setGlobalHeaders).catch(console.error);
+  }, [selected, parseId, summary, globalHeaders]);
+
+  // Tables of the selected stage that have not been fetched yet
+  useEffect(() => {
+    const missing = (selected?.tables || []).filter((name) => !(name in globalTables));
+    if (missing.length === 0) return;
+    fetchSection(parseId, "tables", { names: missing.join(",") })
+      .then((tables) => setGlobalTables((known) => ({ ...known, ...tables })))
+      .catch(console.error);
+  }, [selected, parseId, globalTables]);
+
+  if (!summary || pipelineStages.length === 0) {
     return (
       <div className="flex items-center justify-center w-screen h-screen bg-gradient-to-br from-slate-50 to-blue-50 text-gray-400">
         Upload a P4 file to visualize.
@@ -213,7 +218,7 @@ export default function PipelineFlow({ structure }) {
             </div>
           </div>
           <div className="text-sm text-gray-600 font-medium">
-            {structure._filename || "P4 Program"}
+            {filename || "P4 Program"}
           </div>
         </div>
       </div>
@@ -243,12 +248,7 @@ export default function PipelineFlow({ structure }) {
         )}
 
         {viewMode === "overview" && (
-          <OverviewView
-            structure={structure}
-            pipelineStages={pipelineStages}
-            globalTables={globalTables}
-            globalHeaders={globalHeaders}
-          />
+          <OverviewView pipelineStages={pipelineStages} counts={summary.counts} />
         )}
       </div>
 
@@ -256,10 +256,11 @@ export default function PipelineFlow({ structure }) {
       <AnimatePresence>
         {selected && viewMode === "pipeline" && (
           <DetailedPanel
+            key={selected.id}
+            parseId={parseId}
             stage={selected}
             globalTables={globalTables}
             globalHeaders={globalHeaders}
-            globalExterns={globalExterns}
             onClose={() => setSelected(null)}
           />
         )}
@@ -269,10 +270,15 @@ export default function PipelineFlow({ structure }) {
 }
 
 // Comprehensive Detailed Panel Component
-function DetailedPanel({ stage, globalTables, globalHeaders, globalExterns, onClose }) {
+function DetailedPanel({ parseId, stage, globalTables, globalHeaders, onClose }) {
   const [activeTab, setActiveTab] = useState("deep-dive");
+  const [block, setBlock] = useState(null);
+
+  useEffect(() => {
+    fetchBlock(parseId, stage.name).then(setBlock).catch(console.error);
+  }, [parseId, stage.name]);
 
-  const info = stage.info;
+  const info = block || { type: stage.type };
   const applyLogic = info.apply_logic || {};
   const tables = info.tables || [];
   const actions = info.actions || [];
@@ -647,7 +653,7 @@ function FlowTab({ applyLogic, tables, globalTables }) {
 }
 
 // Overview View
-function OverviewView({ structure, pipelineStages, globalTables, globalHeaders }) {
+function OverviewView({ pipelineStages, counts }) {
   return (
     <div className="max-w-6xl mx-auto px-6 py-8">
       <div className="text-center mb-8">
@@ -670,7 +676,7 @@ function OverviewView({ structure, pipelineStages, globalTables, globalHeaders }
           transition={{ delay: 0.1 }}
           className="bg-white rounded-xl p-6 shadow-lg border border-gray-200"
         >
-          <div className="text-3xl font-bold text-emerald-600">{Object.keys(globalTables).length}</div>
+          <div className="text-3xl font-bold text-emerald-600">{counts.tables}</div>
           <div className="text-sm text-gray-600 mt-2">Match-Action Tables</div>
         </motion.div>
         <motion.div
@@ -679,7 +685,7 @@ function OverviewView({ structure, pipelineStages, globalTables, globalHeaders }
           transition={{ delay: 0.2 }}
           className="bg-white rounded-xl p-6 shadow-lg border border-gray-200"
         >
-          <div className="text-3xl font-bold text-purple-600">{Object.keys(globalHeaders).length}</div>
+          <div className="text-3xl font-bold text-purple-600">{counts.headers}</div>
           <div className="text-sm text-gray-600 mt-2">Header Types</div>
         </motion.div>
         <motion.div
@@ -0,0 +1,22 @@
+import axios from "axios";
+
+// Sections of a parse, fetched on demand. Responses carry ETags, so the
+// browser revalidates repeat requests instead of downloading them again.
+const base = (parseId) => `/api/structure/${encodeURIComponent(parseId)}`;
+
+export async function fetchBlock(parseId, name) {
+  const res = await axios.get(`${base(parseId)}/blocks/${encodeURIComponent(name)}`);
+  return res.data.block;
+}
+
+// Every page of a section, merged into one name -> entity object
+export async function fetchSection(parseId, section, params = {}) {
+  const items = {};
+  let offset = 0;
+  while (offset !== null) {
+    const res = await axios.get(`${base(parseId)}/${section}`, { params: { ...params, offset } });
+    Object.assign(items, res.data.items);
+    offset = res.data.next_offset;
+  }
+  return items;
+}